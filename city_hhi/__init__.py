@@ -0,0 +1,16 @@
+"""
+Urban concentration (HHI) of city populations per country, US state and Chinese province.
+
+Importing the package has no side effects; run it with `python -m city_hhi`.
+"""
+from .cache import CacheMissError, ResponseCache
+from .fetcher import fetch, fetch_all, get_session, make_session
+from .hhi import calculate_hhi, calculate_hhi_by_group, calculate_hhi_by_region
+from .metrics import METRICS, Metrics
+from .pipeline import (calculate_hhi_from_local, display_and_save_data, get_all_cities, get_top_cities, run,
+                       scrape_and_calculate_hhi)
+from .regions import COUNTRY, PROVINCE, SOURCES, STATE, RegionSource, register_source
+from .sensitivity import hhi_cube, run_sensitivity
+from .store import CityStore, update_store
+from .streaming import run_streaming, stream_hhi_top_n
+from .timeseries import read_timeseries, run_timeseries
@@ -0,0 +1,93 @@
+"""
+Command line entry point.
+
+    python -m city_hhi                        # All levels from the curated CSVs
+    python -m city_hhi country --online       # Scrape the countries from citypopulation.de
+    python -m city_hhi all --online --cache-only
+    python -m city_hhi --incremental          # Only recompute regions whose inputs changed
+    python -m city_hhi state --timeseries --exponents 2 3.1416   # Every census year, Parquet output
+    python -m city_hhi --store city_hhi.sqlite  # Also load the results into a queryable SQLite store
+    python -m city_hhi state --stream --input us_cities.csv   # Chunked read of a very large CSV
+    python -m city_hhi query city_hhi.sqlite top province Anhui -k 5
+    python -m city_hhi sensitivity state --exponents 1.1:4:0.1 --top-n 2:20 all   # Rank stability over a grid
+    python -m city_hhi all --online --metrics run.json --profile sample   # Stage timers and a profile
+"""
+import argparse
+import contextlib
+import sys
+
+from .cache import CACHE_DIR
+from .incremental import run_incremental
+from .pipeline import run
+from .regions import SOURCES
+from .streaming import CHUNK_ROWS, run_streaming
+from . import metrics, sensitivity, store
+from .timeseries import run_timeseries
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['query']:
+        store.main(argv[1:])
+        return
+    if argv[:1] == ['sensitivity']:
+        sensitivity.main(argv[1:])
+        return
+    parser = argparse.ArgumentParser(prog='python -m city_hhi', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('levels', nargs='*', metavar='level',
+                        help=f"Hierarchy levels to compute: all, {', '.join(SOURCES)} (default: all)")
+    parser.add_argument('--online', action='store_true', help='Scrape citypopulation.de instead of the curated CSVs')
+    parser.add_argument('--cache-only', action='store_true', help='Online mode served only from the page cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help=f'Directory of the page cache (default: {CACHE_DIR})')
+    parser.add_argument('--output-dir', default='.', help='Directory the CSV files are written to')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only recompute regions whose inputs changed since the last incremental run')
+    parser.add_argument('--timeseries', action='store_true',
+                        help='Compute every year column of the online tables and write Parquet datasets')
+    parser.add_argument('--exponents', type=float, nargs='+',
+                        help='Exponents of the time series (default: the exponent of each level)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read the local CSV in chunks, keeping only the top-N cities of every region in memory')
+    parser.add_argument('--input', help='CSV read by --stream instead of the curated CSV (one level only)')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS, help=f'Rows per chunk (default: {CHUNK_ROWS})')
+    parser.add_argument('--store', help='SQLite file the results are loaded into, see python -m city_hhi query')
+    parser.add_argument('--metrics', help='Write stage timers and counters to this file (.prom: Prometheus text, '
+                                          'otherwise JSON)')
+    parser.add_argument('--profile', choices=['cprofile', 'sample'], help='Profile the run')
+    parser.add_argument('--profile-output', help='Profile file (default: city_hhi.prof or city_hhi.stacks)')
+    args = parser.parse_args(argv)
+    unknown = set(args.levels) - {'all', *SOURCES}
+    if unknown:
+        parser.error(f"unknown level(s): {', '.join(sorted(unknown))}")
+
+    levels = list(SOURCES) if not args.levels or 'all' in args.levels else args.levels
+    sources = [SOURCES[level] for level in dict.fromkeys(levels)]
+    if args.stream and (args.online or args.timeseries or args.incremental):
+        parser.error('--stream only applies to the local mode')
+    if args.exponents and not args.timeseries:
+        parser.error('--exponents only applies to --timeseries')
+    if args.input and (not args.stream or len(sources) != 1):
+        parser.error('--input needs --stream and a single level')
+    profile_output = args.profile_output or ('city_hhi.prof' if args.profile == 'cprofile' else 'city_hhi.stacks')
+    with metrics.profile(args.profile, profile_output) if args.profile else contextlib.nullcontext():
+        if args.stream:
+            run_streaming(sources, args.input, args.chunksize, output_dir=args.output_dir)
+        elif args.timeseries:
+            run_timeseries(sources, exponents=args.exponents, cache_only=args.cache_only, cache_dir=args.cache_dir,
+                           output_dir=args.output_dir)
+        else:
+            refresh = run_incremental if args.incremental else run
+            refresh(sources, use_local=not args.online, cache_only=args.cache_only, cache_dir=args.cache_dir,
+                    output_dir=args.output_dir)
+        if args.store:
+            store.update_store(args.store, sources, args.output_dir, use_local=not args.online,
+                               timeseries=args.timeseries)
+    if args.metrics:
+        print(metrics.METRICS.summary())
+        metrics.METRICS.write(args.metrics)
+        print(f"Metrics saved to '{args.metrics}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Offline throughput benchmark of the fetch engine.
+
+Serves saved citypopulation.de pages from a local stub HTTP server and downloads them
+once sequentially with bare requests.get (the old code path) and once through fetcher.fetch_all.
+
+    python -m city_hhi.bench_fetch --pages saved_pages/ --latency 200
+
+Every file below `--pages` is served at its relative path, e.g. saved_pages/en/china/cities.html
+is served as /en/china/cities.html. Without `--pages`, synthetic pages with a 'tlc' table are served.
+`--latency` adds a per-request delay in milliseconds to mimic the round trip to the real site.
+"""
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from .fetcher import fetch_all, make_session
+
+
+# Function to generate a synthetic page resembling a citypopulation.de country page
+def make_synthetic_page(n_rows=200):
+    """Returns the HTML bytes of a page holding a 'tlc' table with `n_rows` cities."""
+    rows = ''.join(
+        f'<tr><td>{i}</td><td>City {i}</td><td>Adm</td><td>{(n_rows - i) * 1000:,}</td></tr>'
+        for i in range(n_rows)
+    )
+    html = (
+        '<html><head><title>Cities</title></head><body>'
+        '<table id="tlc"><thead><tr><th>#</th><th>Name</th><th>Adm</th><th>Population</th></tr></thead>'
+        f'<tbody>{rows}</tbody></table></body></html>'
+    )
+    return html.encode('utf-8')
+
+
+# Function to load saved pages from a directory, keyed by URL path
+def load_pages(pages_dir):
+    """Reads every file below `pages_dir` and returns a dict of {'/relative/path': bytes}."""
+    pages = {}
+    for root, _, files in os.walk(pages_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            key = '/' + os.path.relpath(path, pages_dir).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                pages[key] = f.read()
+    return pages
+
+
+# Function to start the stub server in a background thread
+def start_stub_server(pages, latency=0.0):
+    """Starts a threaded HTTP server on a free localhost port and returns it."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, so the connection pool is exercised
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            body = pages.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Function to time one download strategy
+def run(label, func, urls, total_bytes):
+    """Times `func(urls)` and prints pages/s and MB/s."""
+    start = time.perf_counter()
+    results = func(urls)
+    elapsed = time.perf_counter() - start
+    failures = sum(isinstance(r, Exception) for r in results)
+    print(f"{label:<12} {len(urls)} pages in {elapsed:.3f}s  "
+          f"{len(urls) / elapsed:8.1f} pages/s  {total_bytes / elapsed / 1e6:8.2f} MB/s  failures: {failures}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', help='Directory of saved pages to serve (default: synthetic pages)')
+    parser.add_argument('--synthetic', type=int, default=130, help='Number of synthetic pages when --pages is not set')
+    parser.add_argument('--latency', type=float, default=100, help='Per-request server delay in milliseconds')
+    parser.add_argument('--repeat', type=int, default=1, help='Serve every page this many times')
+    parser.add_argument('--workers', type=int, default=8, help='Threads used by fetch_all')
+    parser.add_argument('--per-host', type=int, default=8, help='Concurrent requests per host used by fetch_all')
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = load_pages(args.pages)
+    else:
+        page = make_synthetic_page()
+        pages = {f'/en/country{i}/cities': page for i in range(args.synthetic)}
+
+    server = start_stub_server(pages, latency=args.latency / 1000)
+    host, port = server.server_address
+    urls = [f'http://{host}:{port}{path}' for path in pages] * args.repeat
+    total_bytes = sum(len(body) for body in pages.values()) * args.repeat
+
+    try:
+        sequential = run('sequential', lambda us: [requests.get(u, timeout=30).content for u in us], urls, total_bytes)
+        session = make_session(pool_size=args.workers)
+        concurrent = run('fetch_all', lambda us: fetch_all(us, session=session, max_workers=args.workers,
+                                                           per_host=args.per_host), urls, total_bytes)
+        print(f"speedup: {sequential / concurrent:.1f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
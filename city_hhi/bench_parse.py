@@ -0,0 +1,125 @@
+"""
+Parser benchmark: full BeautifulSoup tree (the old code path) versus the streaming table extractor.
+
+    python -m city_hhi.bench_parse                                # Synthetic pages
+    python -m city_hhi.bench_parse --page country=saved/china.html --page province=saved/anhui.html
+
+Each page is parsed with the RegionSource of its level, once by building a BeautifulSoup tree and
+once by streaming only the city table with every available backend. Both must return the same rows.
+"""
+import argparse
+import time
+
+from bs4 import BeautifulSoup
+
+from .regions import SOURCES
+from .tables import etree
+
+
+# Function to read the city rows the way the original scripts did, with a full BeautifulSoup tree
+def parse_rows_bs4(source, content, name):
+    """Returns the same list of (city name, population) tuples as RegionSource.parse_rows."""
+    soup = BeautifulSoup(content, 'html.parser')
+    table = None
+    for table_id in source.table_ids:
+        table = soup.find('table', {'id': table_id})
+        if table:
+            break
+    if not table:
+        return None
+
+    if source.skip_header_rows is not None:
+        rows = table.find_all('tr')[source.skip_header_rows:]
+    else:
+        rows = table.find('tbody').find_all('tr')
+    if source.head_rows is not None:
+        rows = rows[:source.head_rows]
+
+    name_idx, population_idx = source.column_overrides.get(name, (source.name_idx, source.population_idx))
+    city_data = []
+    for row in rows:
+        cells = row.find_all('td')
+        if len(cells) >= source.min_cells:
+            population = cells[population_idx].text.strip()
+            for separator in source.thousands_separators:
+                population = population.replace(separator, '')
+            city_data.append((cells[name_idx].text.strip(), int(population)))
+    return city_data
+
+
+# Function to generate a synthetic citypopulation.de like page for a level
+def make_synthetic_page(level, n_rows=3000, padding_rows=3000):
+    """
+    Returns HTML bytes with the city table of `level` holding `n_rows` rows, surrounded by
+    `padding_rows` rows of unrelated tables, similar in size to the China and USA pages.
+    """
+    source = SOURCES[level]
+    n_cells = max(source.min_cells, source.name_idx + 1, source.population_idx + 1)
+
+    def table(table_id, rows):
+        header = ''.join(f'<th>Column {c}</th>' for c in range(n_cells))
+        body = ''.join(
+            '<tr>' + ''.join(
+                f'<td class="rname"><a href="#">City {i}</a></td>' if c == source.name_idx else
+                f'<td class="rpop">{(rows - i) * 1000:,}</td>' if c == source.population_idx else
+                f'<td>cell {c}</td>'
+                for c in range(n_cells)) + '</tr>'
+            for i in range(rows))
+        return f'<table id="{table_id}" class="data"><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>'
+
+    html = (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Synthetic</title></head><body>'
+        f'<div id="intro">{"<p>Lorem ipsum dolor sit amet.</p>" * 200}</div>'
+        f'{table("adm", padding_rows // 2)}'
+        f'{table(source.table_ids[0], n_rows)}'
+        f'{table("other", padding_rows // 2)}'
+        '</body></html>'
+    )
+    return html.encode('utf-8')
+
+
+# Function to time a parser over a page
+def time_parser(func, repeat):
+    """Returns the best wall time in seconds of `repeat` calls of `func` and its result."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--page', action='append', default=[], metavar='LEVEL=PATH',
+                        help='Saved page to parse with the source of LEVEL (repeatable)')
+    parser.add_argument('--name', default='', help='Region name used for column overrides, e.g. Fujian')
+    parser.add_argument('--rows', type=int, default=3000, help='City rows of the synthetic pages')
+    parser.add_argument('--repeat', type=int, default=5, help='Best of this many runs')
+    args = parser.parse_args()
+
+    if args.page:
+        pages = []
+        for spec in args.page:
+            level, path = spec.split('=', 1)
+            with open(path, 'rb') as f:
+                pages.append((level, path, f.read()))
+    else:
+        pages = [(level, f'synthetic {level}', make_synthetic_page(level, args.rows)) for level in SOURCES]
+
+    backends = ['html.parser'] + (['lxml'] if etree is not None else [])
+    for level, label, content in pages:
+        source = SOURCES[level]
+        reference_time, reference = time_parser(lambda: parse_rows_bs4(source, content, args.name), args.repeat)
+        print(f"{label} ({len(content) / 1e6:.2f} MB, {len(reference or [])} cities kept)")
+        print(f"  {'BeautifulSoup':<22} {reference_time * 1000:9.2f} ms")
+        for backend in backends:
+            elapsed, rows = time_parser(lambda: source.parse_rows(content, args.name, backend),
+                                        args.repeat)
+            status = 'same rows' if rows == reference else 'ROWS DIFFER'
+            print(f"  {'streaming ' + backend:<22} {elapsed * 1000:9.2f} ms  "
+                  f"{reference_time / elapsed:6.1f}x  {status}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Query benchmark of the SQLite store against re-reading a CSV with pandas for every question.
+
+    python -m city_hhi.bench_store                     # 10^6 synthetic cities in 20000 regions
+    python -m city_hhi.bench_store --cities 100000 --queries 2000
+
+The same point lookups, per-region top-k and HHI range queries are answered by both, and must agree.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .hhi import calculate_hhi_by_region
+from .store import CityStore
+
+LEVEL = 'bench'
+
+
+# Function to make a table of random city populations
+def make_synthetic_cities(n_cities, n_regions, seed=0):
+    """Returns a DataFrame of 'Region', 'City', 'Population' with log-normal populations."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Region': np.char.add('Region ', rng.integers(0, n_regions, n_cities).astype(str)),
+        'City': np.char.add('City ', np.arange(n_cities).astype(str)),
+        'Population': np.floor(rng.lognormal(10, 1.5, n_cities)).astype(np.int64) + 1,
+    })
+
+
+# Function to time queries one by one
+def time_queries(func, queries):
+    """Returns the latencies in microseconds of func(*query) for every query, and the results."""
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(func(*query))
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies, results
+
+
+# Function to answer the queries the way the scripts do today, re-reading the CSV every time
+def pandas_city(path, city):
+    data = pd.read_csv(path)
+    rows = data[data['City'] == city]
+    return [(region, name, None, int(population)) for region, name, population in rows.itertuples(index=False)]
+
+
+def pandas_top(path, region, k):
+    data = pd.read_csv(path)
+    rows = data[data['Region'] == region].sort_values('Population', ascending=False, kind='stable').head(k)
+    return [(name, int(population)) for name, population in zip(rows['City'], rows['Population'])]
+
+
+def pandas_hhi_between(path, low, high):
+    hhi_df, _ = calculate_hhi_by_region(pd.read_csv(path), 'Region')
+    rows = hhi_df[(hhi_df['HHI'] >= low) & (hhi_df['HHI'] <= high)].sort_values('HHI')
+    return [(region, hhi, int(top)) for region, hhi, top in zip(rows['Region'], rows['HHI'], rows['Top'])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cities', type=int, default=1_000_000, help='Number of city rows')
+    parser.add_argument('--regions', type=int, default=20_000, help='Number of regions')
+    parser.add_argument('--queries', type=int, default=10_000, help='Queries of each kind on the store')
+    parser.add_argument('--pandas-queries', type=int, default=3, help='Queries of each kind re-reading the CSV')
+    args = parser.parse_args()
+
+    data = make_synthetic_cities(args.cities, args.regions)
+    hhi_df, _ = calculate_hhi_by_region(data, 'Region')
+    rng = np.random.default_rng(1)
+    cities = [(str(city),) for city in rng.choice(data['City'], args.queries)]
+    tops = [(str(region), 10) for region in rng.choice(hhi_df['Region'], args.queries)]
+    # Ranges holding about 10 regions each
+    values = np.sort(hhi_df['HHI'].to_numpy())
+    starts = rng.integers(0, len(values) - 10, args.queries)
+    ranges = [(float(values[i]), float(values[i + 9])) for i in starts]
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'cities.csv')
+        data.to_csv(csv_path, index=False)
+        start = time.perf_counter()
+        with CityStore(os.path.join(directory, 'bench.sqlite')) as store:
+            store.load_cities(LEVEL, data, 'Region')
+            store.load_hhi(LEVEL, hhi_df, 'Region', exponent=2)
+            print(f"{args.cities:,} cities in {len(hhi_df):,} regions loaded in {time.perf_counter() - start:.1f} s")
+
+            print(f"  {'query':<22}{'store p50':>12}{'p99':>10}{'pandas':>14}  result")
+            kinds = (('city lookup', lambda city: store.city(LEVEL, city), pandas_city, cities),
+                     ('top 10 of a region', lambda region, k: store.top_cities(LEVEL, region, k), pandas_top, tops),
+                     ('HHI range', lambda low, high: store.hhi_between(LEVEL, low, high, exponent=2),
+                      pandas_hhi_between, ranges))
+            for label, store_query, pandas_query, queries in kinds:
+                latencies, results = time_queries(store_query, queries)
+                pandas_latencies, pandas_results = time_queries(lambda *query: pandas_query(csv_path, *query),
+                                                                queries[:args.pandas_queries])
+                same = all(a == b for a, b in zip(results, pandas_results))
+                p50, p99 = np.percentile(latencies, [50, 99])
+                print(f"  {label:<22}{p50:9.1f} us{p99:7.1f} us{statistics.mean(pandas_latencies) / 1000:11.1f} ms  "
+                      f"{'same rows' if same else 'ROWS DIFFER'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+Reproducible benchmark suite of the scraper, the parser and the HHI math, without touching
+citypopulation.de or the working directory.
+
+    python -m city_hhi.bench_suite --record                  # Save one real page per level as fixtures
+    python -m city_hhi.bench_suite --save                    # Run and store the results as the baseline
+    python -m city_hhi.bench_suite                           # Run and compare with the baseline
+    python -m city_hhi.bench_suite --max-rows 100000 --threshold 0.1
+
+Pages come from the recorded fixtures in bench_fixtures/ (<level>.html), or from deterministic
+synthetic pages when a level has none; the fixture hashes are stored with the results so that a
+baseline is only compared with runs on the same pages. The local mode runs on synthetic CSVs of
+10^3 to 10^7 cities, and the HHI engine runs against the original one boolean mask per region on a
+skewed table (half of the cities in one region, no top-N cut, like the country level). Every benchmark reports the best and the median of its runs; a benchmark whose
+best time exceeds the baseline by more than `--threshold` is a regression and makes the exit status 1.
+"""
+import argparse
+import contextlib
+import gc
+import hashlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .bench_parse import make_synthetic_page
+from .fetcher import fetch
+from .hhi import calculate_hhi, calculate_hhi_by_region
+from .pipeline import calculate_hhi_from_local, display_and_save_data, get_all_cities, get_top_cities
+from .regions import SOURCES
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_fixtures')
+FIXTURE_REGIONS = {'country': 'China', 'state': 'TX', 'province': 'Guangdong'}  # Region key recorded per level
+BASELINE_FILE = 'bench_baseline.json'
+SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7)
+SKEWED_ROWS = 2 * 10 ** 6  # Cities of the skewed table...
+SKEWED_REGIONS = 100       # ...half of them in one region, the others spread over this many
+THRESHOLD = 0.2   # Allowed slowdown of the best time before a benchmark counts as a regression
+REPEAT = 5        # Runs of every benchmark...
+BUDGET = 2.0      # ...unless they take longer than this many seconds in total
+MIN_TIME = 0.2    # Fast benchmarks run until they took this long in total...
+MAX_RUNS = 100    # ...or this many times
+
+
+# Function to download the fixture pages
+def record_fixtures(fixture_dir=FIXTURE_DIR):
+    """Saves the page of one region of every level to <fixture_dir>/<level>.html."""
+    os.makedirs(fixture_dir, exist_ok=True)
+    for level, key in FIXTURE_REGIONS.items():
+        source = SOURCES[level]
+        url = source.url(key, source.regions[key])
+        try:
+            content = fetch(url)
+        except Exception as e:
+            print(f"Error with {url}: {e}")
+            continue
+        path = os.path.join(fixture_dir, f'{level}.html')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(path + '.tmp', path)
+        print(f"{level}: {len(content):,} bytes from {url} saved to '{path}'.")
+
+
+# Function to get the page of every level
+def load_pages(fixture_dir=FIXTURE_DIR):
+    """Returns {level: (region key, page bytes, fixture name)}, with synthetic pages for missing fixtures."""
+    pages = {}
+    for level, key in FIXTURE_REGIONS.items():
+        path = os.path.join(fixture_dir, f'{level}.html')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                content = f.read()
+            pages[level] = (key, content, f'{level}.html sha256:{hashlib.sha256(content).hexdigest()[:16]}')
+        else:
+            pages[level] = (key, make_synthetic_page(level), 'synthetic')
+    return pages
+
+
+# Function to write a CSV of random city populations for the local mode
+def make_synthetic_csv(path, n_rows, source, seed=0):
+    """Writes `n_rows` cities with log-normal populations in n_rows / 100 regions (at least 10)."""
+    rng = np.random.default_rng(seed)
+    n_regions = max(10, n_rows // 100)
+    pd.DataFrame({
+        source.column: np.char.add('Region ', rng.integers(0, n_regions, n_rows).astype(str)),
+        'City': np.char.add('City ', np.arange(n_rows).astype(str)),
+        'Population': np.floor(rng.lognormal(10, 1.5, n_rows)).astype(np.int64) + 1,
+    }).to_csv(path, index=False)
+
+
+# Function to build a table with one region holding half of the cities
+def make_skewed_data(n_rows, column, seed=0):
+    rng = np.random.default_rng(seed)
+    small = np.char.add('Region ', rng.integers(0, SKEWED_REGIONS, n_rows).astype(str))
+    return pd.DataFrame({
+        column: np.where(rng.random(n_rows) < 0.5, 'Largest', small),
+        'City': np.char.add('City ', np.arange(n_rows).astype(str)),
+        'Population': np.floor(rng.lognormal(10, 1.5, n_rows)).astype(np.int64) + 1,
+    })
+
+
+# Function to calculate the HHI of every region like the original scripts
+def hhi_per_region_mask(data, column, exponent):
+    """One boolean mask and one calculate_hhi call per region, the code calculate_hhi_by_region replaced."""
+    return {region: calculate_hhi(data[data[column] == region]['Population'].tolist(), exponent)
+            for region in data[column].unique()}
+
+
+# Function to time a benchmark
+def time_call(func, repeat=REPEAT, budget=BUDGET):
+    """
+    Runs `func` `repeat` times (at least once, fewer when over `budget` seconds, more while the runs
+    take less than MIN_TIME in total) with garbage collection off and its prints discarded.
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        while not times or (len(times) < repeat and sum(times) < budget) or \
+                (sum(times) < MIN_TIME and len(times) < MAX_RUNS):
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - start)
+            finally:
+                gc.enable()
+    return {'best': min(times), 'median': statistics.median(times), 'runs': len(times)}
+
+
+# Function to run every benchmark
+def run_suite(sizes=SIZES, fixture_dir=FIXTURE_DIR, data_dir=None, repeat=REPEAT, budget=BUDGET):
+    """Returns {'environment': ..., 'benchmarks': {name: {'best', 'median', 'runs'}}}."""
+    results = {}
+    pages = load_pages(fixture_dir)
+    for level, (key, content, fixture) in pages.items():
+        source = SOURCES[level]
+        func = get_all_cities if level == 'province' else get_top_cities
+        results[f'{func.__name__}[{level}]'] = time_call(lambda: func(source, key, content), repeat, budget)
+
+    rng = np.random.default_rng(0)
+    source = SOURCES['state']
+    with tempfile.TemporaryDirectory(prefix='city_hhi_bench_') as directory:
+        data_dir = data_dir or directory
+        os.makedirs(data_dir, exist_ok=True)
+        for n_rows in sizes:
+            populations = (np.floor(rng.lognormal(10, 1.5, n_rows)) + 1).astype(np.int64).tolist()
+            results[f'calculate_hhi[{n_rows}]'] = time_call(lambda: calculate_hhi(populations), repeat, budget)
+
+            csv_path = os.path.join(data_dir, f'cities_{n_rows}.csv')
+            if not os.path.exists(csv_path):
+                make_synthetic_csv(csv_path, n_rows, source)
+            results[f'calculate_hhi_from_local[{n_rows}]'] = time_call(
+                lambda: calculate_hhi_from_local(source, csv_path), repeat, budget)
+
+            hhi_df, city_df = calculate_hhi_from_local(source, csv_path)
+            output_dir = os.path.join(directory, 'output')
+            os.makedirs(output_dir, exist_ok=True)
+            results[f'display_and_save_data[{n_rows}]'] = time_call(
+                lambda: display_and_save_data(source, hhi_df, city_df, output_dir=output_dir), repeat, budget)
+            print(f"  {n_rows:>10,} rows done")
+
+    country = SOURCES['country']
+    n_rows = min(SKEWED_ROWS, max(sizes, default=SKEWED_ROWS))
+    data = make_skewed_data(n_rows, country.column)
+    results[f'calculate_hhi_by_region[skewed {n_rows}]'] = time_call(
+        lambda: calculate_hhi_by_region(data, country.column, exponent=country.exponent, sort=country.local_sort),
+        repeat, budget)
+    results[f'hhi_per_region_mask[skewed {n_rows}]'] = time_call(
+        lambda: hhi_per_region_mask(data, country.column, country.exponent), repeat, budget)
+
+    environment = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'fixtures': {level: fixture for level, (_, _, fixture) in pages.items()},
+    }
+    return {'environment': environment, 'benchmarks': results}
+
+
+# Function to compare results with a baseline
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Returns a list of (name, baseline best, best, ratio, status) for the benchmarks of both runs;
+    status is 'REGRESSION' above 1 + threshold, 'faster' below 1 - threshold and 'ok' otherwise.
+    Page benchmarks are skipped when the fixtures differ.
+    """
+    same_fixtures = results['environment']['fixtures'] == baseline['environment'].get('fixtures')
+    rows = []
+    for name, values in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None or (name.startswith('get_') and not same_fixtures):
+            continue
+        ratio = values['best'] / previous['best']
+        status = 'REGRESSION' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else 'ok'
+        rows.append((name, previous['best'], values['best'], ratio, status))
+    return rows
+
+
+# Function to save a results file
+def write_json(path, value):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(value, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--record', action='store_true', help='Download the fixture pages and exit')
+    parser.add_argument('--fixtures', default=FIXTURE_DIR, help='Directory of the <level>.html fixtures')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help=f'Baseline JSON file (default: {BASELINE_FILE})')
+    parser.add_argument('--save', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help=f'Allowed slowdown before a regression is reported (default: {THRESHOLD})')
+    parser.add_argument('--max-rows', type=float, default=max(SIZES), help='Largest synthetic CSV')
+    parser.add_argument('--data-dir', help='Keep the synthetic CSVs in this directory between runs')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='Runs of every benchmark')
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.fixtures)
+        return
+
+    sizes = [n_rows for n_rows in SIZES if n_rows <= args.max_rows]
+    results = run_suite(sizes, args.fixtures, args.data_dir, args.repeat)
+    print(f"{'benchmark':<46}{'best ms':>12}{'median ms':>12}{'runs':>6}")
+    for name, values in results['benchmarks'].items():
+        print(f"{name:<46}{values['best'] * 1000:12.3f}{values['median'] * 1000:12.3f}{values['runs']:6d}")
+    engine, masks = (values for name, values in results['benchmarks'].items() if 'skewed' in name)
+    print(f"Skewed table: calculate_hhi_by_region {masks['best'] / engine['best']:.1f}x the per-region masks")
+    if args.output:
+        write_json(args.output, results)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with '{args.baseline}' (threshold {args.threshold:.0%}):")
+        for name, previous, best, ratio, status in compare(results, baseline, args.threshold):
+            print(f"  {name:<46}{previous * 1000:12.3f} -> {best * 1000:10.3f} ms  {ratio:5.2f}x  {status}")
+            if status == 'REGRESSION':
+                regressions.append(name)
+        if results['environment'] != baseline['environment']:
+            print("  The environment differs from the baseline's, timings may not be comparable.")
+    if args.save:
+        write_json(args.baseline, results)
+        print(f"Baseline saved to '{args.baseline}'.")
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Default settings of the response cache
+CACHE_DIR = '.http_cache'
+TTL = 30 * 24 * 3600             # Pages are served without revalidation for 30 days
+MAX_BYTES = 512 * 1024 * 1024    # Least recently used pages are evicted above 512 MB
+INDEX_FILE = 'index.json'
+
+
+class CacheMissError(LookupError):
+    """Raised in cache-only mode when a URL has never been downloaded."""
+
+
+class ResponseCache:
+    """
+    Persistent on-disk cache of HTTP response bodies keyed by URL.
+
+    Every entry keeps the SHA-256 of its body, the ETag/Last-Modified validators sent by the server
+    and the times it was fetched and last used. Entries younger than `ttl` seconds are served as is;
+    older ones are revalidated with If-None-Match/If-Modified-Since. When the bodies grow beyond
+    `max_bytes`, the least recently used entries are evicted. With `offline=True` the network is never
+    touched and stale entries are served as they are.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=TTL, max_bytes=MAX_BYTES, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'network': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+        self._total_bytes = sum(entry['size'] for entry in self._index.values())  # Kept up to date, not summed again
+
+    # Function to read the index of cached entries
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    # Function to get the file name of a cached body
+    def _body_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    # Function to read a cached body, dropping the entry if the file is gone or corrupt
+    def _read_body(self, url, entry):
+        try:
+            with open(self._body_path(url), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            body = None
+        if body is None or hashlib.sha256(body).hexdigest() != entry['sha256']:
+            del self._index[url]
+            self._total_bytes -= entry['size']
+            self._dirty = True
+            return None
+        return body
+
+    # Function to look up a URL in the cache
+    def lookup(self, url):
+        """
+        Returns a tuple (body, fresh, headers) for `url`.
+        `body` is None when the URL is not cached. `fresh` tells whether the body can be served without
+        asking the server. `headers` holds the conditional request headers to revalidate a stale body.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            body = self._read_body(url, entry) if entry else None
+            if body is None:
+                if self.offline:
+                    raise CacheMissError(f"{url} is not in the cache (cache-only mode)")
+                self.stats['misses'] += 1
+                return None, False, {}
+
+            entry['last_access'] = time.time()
+            self._dirty = True
+            if self.offline or time.time() - entry['fetched_at'] < self.ttl:
+                self.stats['hits'] += 1
+                return body, True, {}
+
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return body, False, headers
+
+    # Function to mark a stale entry as fresh again after a 304 Not Modified answer
+    def revalidated(self, url):
+        """Restarts the TTL of `url` after the server confirmed the cached body is unchanged."""
+        with self._lock:
+            if url in self._index:
+                self._index[url]['fetched_at'] = time.time()
+                self._dirty = True
+            self.stats['revalidated'] += 1
+
+    # Function to count a request sent to the server
+    def record_request(self):
+        """Increments the network call counter, a warm rerun within the TTL keeps it at zero."""
+        with self._lock:
+            self.stats['network'] += 1
+
+    # Function to store a downloaded response
+    def store(self, url, body, headers=None):
+        """Writes `body` to the cache with the validators found in the response `headers`."""
+        headers = headers or {}
+        path = self._body_path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)  # Atomic, readers never see a half written body
+
+        now = time.time()
+        with self._lock:
+            if url in self._index:
+                self.stats['misses'] += 1  # A stale entry whose body changed on the server
+                self._total_bytes -= self._index[url]['size']
+            self._total_bytes += len(body)
+            self._index[url] = {
+                'sha256': hashlib.sha256(body).hexdigest(),
+                'size': len(body),
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'fetched_at': now,
+                'last_access': now,
+            }
+            self._dirty = True
+            self._evict()
+
+    # Function to get the content hash of a cached URL
+    def content_hash(self, url):
+        """Returns the SHA-256 of the cached body of `url`, or None when it is not cached."""
+        entry = self._index.get(url)
+        return entry['sha256'] if entry else None
+
+    # Function to drop least recently used entries until the cache fits in max_bytes
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for url, entry in sorted(self._index.items(), key=lambda item: item[1]['last_access']):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._body_path(url))
+            except FileNotFoundError:
+                pass
+            del self._index[url]
+            self._total_bytes -= entry['size']
+            self.stats['evictions'] += 1
+
+    # Function to persist the index
+    def flush(self):
+        """Writes the index to disk if it changed since the last flush."""
+        with self._lock:
+            if not self._dirty:
+                return
+            path = os.path.join(self.cache_dir, INDEX_FILE)
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(self._index, f)
+            os.replace(f"{path}.tmp", path)
+            self._dirty = False
+
+    # Function to summarize the cache counters
+    def summary(self):
+        """Returns a one-line summary of the hit/miss counters."""
+        lookups = self.stats['hits'] + self.stats['misses'] + self.stats['revalidated']
+        hit_rate = (self.stats['hits'] + self.stats['revalidated']) / lookups if lookups else 0.0
+        return (f"cache hits: {self.stats['hits']}, revalidated: {self.stats['revalidated']}, "
+                f"misses: {self.stats['misses']}, network calls: {self.stats['network']}, "
+                f"evictions: {self.stats['evictions']}, hit rate: {hit_rate:.0%}")
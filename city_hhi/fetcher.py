@@ -0,0 +1,126 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+from .cache import CacheMissError
+
+# Default settings of the fetch engine
+MAX_WORKERS = 8          # Threads fetching pages at the same time
+PER_HOST_LIMIT = 4       # Concurrent requests allowed against a single host
+TIMEOUT = (5, 30)        # (connect, read) timeout in seconds
+RETRIES = 3              # Retries on connection errors and 429/5xx responses
+BACKOFF_FACTOR = 0.5     # Sleep 0.5s, 1s, 2s, ... between retries
+USER_AGENT = 'world-trade-map city_hhi'
+
+_session = None
+_session_lock = threading.Lock()
+_host_locks = {}
+_host_locks_lock = threading.Lock()
+
+
+# Function to build a requests session with a shared connection pool and retry policy
+def make_session(pool_size=MAX_WORKERS, retries=RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """
+    Creates a requests.Session whose connection pool holds `pool_size` keep-alive connections per host.
+    Failed requests are retried with exponential backoff on connection errors and 429/5xx responses.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+# Function to get the session shared by all scrapers of this process
+def get_session():
+    """Returns the process-wide session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+# Function to get the semaphore capping concurrent requests against one host
+def _host_semaphore(url, per_host):
+    host = urlsplit(url).netloc
+    with _host_locks_lock:
+        key = (host, per_host)
+        if key not in _host_locks:
+            _host_locks[key] = threading.BoundedSemaphore(per_host)
+        return _host_locks[key]
+
+
+# Function to fetch a single page through the shared session
+def fetch(url, session=None, timeout=TIMEOUT, per_host=PER_HOST_LIMIT, cache=None):
+    """
+    Fetches a single URL and returns the response body as bytes.
+    With a ResponseCache, fresh pages are served from disk and stale ones are revalidated.
+    Raises requests.HTTPError when the server still answers with an error status after all retries.
+    """
+    headers = {}
+    if cache is not None:
+        try:
+            body, fresh, headers = cache.lookup(url)
+        except CacheMissError:
+            metrics.count('cache_misses')
+            raise
+        if fresh:
+            metrics.count('cache_hits')
+            return body
+
+    session = session or get_session()
+    with _host_semaphore(url, per_host):
+        if cache is not None:
+            cache.record_request()
+        with metrics.timer('fetch'):
+            response = session.get(url, timeout=timeout, headers=headers)
+    metrics.count('http_requests')
+    if cache is not None and response.status_code == 304:
+        metrics.count('cache_revalidated')
+        cache.revalidated(url)
+        return body
+    response.raise_for_status()
+    metrics.count('bytes_fetched', len(response.content))
+    if cache is not None:
+        metrics.count('cache_misses')
+        cache.store(url, response.content, response.headers)
+    return response.content
+
+
+# Function to fetch many pages concurrently
+def fetch_all(urls, session=None, max_workers=MAX_WORKERS, per_host=PER_HOST_LIMIT, timeout=TIMEOUT, cache=None):
+    """
+    Fetches all URLs on a thread pool sharing one connection pool, going through `cache` if given.
+    Returns a list in the same order as `urls`, holding either the response body (bytes)
+    or the exception raised for that URL, so one bad page does not abort the whole run.
+    """
+    urls = list(urls)
+    if not urls:
+        return []
+    session = session or get_session()
+
+    def _fetch(url):
+        try:
+            return fetch(url, session=session, timeout=timeout, per_host=per_host, cache=cache)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        results = list(executor.map(_fetch, urls))
+    if cache is not None:
+        cache.flush()
+    return results
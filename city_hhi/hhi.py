@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+
+# Function to calculate the Herfindahl-Hirschman Index (HHI) of a single region
+def calculate_hhi(city_populations, exponent=2):
+    """Calculates the Herfindahl-Hirschman Index (HHI) for city populations."""
+    total_population = sum(city_populations)
+    hhi = sum((pop / total_population) ** exponent * 100 for pop in city_populations)
+    return hhi
+
+
+# Function to order the rows of every region and mark the first top_n of each
+def rank_within_regions(codes, populations, top_n=None, sort=True):
+    """
+    Orders row positions by region (in order of first appearance), largest population first when `sort`.
+    Returns the ordered row positions, their region codes and the offset of each row within its region.
+    When `top_n` is set, only the first `top_n` rows of each region are kept.
+    """
+    if sort:
+        order = np.lexsort((-populations, codes))  # Stable: ties keep their file order
+    else:
+        order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+
+    # Offset of each row within its region: position minus the position where the region starts
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(sorted_codes)])
+    rank = np.arange(len(sorted_codes)) - np.repeat(starts, sizes)
+
+    if top_n is not None:
+        keep = rank < top_n
+        order, sorted_codes, rank = order[keep], sorted_codes[keep], rank[keep]
+    return order, sorted_codes, rank
+
+
+# Function to add up the terms of every region in rank order
+def sum_in_rank_order(terms, starts, counts):
+    """
+    Sums the rows of `terms` (grouped by region, `counts` rows from each of `starts`) per region
+    in the order of the built-in sum of calculate_hhi. np.add.reduceat sums regions of one
+    or two terms in that order; longer regions, which it sums pairwise, are summed again with the
+    built-in sum over their slice. `terms` may have extra columns.
+    """
+    total = np.add.reduceat(terms, starts, axis=0)
+    long = np.flatnonzero(counts > 2)
+    if len(long):
+        firsts, lasts = starts[long].tolist(), (starts[long] + counts[long]).tolist()
+        columns, sums = terms.reshape(len(terms), -1), total.reshape(len(total), -1)
+        for j in range(columns.shape[1]):
+            values = columns[:, j].tolist()
+            sums[long, j] = [sum(values[first:last]) for first, last in zip(firsts, lasts)]
+    return total
+
+
+# Function to calculate the share-power index of every region in one pass
+def calculate_hhi_by_region(data, region_col, exponent=2, top_n=None, sort=True,
+                            population_col='Population'):
+    """
+    Vectorized equivalent of calling calculate_hhi on every region of `data` separately.
+
+    Rows are grouped by `region_col`; with `sort` each region is ordered by descending population,
+    and with `top_n` only its largest `top_n` rows enter the index. Shares are raised to `exponent`
+    (2 for the classic HHI) and summed per region in the order of calculate_hhi, so the cost is one
+    sort of the rows instead of one boolean mask per region. NumPy's power can differ from Python's
+    in the last bit, so individual results can too.
+
+    Returns a tuple of DataFrames:
+      - hhi_df: one row per region in order of first appearance, with columns [region_col, 'HHI', 'Top']
+      - top_df: the rows that entered the index, grouped by region in the same order
+    """
+    if data.empty:
+        return (pd.DataFrame(columns=[region_col, 'HHI', 'Top']),
+                data.iloc[0:0])
+
+    codes, regions = pd.factorize(data[region_col], sort=False)
+    populations = data[population_col].to_numpy(dtype=np.int64)
+    order, sorted_codes, _ = rank_within_regions(codes, populations, top_n=top_n, sort=sort)
+    selected = populations[order]
+
+    # Integer totals are exact; shares are then divided once per row
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    totals = np.add.reduceat(selected, starts)
+    counts = np.diff(np.r_[starts, len(selected)])
+    shares = selected / np.repeat(totals, counts)
+    hhi = sum_in_rank_order(shares ** exponent * 100, starts, counts)
+
+    hhi_df = pd.DataFrame({
+        region_col: regions[sorted_codes[starts]],
+        'HHI': hhi,
+        'Top': counts,
+    })
+    top_df = data.iloc[order].reset_index(drop=True)
+    return hhi_df, top_df
+
+
+# Function to calculate the share-power index of every group for several exponents in one pass
+def calculate_hhi_by_group(data, group_cols, exponents=(2,), top_n=None, sort=True,
+                           population_col='Population'):
+    """
+    Same as calculate_hhi_by_region for groups made of several columns (e.g. region and year)
+    and for several exponents at once: shares are computed once and raised to every exponent
+    as a (rows x exponents) array.
+
+    Rows with a missing population are ignored. Returns a long DataFrame with the columns
+    group_cols + ['Exponent', 'HHI', 'Top'], groups in order of first appearance, and the
+    DataFrame of the rows that entered the index.
+    """
+    group_cols = list(group_cols)
+    exponents = np.asarray(exponents, dtype=float)
+    data = data[data[population_col].notna()]
+    if data.empty:
+        return (pd.DataFrame(columns=group_cols + ['Exponent', 'HHI', 'Top']),
+                data.iloc[0:0])
+
+    codes = data.groupby(group_cols, sort=False, dropna=False).ngroup().to_numpy()
+    populations = data[population_col].to_numpy(dtype=np.int64)
+    order, sorted_codes, _ = rank_within_regions(codes, populations, top_n=top_n, sort=sort)
+    selected = populations[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    totals = np.add.reduceat(selected, starts)
+    counts = np.diff(np.r_[starts, len(selected)])
+    shares = selected / np.repeat(totals, counts)
+    hhi = sum_in_rank_order(shares[:, None] ** exponents[None, :] * 100, starts, counts)
+
+    keys = data.iloc[order[starts]][group_cols].reset_index(drop=True)
+    hhi_df = keys.loc[keys.index.repeat(len(exponents))].reset_index(drop=True)
+    hhi_df['Exponent'] = np.tile(exponents, len(starts))
+    hhi_df['HHI'] = hhi.ravel()
+    hhi_df['Top'] = np.repeat(counts, len(exponents))
+    top_df = data.iloc[order].reset_index(drop=True)
+    return hhi_df, top_df
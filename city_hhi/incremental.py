@@ -0,0 +1,194 @@
+"""
+Incremental refresh of the HHI outputs.
+
+A manifest next to the outputs records a fingerprint of the inputs of every region: a hash of its
+rows in the curated CSV, or of its downloaded page. On the next run only the regions whose
+fingerprint changed (or that are new) are recomputed, and their rows are patched into the existing
+`*_hhi_data.csv` and `*_population_data.csv`; regions that disappeared are dropped. When the
+parameters of a level change (exponent, top-N, source mode, ...) the level is rebuilt in full.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+from .cache import CACHE_DIR, ResponseCache
+from .pipeline import (calculate_hhi_from_data, calculate_hhi_from_pages, display_and_save_data,
+                       fetch_region_pages)
+
+MANIFEST_FILE = 'hhi_manifest.json'
+
+
+# Function to read the manifest of an output directory
+def load_manifest(output_dir):
+    """Returns the manifest stored in `output_dir`, or an empty one."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+# Function to write the manifest of an output directory
+def save_manifest(output_dir, manifest):
+    """Writes `manifest` atomically to `output_dir`."""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+# Function to fingerprint the parameters that shape the output of a level
+def source_signature(source, mode):
+    """Returns a hash of everything besides the inputs that changes the output of `source`."""
+    params = {key: value for key, value in vars(source).items() if key != 'regions'}
+    params['mode'] = mode
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+
+
+# Function to fingerprint the rows of every region of a DataFrame
+def fingerprint_regions(data, column):
+    """
+    Returns a dict of {region: hash of its rows}. The hash depends on the values and the order
+    of the rows of the region only, so editing one region leaves the others untouched.
+    """
+    row_hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+    codes, regions = pd.factorize(data[column].astype(str))
+    order = np.argsort(codes, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+    groups = np.split(row_hashes[order], starts[1:])
+    return {regions[codes[order[start]]]: hashlib.sha256(group.tobytes()).hexdigest()
+            for start, group in zip(starts, groups)}
+
+
+# Function to read the current outputs of a level
+def _read_outputs(source, output_dir):
+    prefix = source.output_prefix
+    hhi_path = os.path.join(output_dir, f'{prefix}_hhi_data.csv')
+    city_path = os.path.join(output_dir, f'{prefix}_population_data.csv')
+    if not (os.path.exists(hhi_path) and os.path.exists(city_path)):
+        return None
+    with metrics.timer('read'):
+        return (pd.read_csv(hhi_path, dtype={source.column: str}, float_precision='round_trip'),
+                pd.read_csv(city_path, dtype={source.column: str}))
+
+
+# Function to merge recomputed regions into the existing outputs
+def patch_outputs(source, previous, recomputed, replaced, region_order):
+    """
+    Drops the rows of the `replaced` regions from the `previous` (hhi_df, city_df) outputs and adds
+    the `recomputed` ones. HHI rows are put in `region_order` and city rows grouped in it, like a
+    full rebuild, so that the stable sort of the output breaks ties the same way.
+    """
+    hhi_df, city_df = previous
+    new_hhi, new_cities = recomputed
+    hhi_df = pd.concat([hhi_df[~hhi_df[source.column].isin(replaced)], pd.DataFrame(new_hhi)],
+                       ignore_index=True)
+    city_df = pd.concat([city_df[~city_df[source.column].isin(replaced)],
+                         pd.DataFrame(new_cities, columns=city_df.columns)], ignore_index=True)
+
+    rank = {region: i for i, region in enumerate(region_order)}
+    hhi_order = hhi_df[source.column].map(rank).fillna(len(rank)).to_numpy()
+    hhi_df = hhi_df.iloc[np.argsort(hhi_order, kind='stable')].reset_index(drop=True)
+    order = city_df[source.column].map(rank).fillna(len(rank)).to_numpy()
+    city_df = city_df.iloc[np.argsort(order, kind='stable')].reset_index(drop=True)
+    return hhi_df, city_df
+
+
+# Function to decide which regions of a level need to be recomputed
+def _plan(source, entry, signature, fingerprints, previous):
+    """Returns (changed regions, removed regions) given the manifest `entry` of the level."""
+    if previous is None or entry.get('signature') != signature:
+        return set(fingerprints), set()  # Full rebuild
+    known = entry.get('regions', {})
+    changed = {region for region, fp in fingerprints.items() if known.get(region) != fp}
+    removed = set(known) - set(fingerprints)
+    return changed, removed
+
+
+# Function to refresh one level from its curated CSV
+def _refresh_local(source, entry, previous):
+    with metrics.timer('read'):
+        data = pd.read_csv(source.local_file, dtype={source.column: str})
+    metrics.count('rows_read', len(data))
+    signature = source_signature(source, 'local')
+    fingerprints = fingerprint_regions(data, source.column)
+    changed, removed = _plan(source, entry, signature, fingerprints, previous)
+
+    recomputed = calculate_hhi_from_data(source, data[data[source.column].isin(changed)])
+    region_order = list(pd.unique(data[source.column]))
+    return signature, fingerprints, changed, removed, recomputed, region_order
+
+
+# Function to refresh one level from its downloaded pages
+def _refresh_online(source, entry, previous, pages):
+    signature = source_signature(source, 'online')
+    known = entry.get('regions', {})
+    fingerprints = {}
+    failed = set()
+    for _, _, name, page in pages:
+        if isinstance(page, Exception):
+            print(f"Error with {name}: {page}")
+            failed.add(name)
+            if name in known:
+                fingerprints[name] = known[name]  # Keep the previous rows of regions that failed to download
+        else:
+            fingerprints[name] = hashlib.sha256(page).hexdigest()
+    changed, removed = _plan(source, entry, signature, fingerprints, previous)
+    # A full rebuild can't keep the previous rows: leave failed regions out of the manifest to retry them
+    for name in failed & changed:
+        del fingerprints[name]
+    changed -= failed
+
+    to_parse = [job for job in pages if job[2] in changed and not isinstance(job[3], Exception)]
+    recomputed = calculate_hhi_from_pages([source], to_parse)[source.level]
+    region_order = list(source.regions.values())
+    return signature, fingerprints, changed, removed, recomputed, region_order
+
+
+# Main function to refresh several hierarchy levels incrementally
+def run_incremental(sources, use_local=True, cache_only=False, cache_dir=CACHE_DIR, output_dir='.'):
+    """
+    Same as pipeline.run, but only recomputes the regions whose inputs changed since the last run
+    recorded in the manifest of `output_dir`, and patches them into the existing outputs.
+    Returns a dict of {level: (changed regions, removed regions)}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+
+    pages_by_level = {}
+    if not use_local:
+        print("Using online data...")
+        cache = ResponseCache(cache_dir, offline=cache_only)
+        for job in fetch_region_pages(sources, cache=cache):
+            pages_by_level.setdefault(job[0].level, []).append(job)
+    else:
+        print("Using local data...")
+
+    summary = {}
+    for source in sources:
+        entry = manifest.get(source.level, {})
+        previous = _read_outputs(source, output_dir)
+        if use_local:
+            refreshed = _refresh_local(source, entry, previous)
+        else:
+            refreshed = _refresh_online(source, entry, previous, pages_by_level.get(source.level, []))
+        signature, fingerprints, changed, removed, recomputed, region_order = refreshed
+
+        print(f"{source.level}: {len(changed)} changed, {len(removed)} removed, "
+              f"{len(fingerprints) - len(changed)} unchanged")
+        if changed or removed or previous is None:
+            if previous is None or entry.get('signature') != signature:
+                hhi_df, city_df = recomputed
+            else:
+                hhi_df, city_df = patch_outputs(source, previous, recomputed, changed | removed, region_order)
+            display_and_save_data(source, hhi_df, city_df, output_dir=output_dir)
+
+        manifest[source.level] = {'signature': signature, 'regions': fingerprints}
+        summary[source.level] = (changed, removed)
+
+    save_manifest(output_dir, manifest)
+    return summary
@@ -0,0 +1,207 @@
+"""
+Run instrumentation: wall and CPU time per pipeline stage, counters (bytes fetched, pages and rows
+parsed, rows written, cache hits) and an opt-in profiler.
+
+The modules of the package record into the process-wide METRICS registry:
+
+    with metrics.timer('parse'):
+        ...
+    metrics.count('rows_parsed', len(rows))
+
+and `python -m city_hhi --metrics report.json` (or `--metrics metrics.prom` for the Prometheus
+text format) writes it at the end of a run. `--profile cprofile` saves the pstats of the main thread,
+`--profile sample` samples the stacks of every thread (downloads run on a thread pool) into
+collapsed stacks for flame graph tools.
+
+CPU time is the CPU of the thread running the stage, so stages running on several threads at once
+can add up to more CPU than wall time.
+"""
+import cProfile
+import collections
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'city_hhi'
+SAMPLE_INTERVAL = 0.005  # Seconds between two stack samples of the sampling profiler
+
+
+class Metrics:
+    """Thread-safe registry of stage timers and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    # Function to forget everything recorded so far
+    def reset(self):
+        with self._lock:
+            self.stages = {}  # {stage: [calls, wall seconds, CPU seconds]}
+            self.counters = collections.Counter()
+            self.started = time.time()
+
+    # Function to time a stage
+    @contextmanager
+    def timer(self, stage):
+        """Adds the wall and thread CPU time of the `with` block to `stage`, also when it raises."""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            with self._lock:
+                totals = self.stages.setdefault(stage, [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += wall
+                totals[2] += cpu
+
+    # Function to add to a counter
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    # Function to summarize the recorded metrics
+    def report(self):
+        """Returns a JSON-serializable dict of the stages, the counters and the derived rates."""
+        with self._lock:
+            stages = {stage: {'calls': calls, 'wall_seconds': wall, 'cpu_seconds': cpu}
+                      for stage, (calls, wall, cpu) in self.stages.items()}
+            counters = dict(self.counters)
+        lookups = sum(counters.get(name, 0) for name in ('cache_hits', 'cache_revalidated', 'cache_misses'))
+        fetch_seconds = stages.get('fetch', {}).get('wall_seconds', 0)
+        return {
+            'started': self.started,
+            'elapsed_seconds': time.time() - self.started,
+            'stages': stages,
+            'counters': counters,
+            'rates': {
+                'cache_hit_rate': (counters.get('cache_hits', 0) + counters.get('cache_revalidated', 0)) / lookups
+                if lookups else None,
+                'fetched_bytes_per_second': counters.get('bytes_fetched', 0) / fetch_seconds if fetch_seconds else None,
+            },
+        }
+
+    # Function to format the metrics for a Prometheus scrape or the node exporter textfile collector
+    def prometheus(self, prefix=PREFIX):
+        """Returns the metrics in the Prometheus text exposition format."""
+        report = self.report()
+        lines = [f'# HELP {prefix}_stage_calls_total Times a pipeline stage ran.',
+                 f'# TYPE {prefix}_stage_calls_total counter']
+        lines += [f'{prefix}_stage_calls_total{{stage="{stage}"}} {values["calls"]}'
+                  for stage, values in report['stages'].items()]
+        for kind, label in (('wall', 'Wall clock'), ('cpu', 'CPU')):
+            lines += [f'# HELP {prefix}_stage_{kind}_seconds_total {label} seconds spent in a pipeline stage.',
+                      f'# TYPE {prefix}_stage_{kind}_seconds_total counter']
+            lines += [f'{prefix}_stage_{kind}_seconds_total{{stage="{stage}"}} {values[kind + "_seconds"]!r}'
+                      for stage, values in report['stages'].items()]
+        for name, value in sorted(report['counters'].items()):
+            lines += [f'# TYPE {prefix}_{name}_total counter', f'{prefix}_{name}_total {value}']
+        for name, value in report['rates'].items():
+            if value is not None:
+                lines += [f'# TYPE {prefix}_{name} gauge', f'{prefix}_{name} {value!r}']
+        return '\n'.join(lines) + '\n'
+
+    # Function to save the metrics
+    def write(self, path):
+        """Writes the Prometheus text format to a .prom or .txt path and the JSON report otherwise."""
+        text = self.prometheus() if path.endswith(('.prom', '.txt')) else json.dumps(self.report(), indent=1)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    # Function to print where the time of a run went
+    def summary(self):
+        report = self.report()
+        lines = [f"{'stage':<10}{'calls':>8}{'wall s':>10}{'CPU s':>10}"]
+        for stage, values in sorted(report['stages'].items(), key=lambda item: -item[1]['wall_seconds']):
+            lines.append(f"{stage:<10}{values['calls']:8d}{values['wall_seconds']:10.3f}{values['cpu_seconds']:10.3f}")
+        lines += [f"{name}: {value}" for name, value in sorted(report['counters'].items())]
+        if report['rates']['cache_hit_rate'] is not None:
+            lines.append(f"cache hit rate: {report['rates']['cache_hit_rate']:.0%}")
+        return '\n'.join(lines)
+
+
+METRICS = Metrics()
+
+
+# Functions recording into the process-wide registry
+def timer(stage):
+    return METRICS.timer(stage)
+
+
+def count(name, value=1):
+    METRICS.count(name, value)
+
+
+class _Sampler(threading.Thread):
+    """Background thread counting the stacks of the other threads every `interval` seconds."""
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._done.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+# Function to profile a block of code
+@contextmanager
+def profile(mode, path, interval=SAMPLE_INTERVAL, top=20):
+    """
+    With mode 'cprofile', runs the block under cProfile (the calling thread only), saves the pstats
+    to `path` and prints the `top` functions by cumulative time. With mode 'sample', samples the
+    stacks of all threads every `interval` seconds, writes them as collapsed stacks (one
+    'frame;frame;... count' line per stack, the input of flamegraph.pl and speedscope) and prints the
+    `top` functions by samples spent in them.
+    """
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+            print(f"Profile saved to '{path}'.")
+        return
+
+    sampler = _Sampler(interval)
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            for stack, samples in sampler.stacks.most_common():
+                f.write(f'{stack} {samples}\n')
+        os.replace(path + '.tmp', path)
+        leaves = collections.Counter()
+        for stack, samples in sampler.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += samples
+        print(f"{sampler.samples} samples every {interval * 1000:.0f} ms, busiest functions:")
+        for function, samples in leaves.most_common(top):
+            print(f"  {samples:6d}  {function}")
+        print(f"Collapsed stacks saved to '{path}'.")
@@ -0,0 +1,184 @@
+import os
+
+import pandas as pd
+
+from . import metrics
+from .cache import CACHE_DIR, ResponseCache
+from .fetcher import fetch, fetch_all
+from .hhi import calculate_hhi_by_region
+
+
+# Function to get the top cities' population of a region (Online source)
+def get_top_cities(source, key, content=None, cache=None):
+    """
+    Scrapes the cities of region `key` of `source` from citypopulation.de.
+    The page is fetched unless its already downloaded `content` is passed in.
+    Returns a list of city names and a list of city populations.
+    """
+    name = source.regions[key]
+    if content is None:
+        content = fetch(source.url(key, name), cache=cache)
+        if cache is not None:
+            cache.flush()
+    with metrics.timer('parse'):
+        city_names, populations = source.parse(content, name)
+    metrics.count('pages_parsed')
+    metrics.count('rows_parsed', len(populations))
+    return city_names, populations
+
+
+# Function to get all cities' population of a region (Online source)
+def get_all_cities(source, key, content=None, cache=None):
+    """Same as get_top_cities, named after the province scraper which keeps every city of the table."""
+    return get_top_cities(source, key, content=content, cache=cache)
+
+
+# Function to turn per-region city lists into HHI and city DataFrames
+def _hhi_from_cities(source, scraped):
+    rows = [
+        (name, city, population)
+        for name, (city_names, populations) in scraped
+        for city, population in zip(city_names, populations)
+    ]
+    data = pd.DataFrame(rows, columns=[source.column, 'City', 'Population'])
+    # Pages are already cut to the cities entering the index, in the order they should be summed
+    with metrics.timer('hhi'):
+        hhi_df, city_df = calculate_hhi_by_region(data, source.column, exponent=source.exponent, sort=False)
+    return _select_columns(source, hhi_df, city_df, local=False)
+
+
+# Function to keep the output columns of a source
+def _select_columns(source, hhi_df, city_df, local=True):
+    """The 'Top' column is only part of the local outputs of sources with `include_top`."""
+    hhi_columns = [source.column, 'HHI'] + (['Top'] if local and source.include_top else [])
+    return hhi_df[hhi_columns], city_df[[source.column, 'City', 'Population']]
+
+
+# Function to download the pages of every region of several sources
+def fetch_region_pages(sources, cache=None):
+    """
+    Downloads the pages of all regions of all sources concurrently through one connection pool.
+    Returns a list of (source, key, name, page) tuples where `page` is the body or the exception raised.
+    """
+    jobs = [(source, key, name) for source in sources for key, name in source.regions.items()]
+    # Download all pages concurrently, results come back in the order of `jobs`
+    pages = fetch_all([source.url(key, name) for source, key, name in jobs], cache=cache)
+    if cache is not None:
+        print(cache.summary())
+    return [(source, key, name, page) for (source, key, name), page in zip(jobs, pages)]
+
+
+# Function to parse downloaded pages and calculate HHI
+def calculate_hhi_from_pages(sources, pages):
+    """
+    Parses the (source, key, name, page) tuples of fetch_region_pages and calculates the HHI.
+    Returns a dict of {level: (hhi_data, city_data)} DataFrames.
+    """
+    scraped = {source.level: [] for source in sources}
+    for source, key, name, page in pages:
+        print(f"Scraping data for {name}...")
+        try:
+            if isinstance(page, Exception):
+                raise page
+            city_names, populations = get_top_cities(source, key, page)
+            if populations:  # Ensure we have cities data
+                scraped[source.level].append((name, (city_names, populations)))
+            else:
+                print(f"Could not find the population data for {name}. Skipping...")
+        except Exception as e:
+            print(f"Error with {name}: {e}")
+
+    return {source.level: _hhi_from_cities(source, scraped[source.level]) for source in sources}
+
+
+# Function to scrape data for several sources and calculate HHI (Online)
+def scrape_and_calculate_hhi(sources, cache=None):
+    """
+    Scrapes the city population data of every region of every source and calculates the HHI.
+    All pages of all sources are downloaded concurrently through one connection pool.
+    Returns a dict of {level: (hhi_data, city_data)} DataFrames.
+    """
+    return calculate_hhi_from_pages(sources, fetch_region_pages(sources, cache=cache))
+
+
+# Function to calculate HHI from a DataFrame of city populations
+def calculate_hhi_from_data(source, data):
+    """
+    Calculates HHI for each region of `data`, a DataFrame with the region column of `source`,
+    'City' and 'Population', with the local top-N cut and exponent of `source`.
+    Returns DataFrames of the HHI per region and of the cities used for it.
+    """
+    with metrics.timer('hhi'):
+        hhi_df, city_df = calculate_hhi_by_region(data, source.column, exponent=source.exponent,
+                                                  top_n=source.local_top_n, sort=source.local_sort)
+    return _select_columns(source, hhi_df, city_df)
+
+
+# Function to calculate HHI from local CSV data
+def calculate_hhi_from_local(source, file_path=None):
+    """
+    Reads city population data from a local CSV file (the curated CSV of `source` by default)
+    and calculates HHI for each region.
+    Returns DataFrames of the HHI per region and of the cities used for it.
+    """
+    file_path = file_path or source.local_file
+    try:
+        with metrics.timer('read'):
+            data = pd.read_csv(file_path)
+        metrics.count('rows_read', len(data))
+        return calculate_hhi_from_data(source, data)
+
+    except Exception as e:
+        print(f"Error reading file {file_path}: {e}")
+        return [], []
+
+
+# Function to display and save the data
+def display_and_save_data(source, hhi_data, city_data, output_dir='.'):
+    """Converts the HHI data and city data to DataFrames, sorts them, and saves them to CSV files."""
+    with metrics.timer('write'):
+        _display_and_save_data(source, hhi_data, city_data, output_dir)
+
+
+def _display_and_save_data(source, hhi_data, city_data, output_dir):
+    prefix = source.output_prefix
+    if len(hhi_data):
+        # Convert HHI data to a DataFrame for easy display/analysis
+        hhi_df = pd.DataFrame(hhi_data)
+        hhi_df = hhi_df.sort_values(by=source.sort_output_by, ascending=True, kind='stable').reset_index(drop=True)
+        print("HHI DataFrame after sorting: ")
+        print(hhi_df.to_string())
+
+        # Save HHI data to CSV
+        hhi_df.to_csv(os.path.join(output_dir, f'{prefix}_hhi_data.csv'), index=False)
+        metrics.count('rows_written', len(hhi_df))
+        print(f"HHI data saved to '{prefix}_hhi_data.csv'.")
+
+    if len(city_data):
+        # Convert city-level data to a DataFrame with explicit column order: region, 'City', 'Population'
+        city_df = pd.DataFrame(city_data, columns=[source.column, 'City', 'Population'])
+        city_df.to_csv(os.path.join(output_dir, f'{prefix}_population_data.csv'), index=False)
+        metrics.count('rows_written', len(city_df))
+        print(f"City population data saved to '{prefix}_population_data.csv'.")
+
+
+# Main function to compute several hierarchy levels in one process
+def run(sources, use_local=True, cache_only=False, cache_dir=CACHE_DIR, output_dir='.'):
+    """
+    Calculates and saves the HHI of every source, from the curated CSVs or from citypopulation.de.
+    Online runs download the pages of all sources together and go through the on-disk cache.
+    Returns a dict of {level: (hhi_data, city_data)}.
+    """
+    if use_local:
+        print("Using local data...")
+        results = {source.level: calculate_hhi_from_local(source) for source in sources}
+    else:
+        print("Using online data...")
+        cache = ResponseCache(cache_dir, offline=cache_only)
+        results = scrape_and_calculate_hhi(sources, cache=cache)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for source in sources:
+        # Display and save the collected data
+        display_and_save_data(source, *results[source.level], output_dir=output_dir)
+    return results
@@ -0,0 +1,203 @@
+import os
+
+from .tables import find_table_rows
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class RegionSource:
+    """
+    Describes one level of the region hierarchy (countries, US states, Chinese provinces, ...).
+
+    A source knows where the city tables of its regions live on citypopulation.de, how to read them,
+    which curated CSV backs the local mode and how the HHI is computed and saved for that level.
+    New levels are added by creating a RegionSource (or a subclass overriding `url`/`parse_rows`)
+    and passing it to register_source.
+    """
+
+    def __init__(self, level, column, regions, url_pattern, table_ids, name_idx, population_idx,
+                 min_cells, exponent=2, online_top_n=None, local_top_n=None, local_sort=True,
+                 skip_header_rows=None, head_rows=None, thousands_separators=',',
+                 column_overrides=None, output_prefix=None, sort_output_by=None, include_top=False):
+        self.level = level                          # Name used on the command line, e.g. 'country'
+        self.column = column                        # Region column in the CSV files, e.g. 'Country'
+        self.regions = regions                      # {key used in the URL: region name}
+        self.url_pattern = url_pattern              # str.format pattern, see url()
+        self.table_ids = table_ids                  # IDs of the city table, tried in order
+        self.name_idx = name_idx                    # Column holding the city name
+        self.population_idx = population_idx        # Column holding the population
+        self.min_cells = min_cells                  # Rows with fewer cells are skipped
+        self.exponent = exponent                    # Power the population shares are raised to
+        self.online_top_n = online_top_n            # Largest cities kept from a scraped page
+        self.local_top_n = local_top_n              # Largest cities kept per region from the curated CSV
+        self.local_sort = local_sort                # Sort curated cities by population before the cut
+        self.skip_header_rows = skip_header_rows    # Read all <tr> minus this many header rows instead of <tbody>
+        self.head_rows = head_rows                  # Only read this many rows of the table, in page order
+        self.thousands_separators = thousands_separators
+        self.column_overrides = column_overrides or {}  # {region name: (name_idx, population_idx)}
+        self.output_prefix = output_prefix or level
+        self.sort_output_by = sort_output_by or column
+        self.include_top = include_top              # Add the number of cities used to the local HHI output
+
+    @property
+    def local_file(self):
+        """Path of the curated CSV shipped next to this module."""
+        return os.path.join(DATA_DIR, f'{self.output_prefix}_population_curated.csv')
+
+    # Function to build the citypopulation.de URL of a region page
+    def url(self, key, name):
+        """
+        Returns the URL of the city table page of a region. Besides {key} and {name}, the pattern
+        can use {slug} (lower case, spaces as underscores) and {compact} (lower case, no spaces).
+        """
+        slug = name.lower().replace(' ', '_')
+        compact = name.replace(' ', '').lower()
+        return self.url_pattern.format(key=key, name=name, slug=slug, compact=compact)
+
+    # Function to read the city rows out of a downloaded page
+    def parse_rows(self, content, name, backend=None, all_rows=False):
+        """
+        Returns a list of (city name, population) tuples read from the page `content`,
+        or None when the page has no city table. `backend` picks the HTML parser, see tables.py.
+        With `all_rows`, the whole table is read even when the level only uses its `head_rows`.
+        """
+        # Stream the rows of the city table only, stopping after `head_rows` rows when set
+        max_rows = None if all_rows else self.head_rows
+        if self.skip_header_rows is not None:
+            rows = find_table_rows(content, self.table_ids, tbody_only=False, skip_rows=self.skip_header_rows,
+                                   max_rows=max_rows, backend=backend)
+        else:
+            rows = find_table_rows(content, self.table_ids, max_rows=max_rows, backend=backend)
+        if rows is None:
+            return None
+
+        name_idx, population_idx = self.column_overrides.get(name, (self.name_idx, self.population_idx))
+        city_data = []
+        for cells in rows:
+            if len(cells) >= self.min_cells:  # Ensure there are enough columns in the row
+                city_name = cells[name_idx]
+                population = cells[population_idx]
+                for separator in self.thousands_separators:
+                    population = population.replace(separator, '')
+                city_data.append((city_name, int(population)))
+        return city_data
+
+    # Function to get the cities of a region that enter the online HHI
+    def parse(self, content, name):
+        """
+        Returns the city names and populations of a region page, largest first and cut to
+        `online_top_n` unless the table is read in page order (`head_rows`).
+        """
+        city_data = self.parse_rows(content, name)
+        if city_data is None:
+            print(f"No cities table found for {name}.")
+            return [], []
+        if self.head_rows is None:
+            city_data.sort(key=lambda x: x[1], reverse=True)
+            city_data = city_data[:self.online_top_n]
+        return [city[0] for city in city_data], [city[1] for city in city_data]
+
+
+# List of countries to scrape
+COUNTRIES = [
+    'USA', 'Canada', 'Mexico',
+    'Cuba', 'Haiti', 'Dom Rep', 'Jamaica', 'Guatemala', 'Honduras', 'El Salvador', 'Nicaragua', 'Costa Rica', 'Panama',
+    'Argentina', 'Brazil', 'Chile',
+    'Colombia', 'Ecuador', 'Peru', 'Paraguay', 'Venezuela', 'Uruguay',
+    'UK', 'Ireland', 'Iceland', 'Norway', 'Sweden', 'Finland', 'Denmark', 'Germany', 'France', 'Italy', 'Switzerland', 'Netherlands', 'Belgium', 'Spain', 'Portugal', 'Austria',
+    'Russia', 'Ukraine', 'Belarus', 'Poland', 'Lithuania', 'Latvia', 'Estonia', 'Moldova', 'Hungary', 'Czechrep', 'Slovakia', 'Slovenia',
+    'Croatia', 'Romania', 'Bulgaria', 'Serbia', 'Bosnia', 'Montenegro', 'North Macedonia', 'Albania', 'Greece', 'Luxembourg', 'Cyprus',
+    'Turkey', 'Armenia', 'Azerbaijan', 'Georgia', 'Kazakhstan',
+    'China', 'Japan', 'South Korea', 'North Korea', 'Mongolia', 'Thailand', 'Vietnam', 'Cambodia', 'Laos', 'Philippines', 'Myanmar', 'Indonesia', 'Malaysia',
+    'India', 'Pakistan', 'Bangladesh', 'Nepal', 'Sri Lanka', 'Afghanistan', 'Iran', 'Iraq', 'Saudi Arabia', 'Qatar', 'Syria', 'Israel',
+    'UAE', 'Jordan', 'Lebanon',
+    'Egypt', 'Ethiopia', 'Nigeria', 'South Africa',
+    'Australia', 'New Zealand',
+]
+
+# Dictionary of state codes and names for scraping
+STATES = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California',
+    'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware', 'FL': 'Florida', 'GA': 'Georgia',
+    'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois', 'IN': 'Indiana', 'IA': 'Iowa',
+    'KS': 'Kansas', 'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland',
+    'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota', 'MS': 'Mississippi',
+    'MO': 'Missouri', 'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada', 'NH': 'New Hampshire',
+    'NJ': 'New Jersey', 'NM': 'New Mexico', 'NY': 'New York', 'NC': 'North Carolina',
+    'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma', 'OR': 'Oregon', 'PA': 'Pennsylvania',
+    'RI': 'Rhode Island', 'SC': 'South Carolina', 'SD': 'South Dakota', 'TN': 'Tennessee',
+    'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont', 'VA': 'Virginia', 'WA': 'Washington',
+    'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming'
+}
+
+# List of provinces in China
+PROVINCES = [
+    # 'Beijing', 'Shanghai', 'Tianjin',
+    'Anhui', 'Chongqing', 'Fujian', 'Gansu', 'Guangdong', 'Guangxi', 'Guizhou',
+    'Hainan', 'Hebei', 'Heilongjiang', 'Henan', 'Hubei', 'Hunan', 'Jiangsu', 'Jiangxi',
+    'Jilin', 'Liaoning', 'Neimenggu', 'Ningxia', 'Qinghai', 'Shaanxi', 'Shandong',
+    'Shanxi', 'Sichuan', 'Xizang', 'Xinjiang', 'Yunnan', 'Zhejiang',
+    'Taiwan',
+    # 'Hong Kong', 'Macau',
+]
+
+
+COUNTRY = RegionSource(
+    level='country',
+    column='Country',
+    regions={country: country for country in COUNTRIES},
+    url_pattern="https://www.citypopulation.de/en/{compact}/cities",
+    table_ids=('tlc', 'tla'),
+    name_idx=1,                 # City name is in the second column
+    population_idx=3,           # Population is in the fourth column
+    min_cells=4,
+    exponent=3.1416,
+    skip_header_rows=1,
+    head_rows=8,                # The first 8 cities (excluding header row)
+    local_sort=False,           # All curated cities of a country enter the index, in file order
+    output_prefix='city',
+)
+
+STATE = RegionSource(
+    level='state',
+    column='State',
+    regions=STATES,
+    url_pattern="https://www.citypopulation.de/en/usa/ua/{key}__{slug}/",
+    table_ids=('ts',),
+    name_idx=0,                 # City name in the first column
+    population_idx=5,           # Population (2020) in the sixth column
+    min_cells=6,
+    exponent=2,
+    online_top_n=9,
+    local_top_n=6,
+)
+
+PROVINCE = RegionSource(
+    level='province',
+    column='Province',
+    regions={province: province for province in PROVINCES},
+    url_pattern="https://www.citypopulation.de/en/china/cities/{slug}/",
+    table_ids=('ts',),
+    name_idx=3,
+    population_idx=7,
+    min_cells=8,
+    exponent=2,
+    local_top_n=5,
+    thousands_separators=',.',
+    column_overrides={'Fujian': (2, 6)},    # The Fujian table has no prefecture column
+    sort_output_by='HHI',
+    include_top=True,
+)
+
+SOURCES = {}
+
+
+# Function to make a region source available to the CLI and pipeline.run
+def register_source(source):
+    """Registers `source` under its level name and returns it."""
+    SOURCES[source.level] = source
+    return source
+
+
+for _source in (COUNTRY, STATE, PROVINCE):
+    register_source(_source)
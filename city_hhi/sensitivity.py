@@ -0,0 +1,294 @@
+"""
+Sensitivity of the HHI rankings to the exponent and the top-N cut.
+
+For grids of exponents and top-N values, the HHI of every region x top-N x exponent is computed in
+one pass over the populations: the rows are ranked within their region once, the population powers
+of every exponent are summed per region and top-N bucket with one segmented sum, and a cumulative sum
+over the buckets gives every cut. 2440 combinations (61 exponents x 40 cuts) of 10^6 cities take
+about ten times one calculate_hhi_by_region call, instead of 2440 times.
+
+    python -m city_hhi sensitivity state --exponents 1.1:4:0.1 --top-n 2:20 all
+    python -m city_hhi sensitivity country --online --cache-only --exponents 2 3.1416 --top-n 5 8 10
+
+Populations come from the curated CSVs (or `--input`), or with --online from the cached pages of
+citypopulation.de (every row of the city table, not only the ones the online mode keeps). Writes per
+level <prefix>_hhi_sensitivity.csv (the cube with the rank of every region in every combination),
+<prefix>_rank_stability.csv (best, worst and spread of the rank of every region) and
+<prefix>_grid_stability.csv (Spearman correlation and top-k overlap of every combination with the
+level's own exponent and top-N, which are always added to the grid). An exponent of 1 gives every
+region an HHI of 100, so the default grid starts above it.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+from .cache import CACHE_DIR, ResponseCache
+from .hhi import calculate_hhi_by_region, rank_within_regions
+from .pipeline import fetch_region_pages
+from .regions import SOURCES
+
+BLOCK_CELLS = 10_000_000  # Rows x exponents raised to a power at once
+TOP_K = 10                # Size of the ranking compared by the top-k overlap
+RANK_DECIMALS = 9         # HHI equal to this many decimals tie
+ALL = np.iinfo(np.int64).max  # Top-N of 'all': every city of the region
+
+
+# Function to read a grid of values like '2 3.1416', '1:4:0.5' or '2:20'
+def parse_grid(values, kind=float):
+    """
+    Returns the sorted distinct values of a list of numbers, inclusive 'start:stop[:step]' ranges and,
+    for top-N grids, 'all' (returned as None, sorted last).
+    """
+    grid = set()
+    for value in values:
+        if value == 'all' and kind is int:
+            grid.add(None)
+        elif ':' in value:
+            start, stop, *step = (kind(part) for part in value.split(':'))
+            step = step[0] if step else 1
+            count = int(round((stop - start) / step)) + 1
+            grid.update(kind(round(start + i * step, 10)) for i in range(count))
+        else:
+            grid.add(kind(value))
+    return sorted(grid, key=lambda value: ALL if value is None else value)
+
+
+# Function to calculate the HHI of every region for every exponent and top-N at once
+def hhi_cube(data, region_col, exponents, top_ns, sort=True, population_col='Population', block_cells=BLOCK_CELLS):
+    """
+    Returns (regions, hhi, top): the regions in order of first appearance, the (regions x top-N x
+    exponents) array of HHI and the (regions x top-N) number of cities entering each index, for
+    the `top_ns` (None for all cities) and `exponents` in the order given.
+
+    Rows are ranked within their region once (largest first when `sort`, like
+    calculate_hhi_by_region) and every row is assigned to the bucket of the smallest top-N that
+    includes it. The populations (divided by the largest of their region, so that high exponents
+    don't overflow) are raised to every exponent and summed per region and bucket in one segmented
+    sum; cumulative sums over the buckets give the totals of every top-N.
+    """
+    exponents = np.asarray(exponents, dtype=np.float64)
+    ns = np.array([ALL if n is None else n for n in top_ns], dtype=np.int64)
+    by_n = np.argsort(ns, kind='stable')
+    sorted_ns = ns[by_n]
+    data = data[data[population_col].notna()]
+    codes, regions = pd.factorize(data[region_col], sort=False)
+    populations = data[population_col].to_numpy(dtype=np.int64)
+    n_regions, n_buckets = len(regions), len(ns)
+
+    max_n = int(sorted_ns[-1]) if len(ns) else 0
+    order, sorted_codes, rank = rank_within_regions(codes, populations, top_n=None if max_n == ALL else max_n,
+                                                    sort=sort)
+    values = populations[order]
+    bucket = np.searchsorted(sorted_ns, rank, side='right')
+    key = sorted_codes * n_buckets + bucket
+    segments = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.zeros(0, dtype=np.int64)
+    cells = (sorted_codes[segments], bucket[segments])
+
+    def bucket_sums(rows, dtype):
+        sums = np.zeros((n_regions, n_buckets) + rows.shape[1:], dtype=dtype)
+        if len(segments):
+            sums[cells] = np.add.reduceat(rows, segments, axis=0)
+        return np.cumsum(sums, axis=1)
+
+    totals = bucket_sums(values, np.int64)
+    top = bucket_sums(np.ones(len(values), dtype=np.int64), np.int64)
+    scale = np.ones(n_regions)
+    if len(values):
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        scale[sorted_codes[starts]] = np.maximum.reduceat(values, starts)
+    scale[scale == 0] = 1
+    scaled = values / scale[sorted_codes]
+    scaled_totals = totals / scale[:, None]
+
+    hhi = np.empty((n_regions, n_buckets, len(exponents)))
+    block = max(1, block_cells // max(1, len(values)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(exponents), block):
+            powers = exponents[start:start + block]
+            sums = bucket_sums(scaled[:, None] ** powers[None, :], np.float64)
+            hhi[:, :, start:start + block] = sums / scaled_totals[:, :, None] ** powers * 100
+
+    # Back from the sorted top-N to the order given
+    position = np.empty_like(by_n)
+    position[by_n] = np.arange(n_buckets)
+    return regions, hhi[:, position], top[:, position]
+
+
+# Function to rank the regions in every combination
+def rank_regions(hhi, decimals=RANK_DECIMALS):
+    """
+    Returns the ranks (1 = most concentrated) of an array of regions x combinations. Regions whose
+    HHI are equal once rounded to `decimals` share the best rank of the tie (1, 2, 2, 4).
+    """
+    values = np.round(hhi, decimals)
+    order = np.argsort(-values, axis=0, kind='stable')
+    ordered = np.take_along_axis(values, order, axis=0)
+    new = np.ones(ordered.shape, dtype=bool)
+    new[1:] = ordered[1:] != ordered[:-1]
+    first = np.maximum.accumulate(np.where(new, np.arange(len(hhi))[:, None], 0), axis=0)
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, first + 1, axis=0)
+    return ranks
+
+
+# Function to measure how much the rankings move across the grid
+def rank_stability(ranks, baseline, top_k=TOP_K):
+    """
+    `ranks` is regions x combinations. Returns the (regions x 5) array of baseline, best and worst
+    rank, spread and standard deviation of every region, and for every combination its Spearman
+    correlation and top-k overlap with the ranking of combination `baseline`.
+    """
+    best, worst = ranks.min(axis=1), ranks.max(axis=1)
+    per_region = np.c_[ranks[:, baseline], best, worst, worst - best, ranks.std(axis=1)]
+
+    centered = ranks - ranks.mean(axis=0)
+    reference = centered[:, baseline:baseline + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spearman = (centered * reference).sum(axis=0) / np.sqrt((centered ** 2).sum(axis=0) * (reference ** 2).sum())
+    top_k = min(top_k, len(ranks))
+    in_top = ranks <= top_k
+    overlap = (in_top & in_top[:, baseline:baseline + 1]).sum(axis=0) / top_k if top_k else np.ones(ranks.shape[1])
+    return per_region, spearman, overlap
+
+
+# Function to get the city populations of a level
+def load_populations(source, use_local=True, cache=None, file_path=None):
+    """
+    Returns a DataFrame of region, 'City' and 'Population', and whether the rows are ranked by
+    population (the local mode's sort, or the page order of tables read with `head_rows`).
+    """
+    if use_local:
+        with metrics.timer('read'):
+            data = pd.read_csv(file_path or source.local_file, dtype={source.column: str})
+        return data, source.local_sort
+    rows = []
+    for _, _, name, page in fetch_region_pages([source], cache=cache):
+        try:
+            if isinstance(page, Exception):
+                raise page
+            with metrics.timer('parse'):
+                city_data = source.parse_rows(page, name, all_rows=True) or []
+            rows.extend((name, city, population) for city, population in city_data)
+        except Exception as e:
+            print(f"Error with {name}: {e}")
+    return pd.DataFrame(rows, columns=[source.column, 'City', 'Population']), source.head_rows is None
+
+
+# Function to build the sensitivity tables of a level
+def sensitivity(source, data, exponents, top_ns, sort=True, baseline=None, top_k=TOP_K):
+    """
+    Returns (cube_df, region_df, grid_df) for the `exponents` x `top_ns` grid. `baseline` is the
+    (exponent, top-N) the rankings are compared with; the first combination when it is not in the grid.
+    """
+    with metrics.timer('hhi'):
+        regions, hhi, top = hhi_cube(data, source.column, exponents, top_ns, sort=sort)
+    combinations = [(exponent, n) for n in top_ns for exponent in exponents]  # Order of hhi.reshape(regions, -1)
+    flat = hhi.reshape(len(regions), -1)
+    ranks = rank_regions(flat)
+    reference = combinations.index(baseline) if baseline in combinations else 0
+    per_region, spearman, overlap = rank_stability(ranks, reference, top_k)
+
+    labels = [('all' if n is None else n) for _, n in combinations]
+    cube_df = pd.DataFrame({
+        source.column: np.repeat(np.asarray(regions, dtype=object), len(combinations)),
+        'Exponent': np.tile([exponent for exponent, _ in combinations], len(regions)),
+        'TopN': np.tile(np.array(labels, dtype=object), len(regions)),
+        'HHI': flat.ravel(),
+        'Top': np.repeat(top, len(exponents), axis=1).ravel(),
+        'Rank': ranks.ravel(),
+    })
+    region_df = pd.DataFrame(per_region, columns=['BaselineRank', 'BestRank', 'WorstRank', 'Spread', 'RankStd'])
+    region_df[['BaselineRank', 'BestRank', 'WorstRank', 'Spread']] = \
+        region_df[['BaselineRank', 'BestRank', 'WorstRank', 'Spread']].astype(np.int64)
+    region_df.insert(0, source.column, np.asarray(regions, dtype=object))
+    region_df['MinHHI'], region_df['MaxHHI'] = np.nanmin(flat, axis=1), np.nanmax(flat, axis=1)
+    region_df = region_df.sort_values(['Spread', 'BaselineRank'], ascending=[False, True], kind='stable')
+    grid_df = pd.DataFrame({
+        'Exponent': [exponent for exponent, _ in combinations],
+        'TopN': labels,
+        'Spearman': spearman,
+        f'Top{min(top_k, len(regions))}Overlap': overlap,
+        'Baseline': np.arange(len(combinations)) == reference,
+    })
+    return cube_df, region_df.reset_index(drop=True), grid_df
+
+
+# Main function to run the sensitivity analysis of several hierarchy levels
+def run_sensitivity(sources, exponents, top_ns, use_local=True, cache_only=False, cache_dir=CACHE_DIR,
+                    file_path=None, output_dir='.'):
+    """Computes and saves the sensitivity tables of every source. Returns {level: (cube, regions, grid)}."""
+    os.makedirs(output_dir, exist_ok=True)
+    cache = None if use_local else ResponseCache(cache_dir, offline=cache_only)
+    results = {}
+    for source in sources:
+        data, sort = load_populations(source, use_local, cache, file_path)
+        if data.empty:
+            print(f"{source.level}: no city data.")
+            continue
+        default_n = source.local_top_n if use_local else \
+            (source.online_top_n if source.online_top_n is not None else source.head_rows)
+        # The level's own parameters are always part of the grid, as the baseline of the comparisons
+        level_exponents = parse_grid([repr(float(value)) for value in {*exponents, source.exponent}])
+        level_top_ns = sorted({*top_ns, default_n}, key=lambda value: ALL if value is None else value)
+
+        start = time.perf_counter()
+        cube_df, region_df, grid_df = sensitivity(source, data, level_exponents, level_top_ns, sort,
+                                                  (source.exponent, default_n))
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        calculate_hhi_by_region(data, source.column, source.exponent, top_n=default_n, sort=sort)
+        single = time.perf_counter() - start
+
+        prefix = source.output_prefix
+        for suffix, df in (('hhi_sensitivity', cube_df), ('rank_stability', region_df), ('grid_stability', grid_df)):
+            with metrics.timer('write'):
+                df.to_csv(os.path.join(output_dir, f'{prefix}_{suffix}.csv'), index=False)
+        baseline = grid_df[grid_df['Baseline']].iloc[0]
+        print(f"{source.level}: {len(grid_df)} combinations of {len(region_df)} regions in {elapsed:.3f} s "
+              f"({elapsed / single:.1f}x one calculate_hhi_by_region pass), "
+              f"baseline exponent {baseline['Exponent']:g} top-N {baseline['TopN']}")
+        print(f"  Spearman with the baseline: min {grid_df['Spearman'].min():.3f}, "
+              f"median {grid_df['Spearman'].median():.3f}")
+        print("  Least stable regions:")
+        print(region_df.head(5).to_string(index=False))
+        print(f"  Saved to '{prefix}_hhi_sensitivity.csv', '{prefix}_rank_stability.csv' and "
+              f"'{prefix}_grid_stability.csv'.")
+        results[source.level] = (cube_df, region_df, grid_df)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m city_hhi sensitivity', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('levels', nargs='*', metavar='level',
+                        help=f"Hierarchy levels: all, {', '.join(SOURCES)} (default: all)")
+    parser.add_argument('--exponents', nargs='+', default=['1.25:4:0.25'],
+                        help="Exponents and 'start:stop:step' ranges (default: 1.25:4:0.25)")
+    parser.add_argument('--top-n', nargs='+', default=['2:20', 'all'],
+                        help="Top-N values, 'start:stop' ranges and 'all' (default: 2:20 all)")
+    parser.add_argument('--online', action='store_true', help='Use the pages of citypopulation.de')
+    parser.add_argument('--cache-only', action='store_true', help='Online mode served only from the page cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help=f'Directory of the page cache (default: {CACHE_DIR})')
+    parser.add_argument('--input', help='CSV read instead of the curated CSV (one level only)')
+    parser.add_argument('--output-dir', default='.', help='Directory the CSV files are written to')
+    args = parser.parse_args(argv)
+    unknown = set(args.levels) - {'all', *SOURCES}
+    if unknown:
+        parser.error(f"unknown level(s): {', '.join(sorted(unknown))}")
+    levels = list(SOURCES) if not args.levels or 'all' in args.levels else args.levels
+    sources = [SOURCES[level] for level in dict.fromkeys(levels)]
+    if args.input and (args.online or len(sources) != 1):
+        parser.error('--input needs the local mode and a single level')
+    try:
+        exponents, top_ns = parse_grid(args.exponents), parse_grid(args.top_n, int)
+    except ValueError as e:
+        parser.error(f"invalid grid: {e}")
+    if not exponents or not top_ns:
+        parser.error('empty grid')
+
+    run_sensitivity(sources, exponents, top_ns, use_local=not args.online, cache_only=args.cache_only,
+                    cache_dir=args.cache_dir, file_path=args.input, output_dir=args.output_dir)
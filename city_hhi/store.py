@@ -0,0 +1,209 @@
+"""
+Embedded SQLite store of the city populations and HHI results, for ad-hoc questions ("top cities of
+province X", "regions with an HHI above Y in year Z") without re-reading the CSVs with pandas.
+
+    python -m city_hhi --store city_hhi.sqlite             # Compute the HHI and load the store
+    python -m city_hhi query city_hhi.sqlite top province Anhui -k 5
+    python -m city_hhi query city_hhi.sqlite hhi state --min 20 --year 2020
+    python -m city_hhi query city_hhi.sqlite city country London
+
+Every query is answered from an index: cities by (level, region, year, population) and (level, city),
+HHI by (level, year, exponent, HHI) and (level, region, year, exponent). Undated rows (the curated
+CSVs and single-year runs) have a NULL year.
+"""
+import argparse
+import os
+import sqlite3
+
+import pandas as pd
+
+from . import metrics
+from .regions import SOURCES
+from .timeseries import CITY_DATASET, HHI_DATASET
+
+STORE_FILE = 'city_hhi.sqlite'
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cities (
+    level TEXT NOT NULL, region TEXT NOT NULL, city TEXT NOT NULL, year INTEGER, population INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS cities_by_region ON cities (level, region, year, population DESC);
+CREATE INDEX IF NOT EXISTS cities_by_name ON cities (level, city);
+CREATE TABLE IF NOT EXISTS hhi (
+    level TEXT NOT NULL, region TEXT NOT NULL, year INTEGER, exponent REAL NOT NULL, hhi REAL NOT NULL, top INTEGER);
+CREATE INDEX IF NOT EXISTS hhi_by_value ON hhi (level, year, exponent, hhi);
+CREATE UNIQUE INDEX IF NOT EXISTS hhi_by_region ON hhi (level, region, year, exponent);
+"""
+
+
+# Function to get a column of integers as a list, with None for missing values or a missing column
+def _optional_ints(df, column):
+    if column not in df:
+        return [None] * len(df)
+    return [None if pd.isna(value) else int(value) for value in df[column].tolist()]
+
+
+class CityStore:
+    """
+    City populations and HHI per level of the region hierarchy in an SQLite file. The load methods
+    replace the rows of a level (and year) in one transaction; the query methods return lists of tuples.
+    """
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    # Function to get the exponent a level's HHI is queried with by default
+    def _exponent(self, level, exponent):
+        if exponent is not None:
+            return float(exponent)
+        if level in SOURCES:
+            return float(SOURCES[level].exponent)
+        row = self.connection.execute('SELECT MIN(exponent) FROM hhi WHERE level = ?', (level,)).fetchone()
+        return row[0]
+
+    # Function to replace the cities of a level
+    def load_cities(self, level, data, region_col):
+        """
+        Stores the rows of `data` (columns `region_col`, 'City', 'Population' and optionally 'Year')
+        as the cities of `level`, replacing the ones of the same years.
+        """
+        years = _optional_ints(data, 'Year')
+        rows = zip([level] * len(data), data[region_col].astype(str), data['City'].astype(str), years,
+                   data['Population'].astype('int64').tolist())
+        with self.connection:
+            for year in set(years):
+                self.connection.execute('DELETE FROM cities WHERE level = ? AND year IS ?', (level, year))
+            self.connection.executemany('INSERT INTO cities VALUES (?, ?, ?, ?, ?)', rows)
+
+    # Function to replace the HHI of a level
+    def load_hhi(self, level, hhi_df, region_col, exponent=None):
+        """
+        Stores `hhi_df` (columns `region_col` and 'HHI', optionally 'Top', 'Year' and 'Exponent', as
+        written by the pipeline and the time series) as the HHI of `level`, replacing the rows of the
+        same years. `exponent` is used when the frame has no 'Exponent' column.
+        """
+        n = len(hhi_df)
+        years = _optional_ints(hhi_df, 'Year')
+        exponents = hhi_df['Exponent'].astype(float).tolist() if 'Exponent' in hhi_df else \
+            [self._exponent(level, exponent)] * n
+        rows = zip([level] * n, hhi_df[region_col].astype(str), years, exponents,
+                   hhi_df['HHI'].astype(float).tolist(), _optional_ints(hhi_df, 'Top'))
+        with self.connection:
+            for year in set(years):
+                self.connection.execute('DELETE FROM hhi WHERE level = ? AND year IS ?', (level, year))
+            self.connection.executemany('INSERT INTO hhi VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    # Function to look up a city
+    def city(self, level, city, region=None):
+        """Returns the (region, city, year, population) rows of the cities named `city` of `level`."""
+        if region is None:
+            return self.connection.execute(
+                'SELECT region, city, year, population FROM cities WHERE level = ? AND city = ?',
+                (level, city)).fetchall()
+        return self.connection.execute(
+            'SELECT region, city, year, population FROM cities WHERE level = ? AND city = ? AND region = ?',
+            (level, city, region)).fetchall()
+
+    # Function to get the largest cities of a region
+    def top_cities(self, level, region, k=10, year=None):
+        """Returns the `k` largest (city, population) of `region`, largest first."""
+        return self.connection.execute(
+            'SELECT city, population FROM cities WHERE level = ? AND region = ? AND year IS ? '
+            'ORDER BY population DESC LIMIT ?', (level, region, year, k)).fetchall()
+
+    # Function to look up the HHI of a region
+    def region_hhi(self, level, region, year=None, exponent=None):
+        """Returns the HHI of `region` (with the level's exponent by default), or None."""
+        row = self.connection.execute(
+            'SELECT hhi FROM hhi WHERE level = ? AND region = ? AND year IS ? AND exponent = ?',
+            (level, region, year, self._exponent(level, exponent))).fetchone()
+        return row[0] if row else None
+
+    # Function to find the regions whose HHI is in a range
+    def hhi_between(self, level, low=None, high=None, year=None, exponent=None):
+        """Returns the (region, HHI, top) of the regions with low <= HHI <= high, by increasing HHI."""
+        return self.connection.execute(
+            'SELECT region, hhi, top FROM hhi WHERE level = ? AND year IS ? AND exponent = ? '
+            'AND hhi >= ? AND hhi <= ? ORDER BY hhi',
+            (level, year, self._exponent(level, exponent), float('-inf') if low is None else low,
+             float('inf') if high is None else high)).fetchall()
+
+
+# Function to load the outputs of a run into the store
+def update_store(path, sources, output_dir='.', use_local=True, timeseries=False):
+    """
+    Loads the results written to `output_dir` by pipeline.run / run_incremental (or, with
+    `timeseries`, the Parquet datasets of run_timeseries) into the store at `path`. In local mode
+    the cities come from the curated CSVs in full, not only the ones entering the index.
+    """
+    with CityStore(path) as store:
+        for source in sources:
+            try:
+                if timeseries:
+                    filters = [('level', '=', source.level)]
+                    hhi_df = pd.read_parquet(os.path.join(output_dir, HHI_DATASET), filters=filters)
+                    city_df = pd.read_parquet(os.path.join(output_dir, CITY_DATASET), filters=filters)
+                    hhi_df = hhi_df.rename(columns={'Region': source.column, 'year': 'Year'})
+                    city_df = city_df.rename(columns={'Region': source.column, 'year': 'Year'})
+                else:
+                    prefix = source.output_prefix
+                    hhi_df = pd.read_csv(os.path.join(output_dir, f'{prefix}_hhi_data.csv'),
+                                         dtype={source.column: str})
+                    city_path = source.local_file if use_local else \
+                        os.path.join(output_dir, f'{prefix}_population_data.csv')
+                    city_df = pd.read_csv(city_path, dtype={source.column: str})
+            except Exception as e:
+                print(f"Error with {source.level}: {e}")
+                continue
+            with metrics.timer('store'):
+                store.load_hhi(source.level, hhi_df, source.column, source.exponent)
+                store.load_cities(source.level, city_df, source.column)
+            print(f"{source.level}: {len(hhi_df)} HHI rows and {len(city_df)} cities loaded into '{path}'.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m city_hhi query', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('store', help='SQLite file written by python -m city_hhi --store')
+    commands = parser.add_subparsers(dest='command', required=True)
+    top = commands.add_parser('top', help='Largest cities of a region')
+    top.add_argument('level')
+    top.add_argument('region')
+    top.add_argument('-k', type=int, default=10, help='Number of cities')
+    hhi = commands.add_parser('hhi', help='Regions by HHI range, or the HHI of one region')
+    hhi.add_argument('level')
+    hhi.add_argument('region', nargs='?')
+    hhi.add_argument('--min', type=float, help='Lowest HHI')
+    hhi.add_argument('--max', type=float, help='Highest HHI')
+    hhi.add_argument('--exponent', type=float, help='Exponent (default: the exponent of the level)')
+    city = commands.add_parser('city', help='Population of a city')
+    city.add_argument('level')
+    city.add_argument('city')
+    city.add_argument('--region')
+    for command in (top, hhi):
+        command.add_argument('--year', type=int, help='Year of a time series (default: undated data)')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.store):
+        parser.error(f"no store at '{args.store}'")
+    with CityStore(args.store) as store:
+        if args.command == 'top':
+            rows = store.top_cities(args.level, args.region, args.k, args.year)
+        elif args.command == 'hhi' and args.region:
+            rows = [(args.region, store.region_hhi(args.level, args.region, args.year, args.exponent))]
+        elif args.command == 'hhi':
+            rows = store.hhi_between(args.level, args.min, args.max, args.year, args.exponent)
+        else:
+            rows = store.city(args.level, args.city, args.region)
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
+
@@ -0,0 +1,167 @@
+"""
+Streaming local mode for city tables too large to load at once (e.g. the millions of GeoNames
+settlements), with memory bounded by regions x top-N instead of rows.
+
+The CSV is read in chunks of the three columns used, regions are replaced by integer codes and
+populations by int64. Regions are read as strings and factorized into codes that stay the same
+across chunks (RegionCodes), rather than read as a categorical dtype: pandas gives every chunk its
+own sorted categories, which then have to be remapped anyway, and reading 10^7 rows took 38 s
+instead of 24 s. After every chunk only the rows that can still enter the index are kept: the
+largest `top_n` cities of every region seen so far (the first `top_n` when the level is not sorted),
+selected with one vectorized rank over the kept rows and the chunk. The HHI of the kept rows is the
+same as calculate_hhi_from_local on the whole file.
+
+Levels without a top-N cut (every city enters the index) keep running sums of the populations and
+of the populations raised to the exponent per region instead, so the HHI is 100 * sum(p^e) / (sum p)^e
+(equal to the in-memory result up to floating point rounding), and their city rows are written to
+the output as the chunks are read.
+
+    python -m city_hhi state --stream --input allCountries.csv --chunksize 1000000
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+from .hhi import calculate_hhi_by_region, rank_within_regions
+from .pipeline import _select_columns, display_and_save_data
+
+CHUNK_ROWS = 1_000_000
+
+
+class RegionCodes:
+    """Integer codes of region names in order of first appearance, across chunks."""
+
+    def __init__(self):
+        self.names = []
+        self._codes = {}
+
+    # Function to get the codes of a column of region names
+    def encode(self, column):
+        """Returns the int64 codes of the regions of `column`, adding the new ones in order of appearance."""
+        chunk_codes, uniques = pd.factorize(column, sort=False)
+        known = np.empty(len(uniques), dtype=np.int64)
+        for i, name in enumerate(uniques):
+            code = self._codes.get(name)
+            if code is None:
+                code = self._codes[name] = len(self.names)
+                self.names.append(name)
+            known[i] = code
+        return known[chunk_codes]
+
+
+# Function to read a city CSV in chunks with compact dtypes
+def read_chunks(file_path, region_col, chunksize=CHUNK_ROWS, population_col='Population'):
+    """
+    Yields DataFrames of up to `chunksize` rows of region, city and integer population. The region
+    column is read as str, not category (see the module docstring); RegionCodes turns it into codes.
+    """
+    reader = pd.read_csv(file_path, usecols=[region_col, 'City', population_col], chunksize=chunksize,
+                         dtype={region_col: str, 'City': str})
+    while True:
+        with metrics.timer('read'):
+            chunk = next(reader, None)
+            if chunk is None:
+                return
+            chunk = chunk[chunk[population_col].notna() & chunk[region_col].notna()]
+            chunk[population_col] = chunk[population_col].astype(np.int64)
+        metrics.count('rows_read', len(chunk))
+        yield chunk
+
+
+# Function to calculate the HHI of a large CSV with a bounded top-N per region
+def stream_hhi_top_n(source, file_path, top_n, chunksize=CHUNK_ROWS):
+    """
+    Returns the (hhi_df, city_df) of calculate_hhi_from_local for a level with a top-N cut, reading
+    `file_path` in chunks and keeping at most `top_n` cities per region in memory.
+    """
+    regions = RegionCodes()
+    codes = np.zeros(0, dtype=np.int64)
+    populations = np.zeros(0, dtype=np.int64)
+    cities = np.zeros(0, dtype=object)
+    for chunk in read_chunks(file_path, source.column, chunksize):
+        with metrics.timer('hhi'):
+            # Kept rows come first: they precede the chunk in the file, which decides ties
+            codes = np.r_[codes, regions.encode(chunk[source.column])]
+            populations = np.r_[populations, chunk['Population'].to_numpy()]
+            order, _, _ = rank_within_regions(codes, populations, top_n=top_n, sort=source.local_sort)
+            kept = len(cities)
+            cities = np.r_[cities, np.zeros(len(chunk), dtype=object)]
+            from_chunk = order[order >= kept]
+            cities[from_chunk] = chunk['City'].iloc[from_chunk - kept].to_numpy(dtype=object)
+            codes, populations, cities = codes[order], populations[order], cities[order]
+
+    names = np.array(regions.names, dtype=object)
+    data = pd.DataFrame({source.column: names[codes], 'City': cities, 'Population': populations})
+    with metrics.timer('hhi'):
+        hhi_df, city_df = calculate_hhi_by_region(data, source.column, exponent=source.exponent, top_n=top_n,
+                                                  sort=source.local_sort)
+    return _select_columns(source, hhi_df, city_df)
+
+
+# Function to calculate the HHI of a large CSV whose every city enters the index
+def stream_hhi_all(source, file_path, city_path, chunksize=CHUNK_ROWS):
+    """
+    Returns the HHI DataFrame of a level without a top-N cut from running per-region sums, writing
+    the city rows to `city_path` chunk by chunk (in file order, not grouped by region).
+    """
+    regions = RegionCodes()
+    totals = np.zeros(0, dtype=np.int64)
+    powers = np.zeros(0, dtype=np.float64)
+    counts = np.zeros(0, dtype=np.int64)
+    try:
+        with open(city_path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+            pd.DataFrame(columns=[source.column, 'City', 'Population']).to_csv(f, index=False)
+            for chunk in read_chunks(file_path, source.column, chunksize):
+                with metrics.timer('hhi'):
+                    codes = regions.encode(chunk[source.column])
+                    size = len(regions.names)
+                    values = chunk['Population'].to_numpy()
+                    totals = np.r_[totals, np.zeros(size - len(totals), dtype=np.int64)]
+                    powers = np.r_[powers, np.zeros(size - len(powers))]
+                    counts = np.r_[counts, np.zeros(size - len(counts), dtype=np.int64)]
+                    np.add.at(totals, codes, values)
+                    np.add.at(powers, codes, values.astype(np.float64) ** source.exponent)
+                    counts += np.bincount(codes, minlength=size)
+                with metrics.timer('write'):
+                    chunk[[source.column, 'City', 'Population']].to_csv(f, header=False, index=False)
+                metrics.count('rows_written', len(chunk))
+    except BaseException:
+        os.remove(city_path + '.tmp')  # Don't leave a partial city file behind
+        raise
+    os.replace(city_path + '.tmp', city_path)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hhi = powers / totals.astype(np.float64) ** source.exponent * 100
+    hhi_df = pd.DataFrame({source.column: regions.names, 'HHI': hhi, 'Top': counts})
+    return _select_columns(source, hhi_df, pd.DataFrame(columns=[source.column, 'City', 'Population']))[0]
+
+
+# Main function to compute several hierarchy levels from large CSVs
+def run_streaming(sources, file_path=None, chunksize=CHUNK_ROWS, output_dir='.'):
+    """
+    Writes the outputs of pipeline.run in local mode, reading `file_path` (the curated CSV of every
+    source by default) in chunks of `chunksize` rows. Levels with a top-N cut give the same files;
+    levels without one (country) give HHI equal up to the last bits, from running sums, and city rows
+    in file order instead of grouped by region. Returns {level: hhi DataFrame}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    for source in sources:
+        path = file_path or source.local_file
+        print(f"Streaming {path} in chunks of {chunksize:,} rows...")
+        try:
+            if source.local_top_n is not None:
+                hhi_df, city_df = stream_hhi_top_n(source, path, source.local_top_n, chunksize)
+                display_and_save_data(source, hhi_df, city_df, output_dir=output_dir)
+            else:
+                city_path = os.path.join(output_dir, f'{source.output_prefix}_population_data.csv')
+                hhi_df = stream_hhi_all(source, path, city_path, chunksize)
+                display_and_save_data(source, hhi_df, [], output_dir=output_dir)
+                print(f"City population data saved to '{source.output_prefix}_population_data.csv'.")
+        except Exception as e:
+            print(f"Error reading file {path}: {e}")
+            continue
+        results[source.level] = hhi_df
+    return results
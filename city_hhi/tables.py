@@ -0,0 +1,252 @@
+"""
+Streaming extraction of table rows from HTML pages.
+
+Pages are fed to an event based parser in chunks and the rows of the target table are yielded as
+soon as they are complete. Parsing stops at the end of the target table, or as soon as `max_rows`
+rows were yielded, so the rest of a large page is never tokenized. lxml is used when installed,
+otherwise the standard library html.parser.
+
+The table is chosen like BeautifulSoup's `find('table', id=a) or find('table', id=b)`: the first
+table with the first id of `table_ids` that the page has. Rows of a table whose id is not the first
+one are held back until the end of the page, in case a table with a preferred id follows. Unlike
+BeautifulSoup's `find_all`, the rows and texts of tables nested in the target table are skipped.
+"""
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional
+    etree = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _RowCollector:
+    """
+    Tracks the position inside the target table and assembles its rows from start/end/text events.
+    Rows are lists of the stripped text of their <td> cells. The <th> texts of the first header row
+    are kept apart in `header`, with runs of whitespace collapsed. With `tbody_only`, only the rows
+    of the first <tbody> are read, like BeautifulSoup's `table.find('tbody')`.
+    """
+
+    def __init__(self, table_ids, tbody_only):
+        self.priorities = {}
+        for table_id in table_ids:
+            self.priorities.setdefault(table_id, len(self.priorities))
+        self.tbody_only = tbody_only
+        self.rows = []          # Completed rows of the target table not yet handed out
+        self.header = None      # <th> texts of the first header row of the table
+        self.found = False      # A target table was opened
+        self.table_id = None    # id of the target table
+        self.priority = None    # Position of that id in `table_ids`; 0 means no other table can replace it
+        self.has_tbody = False  # The target table has a <tbody>
+        self.done = False       # The target table was closed and no other can replace it
+        self._table_depth = 0   # Depth of nested <table> elements inside the target table (1 = target)
+        self._in_tbody = False
+        self._row = None
+        self._header_row = None
+        self._cell = None
+        self._cell_is_header = False
+
+    # Function to start collecting a table, dropping the rows of a less preferred one
+    def _select(self, table_id):
+        self.table_id = table_id
+        self.priority = self.priorities[table_id]
+        self.found = True
+        self.rows, self.header, self.has_tbody = [], None, False
+        self._table_depth = 1
+        self._in_tbody = False
+        self._row = self._header_row = self._cell = None
+
+    def start(self, tag, attrs_id):
+        if self.done:
+            return
+        if tag == 'table':
+            if self._table_depth:
+                self._table_depth += 1
+            elif attrs_id in self.priorities and (self.priority is None or self.priorities[attrs_id] < self.priority):
+                self._select(attrs_id)
+            return
+        if self._table_depth != 1:
+            return
+        if tag in ('td', 'th', 'tr', 'tbody', 'thead', 'tfoot'):
+            self._close_implicit(tag)
+        if tag == 'tbody':
+            self._in_tbody = not (self.tbody_only and self.has_tbody)
+            self.has_tbody = True
+        elif tag == 'tr' and (self._in_tbody or not self.tbody_only):
+            self._row = []
+        elif tag == 'td' and self._row is not None:
+            self._cell = []
+            self._cell_is_header = False
+        elif tag == 'th' and self.header is None:
+            self._header_row = self._header_row if self._header_row is not None else []
+            self._cell = []
+            self._cell_is_header = True
+
+    # Function to close cells and rows whose end tag was omitted, as HTML allows
+    def _close_implicit(self, tag):
+        if self._cell is not None:
+            self._close_cell()
+        if tag != 'td' and tag != 'th':
+            self._close_row()
+
+    # Function to store the text of the open cell in its row
+    def _close_cell(self):
+        if self._cell_is_header:
+            self._header_row.append(' '.join(' '.join(self._cell).split()))
+        else:
+            self._row.append(''.join(self._cell).strip())
+        self._cell = None
+
+    # Function to store the open row
+    def _close_row(self):
+        if self._header_row is not None:
+            self.header = self._header_row
+            self._header_row = None
+        if self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def end(self, tag):
+        if self.done or not self._table_depth:
+            return
+        if tag == 'table':
+            if self._table_depth == 1:
+                self._close_implicit(tag)
+            self._table_depth -= 1
+            if not self._table_depth and self.priority == 0:
+                self.done = True
+            return
+        if self._table_depth != 1:
+            return
+        if tag == 'tbody':
+            self._close_implicit(tag)
+            self._in_tbody = False
+        elif tag in ('td', 'th') and self._cell is not None:
+            self._close_cell()
+        elif tag == 'tr':
+            self._close_row()
+
+    def data(self, text):
+        if self._cell is not None and self._table_depth == 1:
+            self._cell.append(text)
+
+
+class _StdlibParser(HTMLParser):
+    """html.parser backend forwarding events to a _RowCollector."""
+
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs).get('id') if tag == 'table' else None)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+class _LxmlTarget:
+    """lxml parser target forwarding events to a _RowCollector."""
+
+    def __init__(self, collector):
+        self.collector = collector
+
+    def start(self, tag, attrib):
+        self.collector.start(tag, attrib.get('id') if tag == 'table' else None)
+
+    def end(self, tag):
+        self.collector.end(tag)
+
+    def data(self, text):
+        self.collector.data(text)
+
+    def close(self):
+        return None
+
+
+# Function to create a parser feeding the collector
+def _make_parser(collector, backend):
+    if backend == 'lxml':
+        if etree is None:
+            raise ImportError("the 'lxml' backend needs lxml to be installed")
+        return etree.HTMLParser(target=_LxmlTarget(collector))
+    return _StdlibParser(collector)
+
+
+# Function to run the parser over the page and hand out the completed rows
+def _stream(content, collector, backend, skip_rows, max_rows, chunk_size):
+    backend = backend or ('lxml' if etree is not None else 'html.parser')
+    parser = _make_parser(collector, backend)
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='replace')
+
+    seen = 0
+    yielded = 0
+    offsets = list(range(0, len(content), chunk_size)) + [None]
+    for offset in offsets:
+        if offset is None:
+            parser.close()  # Flush the events of the last chunk
+        else:
+            parser.feed(content[offset:offset + chunk_size])
+        if collector.priority != 0 and offset is not None:
+            continue  # A table with a preferred id may still come
+        for row in collector.rows:
+            if max_rows is not None and yielded >= max_rows:
+                return
+            seen += 1
+            if seen <= skip_rows:
+                continue
+            yield row
+            yielded += 1
+        collector.rows.clear()
+        if max_rows is not None and yielded >= max_rows:
+            return
+        if collector.done:
+            break
+    if collector.found and collector.tbody_only and not collector.has_tbody:
+        raise ValueError(f"table '{collector.table_id}' has no <tbody>")
+
+
+# Function to stream the rows of a table out of an HTML page
+def iter_table_rows(content, table_ids, tbody_only=True, skip_rows=0, max_rows=None, backend=None,
+                    chunk_size=CHUNK_SIZE):
+    """
+    Yields the rows of the first table with the first id of `table_ids` found in the page, as lists
+    of <td> texts.
+
+    With `tbody_only` only rows inside the first <tbody> are read (ValueError when the table has
+    none), otherwise every <tr> of the table after the first `skip_rows` ones. At most `max_rows`
+    rows are yielded. `backend` is 'lxml' or 'html.parser' (default: lxml when installed).
+    """
+    collector = _RowCollector(table_ids, tbody_only)
+    yield from _stream(content, collector, backend, skip_rows, max_rows, chunk_size)
+
+
+# Function to read the header and rows of a table out of an HTML page
+def find_table(content, table_ids, tbody_only=True, skip_rows=0, max_rows=None, backend=None,
+               chunk_size=CHUNK_SIZE):
+    """
+    Same as iter_table_rows but returns a tuple (header, rows), where `header` holds the <th> texts
+    of the first header row (or None), or None when the page has no matching table.
+    """
+    collector = _RowCollector(table_ids, tbody_only)
+    rows = list(_stream(content, collector, backend, skip_rows, max_rows, chunk_size))
+    if not rows and not collector.found:
+        return None
+    return collector.header, rows
+
+
+# Function to read the rows of a table out of an HTML page
+def find_table_rows(content, table_ids, tbody_only=True, skip_rows=0, max_rows=None, backend=None,
+                    chunk_size=CHUNK_SIZE):
+    """
+    Same as iter_table_rows but returns a list, or None when the page has no matching table.
+    """
+    table = find_table(content, table_ids, tbody_only=tbody_only, skip_rows=skip_rows, max_rows=max_rows,
+                       backend=backend, chunk_size=chunk_size)
+    return table[1] if table is not None else None
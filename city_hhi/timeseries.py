@@ -0,0 +1,164 @@
+"""
+Multi-year HHI batch mode.
+
+citypopulation.de tables list one population column per census or estimate year. This mode reads
+every year column of every region page in one parse, computes the HHI of every region x year x
+exponent in one vectorized pass and writes the results as a Parquet dataset partitioned by level
+and year, so a reader interested in one year or one level only opens those files:
+
+    hhi_timeseries/level=state/year=2020/....parquet
+    city_timeseries/level=state/year=2020/....parquet
+
+Writing and reading the dataset needs pyarrow.
+"""
+import os
+import re
+
+import pandas as pd
+
+from . import metrics
+from .cache import CACHE_DIR, ResponseCache
+from .hhi import calculate_hhi_by_group
+from .pipeline import fetch_region_pages
+from .tables import find_table
+
+HHI_DATASET = 'hhi_timeseries'
+CITY_DATASET = 'city_timeseries'
+YEAR_PATTERN = re.compile(r'(?<!\d)(1[89]\d\d|20\d\d)(?!\d)')
+POPULATION_PATTERN = re.compile(r'pop|census|estimate', re.IGNORECASE)
+
+
+# Function to find the population columns of a table header
+def year_columns(header):
+    """
+    Returns a list of (year, column index) for the header cells naming a population of a year,
+    e.g. 'Population Census 2010-04-01' or 'Population (2020)'. The first column of a year wins.
+    """
+    columns = {}
+    for idx, text in enumerate(header or []):
+        match = YEAR_PATTERN.search(text)
+        if match and POPULATION_PATTERN.search(text):
+            columns.setdefault(int(match.group(1)), idx)
+    return sorted(columns.items())
+
+
+# Function to read the population of every year out of a region page
+def parse_year_rows(source, content, name):
+    """
+    Returns a list of (region name, city name, year, population) tuples with one entry per city and
+    year column of the page. Missing values ('...', empty cells) are skipped. Returns None when
+    the page has no city table or no year columns.
+    """
+    tbody_only = source.skip_header_rows is None
+    table = find_table(content, source.table_ids, tbody_only=tbody_only,
+                       skip_rows=source.skip_header_rows or 0)
+    if table is None:
+        return None
+    header, rows = table
+    columns = year_columns(header)
+    if not columns:
+        return None
+
+    name_idx = source.column_overrides.get(name, (source.name_idx, source.population_idx))[0]
+    records = []
+    for cells in rows:
+        if len(cells) < source.min_cells:
+            continue
+        for year, idx in columns:
+            if idx >= len(cells):
+                continue
+            population = cells[idx]
+            for separator in source.thousands_separators:
+                population = population.replace(separator, '')
+            if population.isdigit():
+                records.append((name, cells[name_idx], year, int(population)))
+    return records
+
+
+# Function to calculate the HHI of every region, year and exponent of a level
+def calculate_hhi_timeseries(source, data, exponents=None):
+    """
+    `data` is a DataFrame with the region column of `source`, 'City', 'Year' and 'Population'.
+    The largest `online_top_n` (or `head_rows`) cities of every region and year enter the index.
+    Returns the long HHI DataFrame (region, 'Year', 'Exponent', 'HHI', 'Top') and the cities used.
+    """
+    exponents = exponents or [source.exponent]
+    top_n = source.online_top_n if source.online_top_n is not None else source.head_rows
+    return calculate_hhi_by_group(data, [source.column, 'Year'], exponents=exponents, top_n=top_n)
+
+
+# Function to write one level to the partitioned datasets
+def write_timeseries(source, hhi_df, city_df, output_dir='.'):
+    """
+    Appends the results of `source` to the Parquet datasets of `output_dir`, partitioned by level and year.
+    Existing partitions of the same level and year are replaced.
+    """
+    for dataset, df in ((HHI_DATASET, hhi_df), (CITY_DATASET, city_df)):
+        df = df.rename(columns={source.column: 'Region', 'Year': 'year'})
+        # Sorted by region, so row group statistics let readers skip other regions
+        df = df.sort_values(['year', 'Region'], kind='stable').reset_index(drop=True)
+        df['level'] = source.level
+        df.to_parquet(os.path.join(output_dir, dataset), partition_cols=['level', 'year'], index=False,
+                      existing_data_behavior='delete_matching')
+    print(f"{source.level}: {hhi_df['Year'].nunique()} years of HHI saved to '{HHI_DATASET}/level={source.level}'.")
+
+
+# Function to read a slice of a dataset
+def read_timeseries(output_dir='.', level=None, year=None, regions=None, dataset=HHI_DATASET):
+    """
+    Reads the HHI (or, with dataset=CITY_DATASET, city) time series, opening only the partitions of
+    `level` and `year` and skipping row groups of other `regions` when these are given. The partition
+    columns come back as plain columns: 'level' as strings and 'year' as integers.
+    """
+    filters = []
+    if level is not None:
+        filters.append(('level', '=', level))
+    if year is not None:
+        filters.append(('year', '=', int(year)))
+    if regions is not None:
+        filters.append(('Region', 'in', list(regions)))
+    data = pd.read_parquet(os.path.join(output_dir, dataset), filters=filters or None)
+    # Hive partition columns are read as categoricals
+    data['level'] = data['level'].astype(str)
+    data['year'] = data['year'].astype('int64')
+    return data
+
+
+# Main function to compute the time series of several hierarchy levels
+def run_timeseries(sources, exponents=None, cache_only=False, cache_dir=CACHE_DIR, output_dir='.'):
+    """
+    Downloads (or reads from the cache) the pages of every source, computes the HHI of every
+    region x year x exponent and writes the partitioned datasets. Returns {level: hhi DataFrame}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cache = ResponseCache(cache_dir, offline=cache_only)
+    pages = fetch_region_pages(sources, cache=cache)
+
+    records = {source.level: [] for source in sources}
+    for source, key, name, page in pages:
+        try:
+            if isinstance(page, Exception):
+                raise page
+            with metrics.timer('parse'):
+                rows = parse_year_rows(source, page, name)
+            metrics.count('pages_parsed')
+            metrics.count('rows_parsed', len(rows or ()))
+            if rows:
+                records[source.level].extend(rows)
+            else:
+                print(f"Could not find yearly population data for {name}. Skipping...")
+        except Exception as e:
+            print(f"Error with {name}: {e}")
+
+    results = {}
+    for source in sources:
+        data = pd.DataFrame(records[source.level], columns=[source.column, 'City', 'Year', 'Population'])
+        if data.empty:
+            continue
+        with metrics.timer('hhi'):
+            hhi_df, city_df = calculate_hhi_timeseries(source, data, exponents)
+        with metrics.timer('write'):
+            write_timeseries(source, hhi_df, city_df[[source.column, 'City', 'Year', 'Population']], output_dir)
+        metrics.count('rows_written', len(hhi_df) + len(city_df))
+        results[source.level] = hhi_df
+    return results
@@ -0,0 +1,8 @@
+"""
+Python tools for the world trade map: the country list of chart.js, the net import/export aggregation
+and the treemap layout.
+"""
+from .countries import COUNTRIES_FILE, continent_groups, read_countries
+from .netport import clean_port_data, fetch_trade_data, get_netport_data, net_trade, oec_url, trade_matrix
+from .templates import Template, compile_template, load_template, open_template
+from .treemap import layout_map, layout_maps, treemap_leaves, treemaps
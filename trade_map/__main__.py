@@ -0,0 +1,34 @@
+"""
+Command line entry point.
+
+    python -m trade_map netport --hs HS4 --years 2023          # One JSON file per country
+    python -m trade_map netport --hs HS6 --years 1995-2023 --group world
+    python -m trade_map build --hs HS4 HS6 --years 1995-2023 --groupings countries continents
+    python -m trade_map layout netports/HS4/2023 --year 2023 --hs HS4 --output worldtrademap_2023.svg
+    python -m trade_map frames netports/HS4 --years 1995-2022 --hs HS4 --output wtm_1995_2022.gif
+    python -m trade_map tiles worldtrademap_2023.svg --output tiles/2023
+    python -m trade_map serve --port 8765 --build-dir build
+"""
+import sys
+
+from . import build, frames, netport, service, tiles, treemap
+
+COMMANDS = {
+    'netport': netport.main,
+    'build': build.main,
+    'layout': treemap.main,
+    'frames': frames.main,
+    'tiles': tiles.main,
+    'serve': service.main,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        raise SystemExit(__doc__.strip() + f"\n\nCommands: {', '.join(COMMANDS)}")
+    COMMANDS[argv[0]](argv[1:])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Treemap layout benchmark: a line-by-line port of d3's treemap/treemapSquarify (the code behind the
+rawgraphs treemap of chart.js) versus the layout of treemap.py, one map at a time (tiled on Python floats)
+and all maps as one batch (tiled with array operations), at HS4 or HS6 granularity.
+
+    python -m trade_map.bench_layout                  # HS6, every code of the template as a leaf
+    python -m trade_map.bench_layout --hs HS4 --maps 200
+
+The single-map and batched layouts must return the same rectangles as the port.
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from .layout import map_geometry
+from .templates import load_template
+from .treemap import MARGIN, PADDING, PHI, _div, _max, treemap, treemaps
+
+
+# Function to round like Math.round
+def _round(value):
+    return math.floor(value + 0.5) if math.isfinite(value) else value
+
+
+class _Node:
+    def __init__(self, value=0.0, children=None, index=None):
+        self.value = value
+        self.children = children
+        self.index = index
+        self.x0 = self.y0 = self.x1 = self.y1 = 0.0
+
+
+# Function to position a row of nodes left to right (d3.treemapDice)
+def _dice(nodes, value, x0, y0, x1, y1):
+    k = _div(x1 - x0, value) if value else 0
+    for node in nodes:
+        node.y0, node.y1 = y0, y1
+        node.x0 = x0
+        x0 += node.value * k
+        node.x1 = x0
+
+
+# Function to position a row of nodes top to bottom (d3.treemapSlice)
+def _slice(nodes, value, x0, y0, x1, y1):
+    k = _div(y1 - y0, value) if value else 0
+    for node in nodes:
+        node.x0, node.x1 = x0, x1
+        node.y0 = y0
+        y0 += node.value * k
+        node.y1 = y0
+
+
+# Function to tile the children of a node (d3.squarifyRatio)
+def squarify_reference(parent, x0, y0, x1, y1, ratio=PHI):
+    nodes = parent.children
+    i0 = i1 = 0
+    n = len(nodes)
+    value = parent.value
+    while i0 < n:
+        dx, dy = x1 - x0, y1 - y0
+        while True:
+            sum_value = nodes[i1].value
+            i1 += 1
+            if sum_value or i1 >= n:
+                break
+        min_value = max_value = sum_value
+        alpha = _div(_max(_div(dy, dx), _div(dx, dy)), value * ratio)
+        beta = sum_value * sum_value * alpha
+        min_ratio = _max(_div(max_value, beta), _div(beta, min_value))
+        while i1 < n:
+            node_value = nodes[i1].value
+            sum_value += node_value
+            if node_value < min_value:
+                min_value = node_value
+            if node_value > max_value:
+                max_value = node_value
+            beta = sum_value * sum_value * alpha
+            new_ratio = _max(_div(max_value, beta), _div(beta, min_value))
+            if new_ratio > min_ratio:
+                sum_value -= node_value
+                break
+            min_ratio = new_ratio
+            i1 += 1
+        row = nodes[i0:i1]
+        if dx < dy:
+            row_y1 = y0 + _div(dy * sum_value, value) if dy else y1
+            _dice(row, sum_value, x0, y0, x1, row_y1)
+            y0 = row_y1
+        else:
+            row_x1 = x0 + _div(dx * sum_value, value) if dx else x1
+            _slice(row, sum_value, x0, y0, row_x1, y1)
+            x0 = row_x1
+        value -= sum_value
+        i0 = i1
+
+
+# Function to lay out a treemap the way d3.treemap does
+def treemap_reference(values, groups, width, height, padding=PADDING, ratio=PHI):
+    """Same arguments and result as treemap.treemap, computed node by node like d3."""
+    # d3.rollup: nested Maps in order of first appearance
+    root = {}
+    for i, value in enumerate(values):
+        level = root
+        for keys in groups:
+            level = level.setdefault(keys[i], {})
+        level.setdefault(None, []).append(i)
+
+    def build(level):
+        if None in level:
+            return [_Node(float(values[i]), index=i) for i in level[None]]
+        nodes = []
+        for child in level.values():
+            children = build(child)
+            total = 0.0
+            for node in children:
+                total += node.value
+            nodes.append(_Node(total, children))
+        return nodes
+
+    children = build(root)
+    total = 0.0
+    for node in children:
+        total += node.value
+    tree = _Node(total, children)
+    tree.x1, tree.y1 = float(width), float(height)
+
+    leaves = []
+
+    def position(node, pad):
+        x0, y0, x1, y1 = node.x0 + pad, node.y0 + pad, node.x1 - pad, node.y1 - pad
+        if x1 < x0:
+            x0 = x1 = (x0 + x1) / 2
+        if y1 < y0:
+            y0 = y1 = (y0 + y1) / 2
+        node.x0, node.y0, node.x1, node.y1 = x0, y0, x1, y1
+        if not node.children:
+            leaves.append(node)
+            return
+        inner = padding / 2
+        x0, y0, x1, y1 = x0 + padding - inner, y0 + padding - inner, x1 - (padding - inner), y1 - (padding - inner)
+        if x1 < x0:
+            x0 = x1 = (x0 + x1) / 2
+        if y1 < y0:
+            y0 = y1 = (y0 + y1) / 2
+        squarify_reference(node, x0, y0, x1, y1, ratio)
+        for child in node.children:
+            position(child, inner)
+
+    position(tree, 0)
+    return (np.array([leaf.index for leaf in leaves]),) + tuple(
+        np.array([_round(getattr(leaf, edge)) for leaf in leaves]) for edge in ('x0', 'y0', 'x1', 'y1'))
+
+
+# Function to make maps of random trade over every code of a template
+def make_synthetic_maps(template, n_maps, seed=0):
+    """Returns a list of (values, groups, width, height) with a log-normal trade value per template row."""
+    rng = np.random.default_rng(seed)
+    groups = [template.section_ids, template.columns['HS2 ID']]
+    maps = []
+    for _ in range(n_maps):
+        values = np.floor(rng.lognormal(8, 2.5, len(template)) + 0.5)
+        values[rng.random(len(template)) < 0.1] = 0
+        geometry = map_geometry({'netImport': values.sum(), 'netExport': values.sum()}, 2020)['treemaps']['import']
+        maps.append((values, groups, geometry['width'] - 2 * MARGIN, geometry['height'] - 2 * MARGIN))
+    return maps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hs', default='HS6', choices=['HS4', 'HS6'], help='HS granularity')
+    parser.add_argument('--maps', type=int, default=20, help='Number of treemaps to lay out')
+    args = parser.parse_args()
+
+    template = load_template(args.hs)
+    maps = make_synthetic_maps(template, args.maps)
+    print(f"{args.maps} {args.hs} treemaps of {len(template)} leaves")
+
+    results = {}
+    runs = (('d3 port', lambda: [treemap_reference(*treemap_args) for treemap_args in maps]),
+            ('single map', lambda: [treemap(*treemap_args) for treemap_args in maps]),
+            ('batched', lambda: treemaps(maps)))
+    for label, func in runs:
+        start = time.perf_counter()
+        results[label] = func()
+        elapsed = time.perf_counter() - start
+        results[label + ' time'] = elapsed
+        print(f"  {label:<12} {elapsed * 1000 / len(maps):9.2f} ms per treemap  "
+              f"{len(maps) * len(template) / elapsed:12,.0f} leaves/s")
+
+    for label in ('single map', 'batched'):
+        same = all(all(np.array_equal(a, b, equal_nan=True) for a, b in zip(reference, fast))
+                   for reference, fast in zip(results['d3 port'], results[label]))
+        print(f"  {label} speedup {results['d3 port time'] / results[label + ' time']:.1f}x, "
+              f"{'same rectangles' if same else 'RECTANGLES DIFFER'}")
+
+
+if __name__ == '__main__':
+    main()
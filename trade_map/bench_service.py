@@ -0,0 +1,160 @@
+"""
+Load test of the HTTP service: client threads send a mix of HHI and net-trade queries over
+keep-alive connections and the latency percentiles and throughput are reported per query kind.
+
+    python -m trade_map.bench_service                         # In-process service, HHI queries only
+    python -m trade_map.bench_service --build-dir build --hs HS4 --year 2023   # With net-trade queries
+    python -m trade_map.bench_service --url http://127.0.0.1:8765 --clients 16 --requests 20000
+
+`--distinct` sets how many different queries are drawn from, and so the share of LRU cache hits.
+For comparison, `--subprocess N` times N runs of `python -m city_hhi`, which dashboards call today.
+"""
+import argparse
+import http.client
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+import numpy as np
+
+from city_hhi.cache import CACHE_DIR
+from city_hhi.regions import SOURCES
+
+from .service import TradeService, make_server
+
+
+# Function to draw the queries of the load test
+def make_queries(service, n_distinct, hsx=None, year=None, seed=0):
+    """
+    Returns a list of (kind, path) with random region subsets, exponents and top-N of every level,
+    and, when `year` is given, net-trade queries of random country groups.
+    """
+    rng = np.random.default_rng(seed)
+    regions = {level: data[SOURCES[level].column].unique() for level, data in service.cities.items()}
+    queries = []
+    for i in range(n_distinct):
+        if year is not None and i % 4 == 3:
+            countries = rng.choice(service.countries, rng.integers(1, 20), replace=False)
+            queries.append(('netport', '/netport?' + urlencode({'hs': hsx, 'year': year,
+                                                                'countries': ','.join(countries)})))
+            continue
+        level = list(regions)[i % len(regions)]
+        params = {'level': level, 'exponent': float(rng.choice([1.5, 2, 2.5, 3])), 'top': int(rng.choice([3, 5, 10]))}
+        if rng.random() < 0.8:
+            subset = rng.choice(regions[level], min(len(regions[level]), rng.integers(1, 10)), replace=False)
+            params['regions'] = ','.join(subset)
+        queries.append(('hhi', '/hhi?' + urlencode(params)))
+    return queries
+
+
+# Function to send requests from one client thread
+def run_client(host, port, requests, latencies, errors):
+    """Sends the (kind, path) `requests` one after the other and appends (kind, seconds) to `latencies`."""
+    connection = http.client.HTTPConnection(host, port)
+    for kind, path in requests:
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f"status {response.status}")
+        except Exception as e:
+            errors.append(f"{path}: {e}")
+            connection.close()
+            connection = http.client.HTTPConnection(host, port)
+            continue
+        latencies.append((kind, time.perf_counter() - start))
+    connection.close()
+
+
+# Function to run the load test
+def load_test(host, port, queries, n_requests, n_clients, seed=1):
+    """Returns the (kind, seconds) latencies, the errors and the wall time of `n_requests` random queries."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(queries), n_requests)
+    latencies, errors = [], []
+    threads = [threading.Thread(target=run_client, args=(host, port, [queries[i] for i in picks[c::n_clients]],
+                                                         latencies, errors))
+               for c in range(n_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+# Function to time the command line the dashboards call today
+def time_subprocess(runs):
+    """Returns the seconds of each run of `python -m city_hhi` writing into a temporary directory."""
+    times = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-m', 'city_hhi', '--output-dir', directory], check=True,
+                           stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Service to test (default: start one in this process)')
+    parser.add_argument('--build-dir', help="Build directory of the in-process service's net trade")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='Response cache of the in-process service')
+    parser.add_argument('--hs', default='HS4', choices=['HS4', 'HS6'], help='HS granularity of net-trade queries')
+    parser.add_argument('--year', type=int, help='Year of net-trade queries (default: no net-trade queries)')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent client threads')
+    parser.add_argument('--requests', type=int, default=5000, help='Requests in total')
+    parser.add_argument('--distinct', type=int, default=500, help='Different queries the requests are drawn from')
+    parser.add_argument('--subprocess', type=int, default=0, help='Runs of python -m city_hhi to compare with')
+    args = parser.parse_args()
+
+    server = None
+    # The queries are drawn from the regions of the curated CSVs, read by a local service in any case
+    start = time.perf_counter()
+    service = TradeService(args.build_dir, args.cache_dir)
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port
+    else:
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address[:2]
+        print(f"In-process service started in {time.perf_counter() - start:.2f} s")
+    queries = make_queries(service, args.distinct, args.hs, args.year)
+
+    try:
+        latencies, errors, elapsed = load_test(host, port, queries, args.requests, args.clients)
+        connection = http.client.HTTPConnection(host, port)
+        connection.request('GET', '/stats')
+        stats = json.loads(connection.getresponse().read())
+        connection.close()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    print(f"{len(latencies)} requests from {args.clients} clients in {elapsed:.2f} s: "
+          f"{len(latencies) / elapsed:,.0f} req/s, {len(errors)} errors")
+    for kind in sorted({kind for kind, _ in latencies}):
+        values = np.array([seconds for k, seconds in latencies if k == kind]) * 1000
+        p50, p99 = np.percentile(values, [50, 99])
+        print(f"  {kind:<8} {len(values):7d} requests  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+    cache = stats['cache']
+    print(f"  LRU: {cache['hits']} hits, {cache['misses']} misses, {cache['size']} entries")
+    for error in errors[:5]:
+        print(f"  Error with {error}")
+
+    if args.subprocess:
+        times = time_subprocess(args.subprocess)
+        print(f"python -m city_hhi: {np.median(times) * 1000:.0f} ms per run (median of {len(times)})")
+
+
+if __name__ == '__main__':
+    main()
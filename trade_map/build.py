@@ -0,0 +1,404 @@
+"""
+Parallel build of the trade maps of many years, HS granularities and country groupings.
+
+A build is a DAG of jobs, each writing one artifact under the build directory:
+
+    fetch      <hsx>/<year>/trade/<oec code>.npy            net trade of a country over the template rows
+    aggregate  <hsx>/<year>/netport/<members hash>.json     getNetportData result of a list of countries
+    layout     <hsx>/<year>/layout/<members hash>.json      map geometry with the treemap leaves, written
+               <hsx>/<year>/layout/batch-<hash>.json        in batches of the aggregates of the same groupings
+    render     <hsx>/<year>/<grouping>.svg                  the maps of all groups of a grouping
+
+The data of a country and year is fetched once however many groups contain it, and groups with the
+same members share their aggregate and layout. The maps are laid out in batches, which is several times
+faster than one map at a time (see bench_layout): one batch for the maps shown by the same groupings,
+so a render only waits for its own maps and a failed country only holds back the groupings that show
+it. Fetch jobs run on threads (they wait on the network);
+the other jobs run on a process pool sized to the cores. Artifacts are written atomically, so after a
+crash or an interrupt the next run skips every job whose artifact exists.
+
+    python -m trade_map build --hs HS4 HS6 --years 1995-2023 --groupings countries continents
+    python -m trade_map build --groups groups.json --groupings Islands_Landlocked_Coastal
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+import requests
+
+from city_hhi.cache import CACHE_DIR, ResponseCache
+from city_hhi.fetcher import MAX_WORKERS, fetch
+
+from .countries import COUNTRIES_FILE, continent_groups, read_countries
+from .netport import get_netport_data, net_trade, oec_url, parse_years
+from .render import WORLD_MAP_SIZE, render_leaves, render_map, render_svg, svg_id
+from .templates import load_template
+from .treemap import layout_maps
+
+STAGES = ('fetch', 'aggregate', 'layout', 'render')
+BUILD_DIR = 'build'
+GROUP_GAP = 20  # px between the maps of a grouping other than 'countries'
+REPORT_INTERVAL = 5  # seconds between progress lines
+
+
+class Job:
+    """A unit of the build: `func(*args)` writes `artifact` once every job of `deps` is done."""
+
+    def __init__(self, key, stage, artifact, func, args, deps=()):
+        self.key = key
+        self.stage = stage
+        self.artifact = artifact
+        self.func = func
+        self.args = args
+        self.deps = list(deps)
+
+
+# Function to write an artifact so that it either exists complete or not at all
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(data)
+    os.replace(f"{path}.tmp", path)
+
+
+# Function to write a JSON artifact
+def _write_json(path, value):
+    _write_atomic(path, json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+
+# Function to read a JSON artifact
+def _read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Function to tell errors that will happen again on every run from transient ones
+def _is_permanent(error):
+    """A client error status (other than timeouts and rate limits) or a body that is not a JSON object."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return 400 <= status < 500 and status not in (408, 429)
+    return isinstance(error, (ValueError, AttributeError)) and not isinstance(error, requests.RequestException)
+
+
+# Function to download the trade of one country and year and reduce it to its net trade vector
+def fetch_job(template, oec_code, year, artifact, cache=None):
+    """
+    Writes the net trade (imports - exports, in 1k USD) of the country over the template rows as .npy.
+    A country without import or export data, or whose data cannot be read (a 4xx status or a body
+    that is not JSON), gets an empty array, like the countries chart.js skips. Other download errors
+    (network, 5xx, cache-only misses) fail the job, so that it is retried by the next run.
+    """
+    rows = []
+    for port in ('Import', 'Export'):
+        url = oec_url(template.hsx, oec_code, port, year)
+        try:
+            data = json.loads(fetch(url, cache=cache)).get('data')
+        except Exception as e:
+            if not _is_permanent(e):
+                raise
+            print(f"Error with {url}: {e}")
+            data = None
+        rows.append(data if isinstance(data, list) else None)
+    index, matrix = net_trade(template, {(oec_code, year): tuple(rows)})
+    vector = matrix[0] if index else np.zeros(0)
+    buffer = io.BytesIO()
+    np.save(buffer, vector)
+    _write_atomic(artifact, buffer.getvalue())
+
+
+# Function to aggregate the net imports and exports of a list of countries
+def aggregate_job(template, members, year, artifact):
+    """`members` is a list of (OEC code, fetch artifact). Writes the getNetportData result (or null)."""
+    index, vectors = {}, []
+    for oec_code, path in members:
+        vector = np.load(path)
+        if len(vector):
+            index[(oec_code, year)] = len(vectors)
+            vectors.append(vector)
+    matrix = np.array(vectors) if vectors else np.zeros((0, len(template)))
+    netport = get_netport_data(template, (index, matrix), [oec_code for oec_code, _ in members], year)
+    _write_json(artifact, netport)
+
+
+# Function to lay out the maps of a batch of aggregates
+def layout_job(members, year, artifact):
+    """
+    `members` is a list of (aggregate artifact, layout artifact). Writes the layout of every aggregate
+    (or null) and then `artifact`, the list of layout artifacts, which marks the batch as done.
+    """
+    netports = [_read_json(netport_path) for netport_path, _ in members]
+    layouts = iter(layout_maps([netport for netport in netports if netport], year))
+    for netport, (_, path) in zip(netports, members):
+        _write_json(path, next(layouts) if netport else None)
+    _write_json(artifact, [path for _, path in members])
+
+
+# Function to draw all maps of a grouping into one SVG
+def render_job(grouping, placements, hsx, year, artifact, size=None):
+    """
+    `placements` is a list of (group name, map id, aggregate artifact, layout artifact, x, y); x and y
+    of None place the map to the right of the previous one. `size` is the canvas size, or None to fit the maps.
+    """
+    body, right, bottom = '', 0, 0
+    for name, map_id, netport_path, layout_path, x, y in placements:
+        layout = _read_json(layout_path)
+        if layout is None:
+            continue
+        netport = _read_json(netport_path)
+        if x is None:
+            x, y = right + (GROUP_GAP if right else 0), 0
+        leaves = {port: render_leaves(f'{map_id}_nt{port[:2]}', netport[key], hsx, layout['treemaps'][port])
+                  for port, key in (('import', 'netImportData'), ('export', 'netExportData'))}
+        body += render_map(name, map_id, layout, year, x, y, leaves)
+        right, bottom = max(right, x + layout['width']), max(bottom, y + layout['height'])
+    width, height = size or (right, bottom)
+    _write_atomic(artifact, render_svg(width, height, body).encode('utf-8'))
+
+
+# Function to read the groupings of a build
+def load_groupings(names, countries, groups_file=None):
+    """
+    Returns {grouping: {group: [OEC codes]}} for the grouping `names`. 'countries' (every country on
+    its own, placed like the world map) and 'continents' (the continent rows of the countries file)
+    are built in; others come from `groups_file`, a JSON file of {grouping: {group: [OEC or ISO2 codes]}}.
+    """
+    custom = _read_json(groups_file) if groups_file else {}
+    by_iso2 = {country['iso2']: country['oec_code'] for country in countries}
+    groupings = {}
+    for name in names:
+        if name == 'countries':
+            groupings[name] = {country['oec_code']: [country['oec_code']] for country in countries}
+        elif name == 'continents':
+            groupings[name] = continent_groups(countries)
+        elif name in custom:
+            groupings[name] = {group: [by_iso2.get(code, code) for code in codes]
+                               for group, codes in custom[name].items()}
+        else:
+            raise ValueError(f"Unknown grouping '{name}'")
+    return groupings
+
+
+# Function to turn the requested maps into a DAG of jobs
+def plan_jobs(hsxs, years, groupings, countries, build_dir=BUILD_DIR, cache=None):
+    """Returns a dict of {job key: Job} in dependency order."""
+    by_oec = {country['oec_code']: country for country in countries}
+    jobs = {}
+    for hsx in hsxs:
+        template = load_template(hsx)
+        for year in years:
+            year_dir = os.path.join(build_dir, hsx, str(year))
+            users, layouts, grouping_placements = {}, {}, {}
+            for grouping, groups in groupings.items():
+                placements = []
+                for group, members in groups.items():
+                    for oec_code in members:
+                        key = ('fetch', hsx, year, oec_code)
+                        if key not in jobs:
+                            path = os.path.join(year_dir, 'trade', f'{oec_code}.npy')
+                            jobs[key] = Job(key, 'fetch', path, fetch_job, (template, oec_code, year, path, cache))
+
+                    # Groups with the same members share their aggregate and layout
+                    digest = hashlib.sha1(' '.join(members).encode('utf-8')).hexdigest()[:16]
+                    fetches = [('fetch', hsx, year, oec_code) for oec_code in members]
+                    aggregate_key = ('aggregate', hsx, year, digest)
+                    if aggregate_key not in jobs:
+                        path = os.path.join(year_dir, 'netport', f'{digest}.json')
+                        inputs = [(key[3], jobs[key].artifact) for key in fetches]
+                        jobs[aggregate_key] = Job(aggregate_key, 'aggregate', path, aggregate_job,
+                                                  (template, inputs, year, path), fetches)
+                    netport_path = jobs[aggregate_key].artifact
+                    layout_path = layouts[aggregate_key] = os.path.join(year_dir, 'layout', f'{digest}.json')
+                    users.setdefault(aggregate_key, {})[grouping] = None
+
+                    if grouping == 'countries' and group in by_oec:
+                        country = by_oec[group]
+                        x = country['continent_x'] + country['x_offset']
+                        y = country['continent_y'] + country['y_offset']
+                        placements.append((country['name'], re.sub(r'\W', '', country['iso2']),
+                                           netport_path, layout_path, x, y))
+                    else:
+                        placements.append((group, svg_id(group), netport_path, layout_path, None, None))
+
+                grouping_placements[grouping] = placements
+
+            # One layout batch for the aggregates used by the same groupings, so that a render only waits
+            # for the layouts of its own maps; its name changes with the aggregates it covers
+            batches, grouping_layouts = {}, {grouping: [] for grouping in groupings}
+            for aggregate_key, aggregate_users in users.items():
+                batches.setdefault(tuple(aggregate_users), []).append(aggregate_key)
+            for batch_users, aggregate_keys in batches.items():
+                members = [(jobs[key].artifact, layouts[key]) for key in aggregate_keys]
+                batch = hashlib.sha1(' '.join(path for _, path in members).encode('utf-8')).hexdigest()[:16]
+                layout_key = ('layout', hsx, year, batch)
+                path = os.path.join(year_dir, 'layout', f'batch-{batch}.json')
+                jobs[layout_key] = Job(layout_key, 'layout', path, layout_job, (members, year, path), aggregate_keys)
+                for grouping in batch_users:
+                    grouping_layouts[grouping].append(layout_key)
+
+            for grouping, placements in grouping_placements.items():
+                key = ('render', hsx, year, grouping)
+                path = os.path.join(year_dir, f'{svg_id(grouping)}.svg')
+                size = WORLD_MAP_SIZE if grouping == 'countries' else None
+                jobs[key] = Job(key, 'render', path, render_job, (grouping, placements, hsx, year, path, size),
+                                grouping_layouts[grouping])
+    return jobs
+
+
+class Progress:
+    """Counts the jobs of every stage and prints progress lines and a throughput summary."""
+
+    def __init__(self, jobs, interval=REPORT_INTERVAL):
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.stats = {stage: {'total': 0, 'resumed': 0, 'done': 0, 'failed': 0, 'first': None, 'last': None}
+                      for stage in STAGES}
+        for job in jobs.values():
+            self.stats[job.stage]['total'] += 1
+
+    def resumed(self, job):
+        self.stats[job.stage]['resumed'] += 1
+
+    def blocked(self, job):
+        self.stats[job.stage]['failed'] += 1
+
+    def finished(self, job, ok, started):
+        stats = self.stats[job.stage]
+        stats['done' if ok else 'failed'] += 1
+        now = time.perf_counter()
+        stats['first'] = started if stats['first'] is None else min(stats['first'], started)
+        stats['last'] = now
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    # Function to print one progress line
+    def report(self):
+        parts = []
+        for stage, stats in self.stats.items():
+            if stats['total']:
+                completed = stats['resumed'] + stats['done'] + stats['failed']
+                parts.append(f"{stage} {completed}/{stats['total']}")
+        print(f"[{time.perf_counter() - self.start:7.1f}s] " + ', '.join(parts))
+
+    # Function to print the per-stage throughput
+    def summary(self):
+        print(f"{'stage':<10} {'total':>7} {'resumed':>8} {'run':>7} {'failed':>7} {'seconds':>9} {'jobs/s':>8}")
+        for stage, stats in self.stats.items():
+            elapsed = (stats['last'] - stats['first']) if stats['first'] is not None else 0.0
+            rate = stats['done'] / elapsed if elapsed else 0.0
+            print(f"{stage:<10} {stats['total']:>7} {stats['resumed']:>8} {stats['done']:>7} {stats['failed']:>7} "
+                  f"{elapsed:>9.2f} {rate:>8.1f}")
+        print(f"Wall time {time.perf_counter() - self.start:.2f} s")
+
+
+# Function to run a DAG of jobs
+def run_jobs(jobs, workers=None, resume=True, force=(), progress=None):
+    """
+    Runs `jobs` (from plan_jobs) with fetch jobs on threads and the others on a process pool of
+    `workers` processes (default: one per core). With `resume`, jobs whose artifact exists are skipped,
+    except those of the stages in `force` and everything downstream of them. A failed job fails the
+    jobs depending on it; the others go on. Returns the set of failed job keys.
+    """
+    progress = progress or Progress(jobs)
+    dependents = {key: [] for key in jobs}
+    for key, job in jobs.items():
+        for dep in job.deps:
+            dependents[dep].append(key)
+
+    stale = {key for key, job in jobs.items() if not resume or job.stage in force or not os.path.exists(job.artifact)}
+    for key in list(jobs):  # Keys are in dependency order, so one pass propagates staleness downstream
+        if any(dep in stale for dep in jobs[key].deps):
+            stale.add(key)
+    for key in jobs:
+        if key not in stale:
+            progress.resumed(jobs[key])
+
+    waiting = {key: sum(dep in stale for dep in jobs[key].deps) for key in stale}
+    failed = set()
+    with ProcessPoolExecutor(workers or os.cpu_count()) as processes, ThreadPoolExecutor(MAX_WORKERS) as threads:
+        running = {}
+
+        def submit(key):
+            job = jobs[key]
+            pool = threads if job.stage == 'fetch' else processes
+            running[pool.submit(job.func, *job.args)] = (key, time.perf_counter())
+
+        for key in [key for key, count in waiting.items() if count == 0]:
+            submit(key)
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key, started = running.pop(future)
+                try:
+                    future.result()
+                    ok = True
+                except Exception as e:
+                    print(f"Error with {' '.join(map(str, key))}: {e}")
+                    ok = False
+                progress.finished(jobs[key], ok, started)
+
+                if ok:
+                    for dependent in dependents[key]:
+                        waiting[dependent] -= 1
+                        if waiting[dependent] == 0:
+                            submit(dependent)
+                    continue
+                # A failure fails everything downstream of it
+                failed.add(key)
+                blocked = list(dependents[key])
+                while blocked:
+                    dependent = blocked.pop()
+                    if dependent not in failed:
+                        failed.add(dependent)
+                        progress.blocked(jobs[dependent])
+                        blocked.extend(dependents[dependent])
+    return failed
+
+
+# Main function to build the maps
+def build(hsxs=('HS4',), years=(2023,), groupings=('countries',), groups_file=None, countries_file=COUNTRIES_FILE,
+          build_dir=BUILD_DIR, workers=None, resume=True, force=(), cache_only=False, cache_dir=CACHE_DIR):
+    """Plans and runs the build, prints a throughput report and returns the set of failed job keys."""
+    countries = read_countries(countries_file)
+    cache = ResponseCache(cache_dir, offline=cache_only)
+    jobs = plan_jobs(hsxs, years, load_groupings(groupings, countries, groups_file), countries, build_dir, cache)
+    progress = Progress(jobs)
+    try:
+        failed = run_jobs(jobs, workers=workers, resume=resume, force=force, progress=progress)
+    finally:
+        cache.flush()
+    progress.report()
+    progress.summary()
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m trade_map build', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hs', nargs='+', default=['HS4'], choices=['HS4', 'HS6'], help='HS granularities')
+    parser.add_argument('--years', default='2023', help="Year or range of years, e.g. '1995-2023'")
+    parser.add_argument('--groupings', nargs='+', default=['countries'],
+                        help="'countries', 'continents' or groupings of --groups")
+    parser.add_argument('--groups', help='JSON file of {grouping: {group: [OEC or ISO2 codes]}}')
+    parser.add_argument('--countries', default=COUNTRIES_FILE, help='Countries TSV file')
+    parser.add_argument('--build-dir', default=BUILD_DIR, help='Directory of the artifacts and maps')
+    parser.add_argument('--workers', type=int, help='Processes of the pool (default: one per core)')
+    parser.add_argument('--force', nargs='+', default=[], choices=STAGES,
+                        help='Rerun these stages (and the stages after them) even if their artifacts exist')
+    parser.add_argument('--no-resume', action='store_true', help='Rerun every job')
+    parser.add_argument('--cache-only', action='store_true', help='Only use cached responses, no network requests')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='Directory of the response cache')
+    args = parser.parse_args(argv)
+
+    failed = build(args.hs, parse_years(args.years), args.groupings, args.groups, args.countries, args.build_dir,
+                   args.workers, not args.no_resume, args.force, args.cache_only, args.cache_dir)
+    if failed:
+        raise SystemExit(f"{len(failed)} jobs failed; run again to retry them.")
@@ -0,0 +1,45 @@
+import os
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COUNTRIES_FILE = os.path.join(REPO_DIR, 'countries.tsv')
+
+
+# Function to read the country list used by chart.js
+def read_countries(path=COUNTRIES_FILE):
+    """
+    Reads a countries TSV file. Lines with 3 columns start a continent group (name, x offset, y offset);
+    the other lines describe a country: OEC code, ISO2, latitude, longitude, name and optional x/y offsets.
+    Returns a list of dicts, one per country, with the continent and its offsets attached.
+    """
+    countries = []
+    continent = {'name': None, 'x': 0, 'y': 0}
+    with open(path, encoding='utf-8') as f:
+        for line in f.read().splitlines():
+            cells = line.split('\t')
+            if not line.strip():
+                continue
+            if len(cells) == 3:
+                continent = {'name': cells[0], 'x': float(cells[1]), 'y': float(cells[2])}
+                continue
+            countries.append({
+                'oec_code': cells[0],
+                'iso2': cells[1],
+                'latitude': float(cells[2]),
+                'longitude': float(cells[3]),
+                'name': cells[4],
+                'x_offset': float(cells[5]) if len(cells) > 5 and cells[5] else 0.0,
+                'y_offset': float(cells[6]) if len(cells) > 6 and cells[6] else 0.0,
+                'continent': continent['name'],
+                'continent_x': continent['x'],
+                'continent_y': continent['y'],
+            })
+    return countries
+
+
+# Function to group countries by continent
+def continent_groups(countries):
+    """Returns a dict of {continent: [OEC codes]} in file order."""
+    groups = {}
+    for country in countries:
+        groups.setdefault(country['continent'], []).append(country['oec_code'])
+    return groups
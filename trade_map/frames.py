@@ -0,0 +1,341 @@
+"""
+Animated world trade map over many years (like docs/wtm_1995_2022.gif), without rendering full
+canvases: every country map is a tile rasterized straight to the output resolution, with box filter
+coverage (the average of the full-size canvas over each output pixel), and a tile is only rasterized
+again when its rectangles changed since the previous year. Frames are composed band by band from the
+tiles, kept in memory-mapped files, and streamed into the encoder, so memory holds a band and a tile,
+never a frame.
+
+GIF is written here (only the changed part of a frame is encoded); WebP and MP4 are encoded by ffmpeg.
+
+    python -m trade_map frames netports/HS4 --years 1995-2022 --hs HS4 --output wtm_1995_2022.gif
+    python -m trade_map frames netports/HS6 --years 1995-2022 --hs HS6 --width 30000 --output wtm.mp4
+
+Tree map labels and titles are not drawn; at animation sizes they are below a pixel high.
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+from .countries import COUNTRIES_FILE, read_countries
+from .netport import parse_years
+from .render import SECTION_COLORS, WORLD_MAP_SIZE
+from .treemap import MARGIN, layout_countries
+
+BACKGROUND = (255, 255, 255)
+OTHER_COLOR = (204, 204, 204)  # Leaves of an unknown section
+BAND_BYTES = 1 << 26  # Size of the bands a frame is composed in
+GIF_DELAY = 250  # Hundredths of a second per frame, as in docs/wtm_1995_2022.gif
+PALETTE = [BACKGROUND] + [tuple(int(c) for c in color[4:-1].split(',')) for color in SECTION_COLORS.values()] + \
+    [OTHER_COLOR]
+
+
+# Function to get the rectangles of a laid out map in output pixels
+def map_rects(netport, layout, x, y, scale):
+    """
+    Returns the (x0, y0, x1, y1) array and the palette index of every drawn leaf of a map placed at
+    (x, y) on the world map. Leaves of 2 px or less are dropped, like render_leaves does.
+    """
+    rects, colors = [], []
+    color_index = {section: i + 1 for i, section in enumerate(SECTION_COLORS)}
+    for port, key in (('import', 'netImportData'), ('export', 'netExportData')):
+        geometry = layout['treemaps'][port]
+        leaves = np.array(geometry['leaves'], dtype=np.int64).reshape(-1, 5)
+        leaves = leaves[(leaves[:, 3] > 2) & (leaves[:, 4] > 2)]
+        left, top = x + MARGIN, y + geometry['offset'] + geometry['leaves_offset']
+        rects.append(np.c_[left + leaves[:, 1], top + leaves[:, 2],
+                           left + leaves[:, 1] + leaves[:, 3], top + leaves[:, 2] + leaves[:, 4]])
+        colors.append([color_index.get(netport[key][i]['Section'], len(PALETTE) - 1) for i in leaves[:, 0]])
+    return np.concatenate(rects) * scale, np.concatenate(colors).astype(np.int64)
+
+
+# Function to split intervals into pixel spans of constant coverage
+def _spans(a0, a1):
+    """
+    Returns (start, stop, weight) arrays of shape (3, n) for the intervals [a0, a1) of pixel
+    coordinates: the first pixel, the fully covered pixels and the last pixel, with the part of
+    a pixel they cover. Unused spans are empty (start == stop).
+    """
+    first, end = np.floor(a0), np.ceil(a1)
+    single = end - first <= 1
+    start = np.stack([first, first + 1, np.maximum(first + 1, end - 1)])
+    stop = np.stack([first + 1, np.maximum(first + 1, end - 1), np.where(single, start[2], end)])
+    weight = np.stack([np.where(single, a1 - a0, first + 1 - a0), np.ones_like(a0), a1 - (end - 1)])
+    return start.astype(np.int64), stop.astype(np.int64), weight
+
+
+# Function to rasterize rectangles with their coverage of every pixel
+def rasterize(rects, colors, box):
+    """
+    Returns the (height, width, 4) float32 tile of the pixel `box` (left, top, right, bottom): the
+    `colors` (an RGB row per rectangle) weighted by the part of each pixel they cover, and the covered part.
+
+    Every rectangle is cut into 3 x 3 blocks of constant coverage (edges, corners and the fully
+    covered inside), which are added to a difference image turned into the tile by cumulative sums:
+    the cost is a few passes over the tile whatever the number and size of the rectangles.
+    """
+    left, top, right, bottom = box
+    width, height = right - left, bottom - top
+    x_start, x_stop, x_weight = _spans(rects[:, 0] - left, rects[:, 2] - left)
+    y_start, y_stop, y_weight = _spans(rects[:, 1] - top, rects[:, 3] - top)
+
+    # Corners of every block, with the sign they take in the difference image
+    cover = (y_weight[:, None] * x_weight[None]).ravel()
+    row0, row1 = np.broadcast_to(y_start[:, None], (3, 3, len(rects))).ravel(), \
+        np.broadcast_to(y_stop[:, None], (3, 3, len(rects))).ravel()
+    col0, col1 = np.broadcast_to(x_start[None], (3, 3, len(rects))).ravel(), \
+        np.broadcast_to(x_stop[None], (3, 3, len(rects))).ravel()
+    corners = np.concatenate([row0 * (width + 1) + col0, row0 * (width + 1) + col1,
+                              row1 * (width + 1) + col0, row1 * (width + 1) + col1])
+    signs = np.repeat([1.0, -1.0, -1.0, 1.0], len(cover))
+
+    block_colors = np.tile(np.asarray(colors, dtype=np.float64), (9, 1))
+    tile = np.empty((height, width, 4), dtype=np.float32)
+    for channel in range(4):
+        value = cover * (block_colors[:, channel] if channel < 3 else 1)
+        difference = np.bincount(corners, signs * np.tile(value, 4), (height + 1) * (width + 1))
+        tile[..., channel] = difference.reshape(height + 1, width + 1).cumsum(0).cumsum(1)[:height, :width]
+    return tile
+
+
+class TileCache:
+    """
+    The rasterized country maps of the current frame, in .npy files of `directory`. `update` rasterizes
+    the maps whose rectangles changed and keeps the others.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tiles = {}  # {map id: (key, box, path)}
+        self.rasterized = self.reused = 0
+
+    def update(self, maps):
+        """
+        `maps` is {map id: (rects, colors)} for the new frame. Returns the pixel box (left, top, right,
+        bottom) that changed since the previous frame, or None.
+        """
+        changed = []
+        for map_id in set(self.tiles) - set(maps):
+            changed.append(self.tiles.pop(map_id)[1])
+            os.remove(os.path.join(self.directory, f'{map_id}.npy'))
+        for map_id, (rects, colors) in maps.items():
+            key = hashlib.sha1(rects.tobytes() + colors.tobytes()).hexdigest()
+            if map_id in self.tiles and self.tiles[map_id][0] == key:
+                self.reused += 1
+                continue
+            if map_id in self.tiles:
+                changed.append(self.tiles[map_id][1])
+            box = (int(np.floor(rects[:, 0].min())), int(np.floor(rects[:, 1].min())),
+                   int(np.ceil(rects[:, 2].max())), int(np.ceil(rects[:, 3].max())))
+            path = os.path.join(self.directory, f'{map_id}.npy')
+            np.save(path, rasterize(rects, np.array(PALETTE)[colors], box))
+            self.tiles[map_id] = (key, box, path)
+            self.rasterized += 1
+            changed.append(box)
+        if not changed:
+            return None
+        return (min(box[0] for box in changed), min(box[1] for box in changed),
+                max(box[2] for box in changed), max(box[3] for box in changed))
+
+    def compose(self, box):
+        """
+        Yields the RGB uint8 rows of the pixel `box` of the frame, a band at a time. A band starts as
+        background and the tiles are drawn over it in order, so only the pixels of tiles are computed.
+        """
+        left, top, right, bottom = box
+        band = max(1, BAND_BYTES // (3 * (right - left)))
+        for band_top in range(top, bottom, band):
+            band_bottom = min(bottom, band_top + band)
+            pixels = np.empty((band_bottom - band_top, right - left, 3), dtype=np.uint8)
+            pixels[:] = BACKGROUND
+            for _, (x0, y0, x1, y1), path in self.tiles.values():
+                # Part of the tile inside the band, in band and in tile coordinates
+                ix0, iy0, ix1, iy1 = max(x0, left), max(y0, band_top), min(x1, right), min(y1, band_bottom)
+                if ix0 >= ix1 or iy0 >= iy1:
+                    continue
+                tile = np.load(path, mmap_mode='r')[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0]
+                target = pixels[iy0 - band_top:iy1 - band_top, ix0 - left:ix1 - left]
+                value = target * np.maximum(0, 1 - tile[..., 3:]) + tile[..., :3] + np.float32(0.5)
+                target[:] = np.clip(value, 0, 255.5, out=value)  # Rounded, as the conversion truncates
+            yield pixels
+
+
+class GifWriter:
+    """
+    Streaming animated GIF encoder. Frames are the changed part of the picture, drawn over the
+    previous frame; their pixels are mapped to PALETTE, or a 6x6x6 color cube for blended edges.
+    """
+    partial = True
+
+    def __init__(self, path, width, height, delay=GIF_DELAY):
+        cube = [(r * 51, g * 51, b * 51) for r in range(6) for g in range(6) for b in range(6)]
+        palette = np.array(PALETTE + cube + [(0, 0, 0)] * (256 - len(PALETTE) - len(cube)), dtype=np.int64)
+        self.exact = np.sort(palette[:len(PALETTE)] @ [65536, 256, 1])
+        self.exact_index = np.argsort(palette[:len(PALETTE)] @ [65536, 256, 1])
+        self.cube_offset = len(PALETTE)
+        self.delay = delay
+        self.f = open(path, 'wb')
+        self.f.write(b'GIF89a' + np.array([width, height], dtype='<u2').tobytes() + bytes([0xF7, 0, 0]))
+        self.f.write(palette.astype(np.uint8).tobytes())
+        self.f.write(b'\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00')  # Loop forever
+
+    # Function to map RGB pixels to palette indices
+    def _indices(self, rgb):
+        packed = rgb.astype(np.int64) @ [65536, 256, 1]
+        position = np.minimum(np.searchsorted(self.exact, packed), len(self.exact) - 1)
+        cube = self.cube_offset + ((rgb.astype(np.int64) + 25) // 51) @ [36, 6, 1]
+        return np.where(self.exact[position] == packed, self.exact_index[position], cube).astype(np.uint8)
+
+    def add_frame(self, box, bands):
+        left, top, right, bottom = box
+        self.f.write(b'\x21\xF9\x04\x04' + np.array([self.delay], dtype='<u2').tobytes() + b'\x00\x00')
+        self.f.write(b'\x2C' + np.array([left, top, right - left, bottom - top], dtype='<u2').tobytes() + b'\x00\x08')
+        encoder = _LzwEncoder(self.f)
+        for rgb in bands:
+            encoder.write(self._indices(rgb).tobytes())
+        encoder.close()
+
+    def close(self):
+        self.f.write(b'\x3B')
+        self.f.close()
+
+
+class _LzwEncoder:
+    """Variable-length-code LZW compression of 8 bit GIF image data, written in 255 byte sub-blocks."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = bytearray()
+        self.bits = self.nbits = 0
+        self._reset()
+        self.prefix = None
+        self._emit(256)  # Clear code
+
+    def _reset(self):
+        self.table = {}
+        self.next_code = 258
+        self.code_size = 9
+
+    def _emit(self, code):
+        self.bits |= code << self.nbits
+        self.nbits += self.code_size
+        while self.nbits >= 8:
+            self.buffer.append(self.bits & 0xFF)
+            self.bits >>= 8
+            self.nbits -= 8
+        if len(self.buffer) >= 255:
+            self.f.write(b'\xFF' + bytes(self.buffer[:255]))
+            del self.buffer[:255]
+        # Codes get a bit longer once the next table entry does not fit, as the decoder expects
+        if self.next_code > (1 << self.code_size) - 1 and self.code_size < 12:
+            self.code_size += 1
+
+    def write(self, data):
+        table, prefix = self.table, self.prefix
+        for byte in data:
+            if prefix is None:
+                prefix = byte
+                continue
+            key = prefix << 8 | byte
+            code = table.get(key)
+            if code is not None:
+                prefix = code
+                continue
+            self._emit(prefix)
+            if self.next_code == 4096:
+                self._emit(256)
+                self._reset()
+                table = self.table
+            else:
+                table[key] = self.next_code
+                self.next_code += 1
+            prefix = byte
+        self.prefix = prefix
+
+    def close(self):
+        if self.prefix is not None:
+            self._emit(self.prefix)
+        self._emit(257)  # End of information
+        if self.nbits:
+            self.buffer.append(self.bits & 0xFF)
+        for start in range(0, len(self.buffer), 255):
+            block = self.buffer[start:start + 255]
+            self.f.write(bytes([len(block)]) + bytes(block))
+        self.f.write(b'\x00')
+
+
+class FfmpegWriter:
+    """Streams whole RGB frames into ffmpeg, which encodes them by the extension of `path` (.webp, .mp4)."""
+    partial = False
+
+    def __init__(self, path, width, height, delay=GIF_DELAY):
+        if shutil.which('ffmpeg') is None:
+            raise RuntimeError(f"ffmpeg is needed to write '{path}'; write a .gif instead")
+        options = ['-loop', '0'] if path.endswith('.webp') else ['-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2']
+        self.process = subprocess.Popen(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}',
+             '-framerate', f'{100 / delay}', '-i', '-'] + options + [path], stdin=subprocess.PIPE)
+
+    def add_frame(self, box, bands):
+        for rgb in bands:
+            self.process.stdin.write(rgb.tobytes())
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait():
+            raise RuntimeError(f"ffmpeg failed with exit code {self.process.returncode}")
+
+
+# Function to write the animated world trade map of many years
+def write_animation(netport_dir, hsx, years, countries, path, width=1200, delay=GIF_DELAY):
+    """
+    Lays out the maps of <netport_dir>/<year>/<oec code>.json for every year and streams the frames
+    (`width` pixels wide, the world map scaled down) into `path`. Returns the TileCache, whose
+    `rasterized` and `reused` count the tiles drawn and kept.
+    """
+    scale = width / WORLD_MAP_SIZE[0]
+    height = round(WORLD_MAP_SIZE[1] * scale)
+    writer = GifWriter(path, width, height, delay) if path.endswith('.gif') else FfmpegWriter(path, width, height, delay)
+    with tempfile.TemporaryDirectory(prefix='trade_map_tiles_') as directory:
+        tiles = TileCache(directory)
+        try:
+            for year in years:
+                maps = {}
+                for country, netport, layout, x, y in layout_countries(os.path.join(netport_dir, str(year)), year,
+                                                                       countries):
+                    rects, colors = map_rects(netport, layout, x, y, scale)
+                    if len(rects):
+                        maps[country['oec_code']] = (rects, colors)
+                changed = tiles.update(maps)
+                box = (0, 0, width, height)
+                if writer.partial and changed is not None and year != years[0]:
+                    box = (max(0, changed[0]), max(0, changed[1]), min(width, changed[2]), min(height, changed[3]))
+                elif writer.partial and year != years[0]:
+                    box = (0, 0, 1, 1)  # Nothing changed: repeat the frame
+                writer.add_frame(box, tiles.compose(box))
+                print(f"{year}: {len(maps)} maps")
+        finally:
+            writer.close()
+    return tiles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m trade_map frames', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('netport_dir', help="Directory of <year>/<oec code>.json files written by 'netport'")
+    parser.add_argument('--years', required=True, help="Range of years, e.g. '1995-2022'")
+    parser.add_argument('--hs', default='HS4', choices=['HS4', 'HS6'], help='HS granularity')
+    parser.add_argument('--countries', default=COUNTRIES_FILE, help='Countries TSV file')
+    parser.add_argument('--width', type=int, default=1200, help='Width of the frames in pixels')
+    parser.add_argument('--delay', type=int, default=GIF_DELAY, help='Hundredths of a second per frame')
+    parser.add_argument('--output', required=True, help='.gif, .webp or .mp4 file')
+    args = parser.parse_args(argv)
+
+    tiles = write_animation(args.netport_dir, args.hs, parse_years(args.years), read_countries(args.countries),
+                            args.output, args.width, args.delay)
+    print(f"'{args.output}' written: {tiles.rasterized} tiles rasterized, {tiles.reused} reused.")
@@ -0,0 +1,67 @@
+"""
+Geometry of the trade maps, ported from getWidthHeight/makeMap/drawTreemap in chart.js.
+
+A map holds two treemaps, net import on top of net export, whose areas are proportional to the
+inflation-adjusted trade value (1 px = 10k USD of 2021).
+"""
+import math
+
+# Cumulative inflation compared to 2021 as 100%, based on changes of the consumer price index (CPI)
+# https://www.minneapolisfed.org/about-us/monetary-policy/inflation-calculator
+CUMULATIVE_INFLATION = {
+    1995: 56.24, 1996: 57.90, 1997: 59.23, 1998: 60.15, 1999: 61.48,
+    2000: 63.55, 2001: 65.32, 2002: 66.39, 2003: 67.90, 2004: 69.71,
+    2005: 72.07, 2006: 74.40, 2007: 76.52, 2008: 79.46, 2009: 79.17,
+    2010: 80.47, 2011: 83.01, 2012: 84.73, 2013: 85.97, 2014: 87.37,
+    2015: 87.47, 2016: 88.57, 2017: 90.46, 2018: 92.67, 2019: 94.35,
+    2020: 95.51, 2021: 100.00, 2022: 108.00, 2023: 112.45,
+}
+RATIO = 2  # Width / height of a treemap
+
+
+# Function to get the size of a treemap
+def get_width_height(area, year):
+    """Returns the (width, height) in px of a treemap of `area` (in 1k USD) for `year`."""
+    if year not in CUMULATIVE_INFLATION:
+        raise KeyError(f"No CPI for {year}; add it to CUMULATIVE_INFLATION")
+    scale = 1 / CUMULATIVE_INFLATION[year]
+    width = math.ceil(math.sqrt(area * scale * RATIO))
+    height = math.ceil(math.sqrt(area * scale / RATIO))
+    return width, height
+
+
+# Function to lay out one treemap block with its title
+def treemap_geometry(area, year, offset):
+    """Returns the size, title and leaves offsets of the import or export treemap of a map."""
+    width, height = get_width_height(area, year)
+    title_size = math.ceil(max(11, width / 100))
+    return {
+        'width': width,
+        'height': height,
+        'offset': offset,
+        'title_size': title_size,
+        'leaves_offset': math.ceil(15 + (title_size - 11) * 1.5),
+        'value': area,
+    }
+
+
+# Function to lay out a map of net imports and net exports
+def map_geometry(netport, year):
+    """
+    Returns the layout of a map (the getNetportData result `netport`): its overall width and height
+    and the geometry of its 'import' and 'export' treemaps, as makeMap computes them.
+    """
+    import_width, import_height = get_width_height(netport['netImport'], year)
+    export_width, _ = get_width_height(netport['netExport'], year)
+    import_offset = math.ceil(import_height / 150)
+    export_offset = import_height + math.ceil(max(10, import_width / 50 - 10))  # Import height + export font size
+
+    treemaps = {
+        'import': treemap_geometry(netport['netImport'], year, import_offset),
+        'export': treemap_geometry(netport['netExport'], year, export_offset),
+    }
+    return {
+        'width': max(import_width, export_width) + 20,
+        'height': import_offset * 4 + treemaps['export']['height'] + export_offset + 20,
+        'treemaps': treemaps,
+    }
@@ -0,0 +1,231 @@
+"""
+Net import/export aggregation, the Python port of getNetportData/cleanPortData in chart.js.
+
+The HS template is loaded once (from its compiled binary, see templates.py) into arrays indexed by
+`HS4 ID`/`HS6 ID`. The OEC trade rows of all countries of a year are mapped onto template positions
+with one sorted lookup and added into a (country x HS code) matrix with one scatter-add, instead of
+scanning the OEC rows with `find` for every template row. The output is the same object
+getNetportData returns: {netImportData, netExportData, netImport, netExport}.
+
+    python -m trade_map netport --hs HS4 --years 1995-2023 --output-dir netports
+    python -m trade_map netport --years 2020 --cache-only       # From the response cache, no network
+"""
+import argparse
+import datetime
+import json
+import os
+
+import numpy as np
+
+from city_hhi.cache import CACHE_DIR, ResponseCache
+from city_hhi.fetcher import fetch_all
+
+from .countries import REPO_DIR, read_countries
+from .templates import load_template
+
+THRESHOLD = 20000  # Discard trade less than 20 million $ (values in 1k USD)
+OEC_URL = ('https://oec.world/olap-proxy/data?cube=trade_i_baci_a_92&{port}er+Country={oec_code}'
+           '&drilldowns={hsx}&measures=Trade+Value&parents=true&Year={year}&sparse=false&locale=en')
+
+
+# Function to get the conversion rate of OEC trade values to thousand USD
+def conversion_rate(year, current_year=None):
+    """The most recent year (last year of current year) of OEC data is using 0.1 USD."""
+    current_year = current_year or datetime.date.today().year
+    return 10000 if year >= current_year - 1 else 1000
+
+
+# Function to scatter the OEC trade rows of many countries onto the template at once
+def trade_matrix(template, row_lists):
+    """
+    Returns a (len(row_lists) x template rows) array of the `Trade Value` of every template row, taken
+    from each list of OEC rows (dicts with `<HSx> ID` and `Trade Value`). Like `find` in chart.js, the
+    first row of an ID wins, rows whose ID is not in the template are ignored and missing values count as 0.
+    """
+    matrix = np.zeros((len(row_lists), len(template)))
+    key = f'{template.hsx} ID'
+    list_idx, ids, values = [], [], []
+    for i, rows in enumerate(row_lists):
+        seen = set()
+        for row in rows or []:
+            hs_id = row.get(key)
+            if hs_id is None or hs_id in seen:
+                continue
+            seen.add(hs_id)
+            list_idx.append(i)
+            ids.append(hs_id)
+            values.append(row.get('Trade Value') or 0)
+    if not ids:
+        return matrix
+
+    pos = template.lookup(np.array(ids, dtype=np.int64))
+    hit = pos >= 0
+    np.add.at(matrix, (np.array(list_idx)[hit], pos[hit]), np.array(values, dtype=np.float64)[hit])
+    return matrix
+
+
+# Function to calculate the net trade of many countries and years at once
+def net_trade(template, trade_data, current_year=None):
+    """
+    Returns ({(OEC code, year): row}, matrix) where each matrix row holds the imports minus the exports
+    of a country and year over the template rows, in thousand USD. Only the countries and years with
+    both import and export rows are included.
+    """
+    keys = [key for key, (import_rows, export_rows) in trade_data.items() if import_rows and export_rows]
+    imports = trade_matrix(template, [trade_data[key][0] for key in keys])
+    exports = trade_matrix(template, [trade_data[key][1] for key in keys])
+    rates = np.array([conversion_rate(year, current_year) for _, year in keys], dtype=np.float64)
+    return {key: i for i, key in enumerate(keys)}, (imports - exports) / rates[:, None]
+
+
+# Function to keep the categories above the threshold
+def clean_port_data(template, values, threshold=THRESHOLD):
+    """
+    Port of cleanPortData: rounds the values, keeps the first row of every section (to utilize the
+    full color palette) and the rows of at least `threshold`; a kept section row below the threshold
+    is dropped again when a later row of the same section passes the threshold.
+    Returns (list of template records with their Trade Value, total of the unrounded values).
+    """
+    values = np.maximum(values, 0)
+    net_port = float(np.cumsum(values)[-1]) if len(values) else 0.0  # Sequential, like the JS loop
+    rounded = np.floor(values + 0.5)  # Math.round
+
+    keep = []
+    section_id = 0
+    for i in range(len(template)):
+        if template.section_ids[i] > section_id:
+            section_id = template.section_ids[i]
+            keep.append(i)
+        elif rounded[i] >= threshold:
+            if rounded[keep[-1]] < threshold:
+                keep.pop()
+            keep.append(i)
+
+    records = []
+    for i in keep:
+        record = template.record(i)
+        record['Trade Value'] = int(rounded[i])
+        records.append(record)
+    return records, net_port
+
+
+# Function to build the net import/export data of a group of countries
+def get_netport_data(template, net, oec_codes, year):
+    """
+    Port of getNetportData. `net` is the result of net_trade; countries without data for `year`
+    are skipped. Each HS category of a country counts either as import or as export, never both.
+    Returns None when the group has no net import or no net export, otherwise the dict of
+    netImportData, netExportData, netImport and netExport.
+    """
+    index, matrix = net
+    net_import = template.values.copy()
+    net_export = template.values.copy()
+    for oec_code in oec_codes:
+        row = index.get((oec_code, year))
+        if row is None:
+            continue
+        net_import += np.maximum(matrix[row], 0)
+        net_export += np.maximum(-matrix[row], 0)
+
+    net_import_data, net_import_total = clean_port_data(template, net_import)
+    net_export_data, net_export_total = clean_port_data(template, net_export)
+    if net_import_total == 0 or net_export_total == 0:
+        return None
+    return {
+        'netImportData': net_import_data,
+        'netExportData': net_export_data,
+        'netImport': _js_number(net_import_total),
+        'netExport': _js_number(net_export_total),
+    }
+
+
+# Function to write integral floats the way JSON.stringify does
+def _js_number(value):
+    return int(value) if float(value).is_integer() else value
+
+
+# Function to build the OEC API URL of a country, year and direction
+def oec_url(hsx, oec_code, port, year):
+    """`port` is 'Import' or 'Export'."""
+    return OEC_URL.format(port=port, oec_code=oec_code, hsx=hsx, year=year)
+
+
+# Function to download OEC trade data for many countries and years at once
+def fetch_trade_data(hsx, oec_codes, years, cache=None):
+    """
+    Downloads the import and export rows of every country and year concurrently.
+    Returns a dict of {(OEC code, year): (import rows, export rows)}; failed downloads map to (None, None).
+    """
+    jobs = [(oec_code, year) for year in years for oec_code in oec_codes]
+    urls = [oec_url(hsx, oec_code, port, year) for oec_code, year in jobs for port in ('Import', 'Export')]
+    bodies = fetch_all(urls, cache=cache)
+
+    trade_data = {}
+    for i, (oec_code, year) in enumerate(jobs):
+        rows = []
+        for body in bodies[2 * i:2 * i + 2]:
+            try:
+                if isinstance(body, Exception):
+                    raise body
+                data = json.loads(body).get('data')
+                rows.append(data if isinstance(data, list) else None)
+            except Exception as e:
+                print(f"Error with {oec_code} {year}: {e}")
+                rows.append(None)
+        trade_data[(oec_code, year)] = tuple(rows)
+    return trade_data
+
+
+# Function to parse a year range like 1995-2023 or 2020
+def parse_years(text):
+    """Returns the list of years of 'YYYY' or 'YYYY-YYYY'."""
+    first, _, last = text.partition('-')
+    return list(range(int(first), int(last or first) + 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m trade_map netport', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hs', default='HS4', choices=['HS4', 'HS6'], help='HS granularity')
+    parser.add_argument('--years', default='2023', help="Year or range of years, e.g. '1995-2023'")
+    parser.add_argument('--countries', default=os.path.join(REPO_DIR, 'countries.tsv'), help='Countries TSV file')
+    parser.add_argument('--group', help='Aggregate all countries of the TSV file into one group of this name')
+    parser.add_argument('--output-dir', default='netports', help='Directory the JSON files are written to')
+    parser.add_argument('--cache-only', action='store_true', help='Only use cached responses, no network requests')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help=f'Directory of the response cache (default: {CACHE_DIR})')
+    args = parser.parse_args(argv)
+
+    template = load_template(args.hs)
+    countries = read_countries(args.countries)
+    years = parse_years(args.years)
+    cache = ResponseCache(args.cache_dir, offline=args.cache_only)
+    try:
+        trade_data = fetch_trade_data(args.hs, [c['oec_code'] for c in countries], years, cache=cache)
+    finally:
+        cache.flush()
+
+    groups = ({args.group: [c['oec_code'] for c in countries]} if args.group
+              else {c['oec_code']: [c['oec_code']] for c in countries})
+    saved = 0
+    for year in years:
+        year_dir = os.path.join(args.output_dir, args.hs, str(year))
+        os.makedirs(year_dir, exist_ok=True)
+        # One matrix per year keeps HS6 memory at (countries x 5018) floats
+        year_data = {key: rows for key, rows in trade_data.items() if key[1] == year}
+        net = net_trade(template, year_data)
+        written = 0
+        for name, oec_codes in groups.items():
+            netport = get_netport_data(template, net, oec_codes, year)
+            if netport is None:
+                continue
+            with open(os.path.join(year_dir, f'{name}.json'), 'w', encoding='utf-8') as f:
+                json.dump(netport, f, separators=(',', ':'), ensure_ascii=False)
+            written += 1
+        failed = [oec_code for (oec_code, _), rows in year_data.items() if None in rows]
+        if failed:
+            print(f"{year}: {len(failed)} countries failed to download: {', '.join(failed)}")
+        print(f"{year}: net import/export of {written} of {len(groups)} groups saved to '{year_dir}'.")
+        saved += written
+    if not saved:
+        raise SystemExit("No net import/export was saved.")
+
@@ -0,0 +1,105 @@
+"""
+SVG output of the trade maps, with the element structure and ids of the maps made by chart.js.
+"""
+import html
+import re
+
+WORLD_MAP_SIZE = (60000, 20000)  # Canvas of makeMapGroup
+MIN_LABEL_SIZE = (60, 30)  # Leaves narrower or lower than this get no label
+SECTION_COLORS = {
+    'Animal Hides': 'rgb(158, 1, 66)',
+    'Animal Products': 'rgb(185, 31, 72)',
+    'Animal and Vegetable Bi-Products': 'rgb(209, 60, 75)',
+    'Arts and Antiques': 'rgb(228, 86, 73)',
+    'Chemical Products': 'rgb(240, 112, 74)',
+    'Foodstuffs': 'rgb(248, 142, 83)',
+    'Footwear and Headwear': 'rgb(252, 172, 99)',
+    'Instruments': 'rgb(253, 198, 118)',
+    'Machines': 'rgb(254, 221, 141)',
+    'Metals': 'rgb(254, 238, 163)',
+    'Mineral Products': 'rgb(251, 248, 176)',
+    'Miscellaneous': 'rgb(241, 249, 171)',
+    'Paper Goods': 'rgb(224, 243, 161)',
+    'Plastics and Rubbers': 'rgb(200, 233, 159)',
+    'Precious Metals': 'rgb(169, 221, 162)',
+    'Stone And Glass': 'rgb(137, 207, 165)',
+    'Textiles': 'rgb(105, 189, 169)',
+    'Transportation': 'rgb(78, 164, 176)',
+    'Vegetable Products': 'rgb(66, 136, 181)',
+    'Weapons': 'rgb(74, 108, 174)',
+    'Wood Products': 'rgb(94, 79, 162)',
+}
+
+
+# Function to make an SVG id out of a name
+def svg_id(name):
+    return re.sub(r'\W', '_', name)
+
+
+# Function to format a trade value (in 1k USD) like the titles of chart.js
+def format_value(value):
+    return f"${value / 1000:,.2f} M"
+
+
+# Function to draw the leaves of a treemap
+def render_leaves(tree_id, records, hsx, geometry):
+    """
+    Returns the leaves of a treemap laid out by treemap.layout_map, as the rawgraphs treemap draws them
+    after the clean-up of drawTreemap: leaves of 2 px or less are dropped, small ones lose their label,
+    and HS6 labels keep the short name before '____'.
+    """
+    leaves = []
+    for j, (i, x, y, width, height) in enumerate(geometry.get('leaves', [])):
+        if width <= 2 or height <= 2:
+            continue
+        record = records[i]
+        name = html.escape(record[hsx], quote=False)
+        value = record['Trade Value']
+        leaf = (f'<g transform="translate({x},{y})"><rect id="{tree_id}_path{j}" '
+                f'fill="{SECTION_COLORS.get(record["Section"], "rgb(204, 204, 204)")}" '
+                f'width="{width}" height="{height}"></rect>')
+        if width >= MIN_LABEL_SIZE[0] and height >= MIN_LABEL_SIZE[1]:
+            leaf += (f'<clipPath id="{tree_id}_clip{j}"><use href="#{tree_id}_path{j}"></use></clipPath>'
+                     f'<text clip-path="url(#{tree_id}_clip{j})" font-family="Arial, sans-serif" font-size="10" '
+                     f'dominant-baseline="text-before-edge" class="txt"><tspan x="3" y="0.2em">{name.split("____")[0]}'
+                     f'</tspan><tspan x="3" y="1.3em">{value}</tspan></text>')
+        leaves.append(leaf + f'<title>{name.replace("____", "&#10;")}&#10;{value}</title></g>')
+    return ''.join(leaves)
+
+
+# Function to draw one treemap block of a map
+def render_treemap(name, map_id, port, geometry, year, leaves=''):
+    """
+    Returns the <g> of the net import (`port` 'import') or net export treemap of a map: its title and
+    the `leaves` drawn inside it. Without leaves the treemap area is drawn as an empty frame.
+    """
+    tree_id = f"{map_id}_nt{port[:2]}"
+    if not leaves:
+        leaves = (f'<rect width="{geometry["width"]}" height="{geometry["height"]}" fill="none" '
+                  f'stroke="#CCCCCC"></rect>')
+    return (f'<g transform="translate(10,{geometry["offset"]})" id="{tree_id}_{year}">'
+            f'<text dominant-baseline="text-before-edge" class="txt"><tspan x="20" y="0.2em" '
+            f'style="font-family: Arial, sans-serif; font-size: {geometry["title_size"]}px; fill: black; '
+            f'font-weight: bold;">{html.escape(name)} net {port} {format_value(geometry["value"])}</tspan></text>'
+            f'<g id="{tree_id}_{year}_leaves" transform="translate(0, {geometry["leaves_offset"]})">{leaves}</g></g>')
+
+
+# Function to write a coordinate the way JavaScript prints numbers
+def _number(value):
+    return int(value) if float(value).is_integer() else value
+
+
+# Function to draw a map at its position
+def render_map(name, map_id, layout, year, x=0, y=0, leaves=None):
+    """Returns the <g> of a map (net import and net export treemaps) translated to (x, y)."""
+    leaves = leaves or {}
+    treemaps = '\n'.join('    ' + render_treemap(name, map_id, port, layout['treemaps'][port], year, leaves.get(port, ''))
+                         for port in ('import', 'export'))
+    return f'  <g transform="translate({_number(x)},{_number(y)})" id="{map_id}_{year}">\n{treemaps}\n  </g>\n'
+
+
+# Function to wrap map groups into an SVG document
+def render_svg(width, height, body):
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">\n'
+            f'  <rect width="{width}" height="{height}" x="0" y="0" fill="#FFFFFF" id="backgorund"/>\n'
+            f'{body}</svg>\n')
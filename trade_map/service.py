@@ -0,0 +1,314 @@
+"""
+Local HTTP service answering HHI and net-trade queries from resident data, for dashboards that
+would otherwise start `python -m city_hhi` or `python -m trade_map netport` for every chart.
+
+The curated city CSVs (and, with --timeseries-dir, the city time series), the HS templates and the
+net trade of every country and year are loaded once and kept in memory; the net trade of a year is
+read from the fetch artifacts of 'build' when present, otherwise downloaded through the response
+cache on its first query (again after RETRY_SECONDS when some downloads failed, or some artifacts
+are missing or empty). Encoded results
+are kept in an LRU keyed by (query, region set, exponent, top-N, year), except net-trade results
+missing countries whose download failed. Requests are served by one thread each.
+
+    python -m trade_map serve --port 8765 --build-dir build
+    curl 'localhost:8765/hhi?level=province&regions=Anhui,Fujian&exponent=2&top=5'
+    curl 'localhost:8765/hhi?level=state&year=2020'                  # Needs --timeseries-dir
+    curl 'localhost:8765/netport?hs=HS4&year=2020&countries=eufra,eudeu'
+    curl 'localhost:8765/stats'
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from city_hhi.cache import CACHE_DIR, ResponseCache
+from city_hhi.hhi import calculate_hhi_by_region
+from city_hhi.regions import SOURCES
+from city_hhi.timeseries import CITY_DATASET, read_timeseries
+
+from .countries import COUNTRIES_FILE, read_countries
+from .netport import fetch_trade_data, get_netport_data, net_trade
+from .templates import load_template
+
+HOST = '127.0.0.1'
+PORT = 8765
+CACHE_SIZE = 4096  # Encoded results kept in the LRU
+RETRY_SECONDS = 60  # Age after which the net trade of a year with failed downloads is downloaded again
+
+
+class QueryError(ValueError):
+    """A query with missing or invalid parameters, answered with 400."""
+
+
+class LRUCache:
+    """Thread-safe least recently used cache of computed results, with hit and miss counts."""
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Function to get a cached result, computing and storing it on a miss
+    def get(self, key, compute):
+        """
+        Returns the result of `key`, calling `compute()` outside the lock on a miss. `compute` returns
+        (result, keep) and the result is only stored when `keep` is true; two threads missing the
+        same key at once both compute it and the second result is kept.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._entries[key]
+            self.stats['misses'] += 1
+        value, keep = compute()
+        if not keep:
+            return value
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TradeService:
+    """
+    The resident datasets and the computations behind the HTTP endpoints. The query methods take
+    the parsed parameters and return the JSON-encoded response body.
+    """
+
+    def __init__(self, build_dir=None, cache_dir=CACHE_DIR, timeseries_dir=None, countries_file=COUNTRIES_FILE,
+                 cache_size=CACHE_SIZE, offline=False):
+        self.build_dir = build_dir
+        self.cache = LRUCache(cache_size)
+        self.response_cache = ResponseCache(cache_dir, offline=offline)
+        self.countries = [country['oec_code'] for country in read_countries(countries_file)]
+        self.cities = {}
+        for level, source in SOURCES.items():
+            try:
+                self.cities[level] = pd.read_csv(source.local_file, dtype={source.column: str})
+            except Exception as e:
+                print(f"Error with {level}: {e}")
+        self.city_years = {}
+        if timeseries_dir:
+            data = read_timeseries(timeseries_dir, dataset=CITY_DATASET)
+            for level, rows in data.groupby('level', sort=False):
+                self.city_years[level] = rows.reset_index(drop=True)
+        self.templates = {hsx: load_template(hsx) for hsx in ('HS4', 'HS6')}
+        self._net = {}
+        self._net_locks = {}
+        self._lock = threading.Lock()
+
+    # Function to get the net trade of every country in a year, loading it on first use
+    def net(self, hsx, year):
+        """
+        Returns the net_trade result of all countries in `year`, from the build artifacts or the OEC
+        API, and the set of countries whose download failed. A year with failed downloads is loaded
+        again when it is older than RETRY_SECONDS.
+        """
+        key = (hsx, year)
+        with self._lock:
+            if key in self._net and self._is_fresh(self._net[key]):
+                return self._net[key][:2]
+            lock = self._net_locks.setdefault(key, threading.Lock())
+        with lock:  # One thread loads a year, the others wait for it
+            if key not in self._net or not self._is_fresh(self._net[key]):
+                self._net[key] = self._load_net(hsx, year) + (time.monotonic(),)
+        return self._net[key][:2]
+
+    @staticmethod
+    def _is_fresh(entry):
+        _, failed, loaded = entry
+        return not failed or time.monotonic() - loaded < RETRY_SECONDS
+
+    # Function to read or download the net trade of every country in a year
+    def _load_net(self, hsx, year):
+        """
+        Returns (net_trade result, frozenset of the OEC codes whose download failed). With build
+        artifacts, the served countries whose artifact is missing or empty count as failed, so the
+        year is read again after RETRY_SECONDS while a build is still fetching them.
+        """
+        template = self.templates[hsx]
+        trade_dir = os.path.join(self.build_dir, hsx, str(year), 'trade') if self.build_dir else None
+        if trade_dir and os.path.isdir(trade_dir):
+            index, vectors = {}, []
+            for name in sorted(os.listdir(trade_dir)):
+                if not name.endswith('.npy'):
+                    continue
+                vector = np.load(os.path.join(trade_dir, name))
+                if len(vector):
+                    index[(name[:-4], year)] = len(vectors)
+                    vectors.append(vector)
+            failed = frozenset(self.countries) - {code for code, _ in index}
+            return (index, np.array(vectors) if vectors else np.zeros((0, len(template)))), failed
+        trade_data = fetch_trade_data(hsx, self.countries, [year], cache=self.response_cache)
+        failed = frozenset(code for (code, _), rows in trade_data.items() if None in rows)
+        return net_trade(template, trade_data), failed
+
+    # Function to compute the HHI of a set of regions
+    def hhi(self, level, regions=None, exponent=None, top_n=None, year=None):
+        """
+        HHI of the `regions` of `level` (all when None) from the curated CSV, or from the city time
+        series for `year`. Exponent and top-N default to the ones of the level's local mode.
+        """
+        source = SOURCES.get(level)
+        if source is None:
+            raise QueryError(f"unknown level '{level}'")
+        if year is not None and level not in self.city_years:
+            raise QueryError(f"no time series of '{level}'")
+        if exponent is not None and not math.isfinite(exponent):
+            raise QueryError(f"exponent must be a finite number, not {exponent}")
+        if top_n is not None and top_n < 1:
+            raise QueryError(f"top must be at least 1, not {top_n}")
+        exponent = source.exponent if exponent is None else exponent
+        top_n = source.local_top_n if top_n is None else top_n
+        regions = frozenset(regions) if regions else None
+        key = ('hhi', level, regions, exponent, top_n, year)
+        return self.cache.get(key, lambda: (self._hhi(source, regions, exponent, top_n, year), True))
+
+    def _hhi(self, source, regions, exponent, top_n, year):
+        if year is None:
+            data, column = self.cities[source.level], source.column
+        else:
+            data, column = self.city_years[source.level], 'Region'
+            data = data[data['year'] == year]
+        if regions is not None:
+            data = data[data[column].isin(regions)]
+        hhi_df, _ = calculate_hhi_by_region(data, column, exponent=exponent, top_n=top_n, sort=source.local_sort)
+        rows = [{'region': region, 'hhi': hhi, 'top': int(top)}
+                for region, hhi, top in zip(hhi_df[column], hhi_df['HHI'].astype(float), hhi_df['Top'])]
+        return json.dumps({'level': source.level, 'exponent': exponent, 'top_n': top_n, 'year': year,
+                           'regions': rows}).encode('utf-8')
+
+    # Function to aggregate the net imports and exports of a set of countries
+    def netport(self, hsx, countries, year):
+        """
+        getNetportData of `countries` (OEC codes) in `year`; null when the group has no trade. Results
+        missing a country whose download failed are not kept in the LRU.
+        """
+        if hsx not in self.templates:
+            raise QueryError(f"unknown HS granularity '{hsx}'")
+        if year is None or not countries:
+            raise QueryError('netport needs a year and countries')
+        countries = tuple(dict.fromkeys(countries))  # The order of the countries sets the rounding of the totals
+        key = ('netport', hsx, countries, None, None, year)
+        return self.cache.get(key, lambda: self._netport(hsx, countries, year))
+
+    def _netport(self, hsx, countries, year):
+        net, failed = self.net(hsx, year)
+        body = json.dumps(get_netport_data(self.templates[hsx], net, countries, year)).encode('utf-8')
+        return body, failed.isdisjoint(countries)
+
+    # Function to describe the state of the service
+    def stats(self):
+        return json.dumps({
+            'cache': dict(self.cache.stats, size=len(self.cache)),
+            'net_trade_years': sorted(f'{hsx} {year}' for hsx, year in self._net),
+            'response_cache': self.response_cache.stats,
+        }).encode('utf-8')
+
+
+# Function to read the parameters of a query string
+def parse_query(query):
+    """Returns {name: value} of the last value of every parameter, with list parameters split at commas."""
+    params = {name: values[-1] for name, values in parse_qs(query).items()}
+    try:
+        return {
+            'level': params.get('level'),
+            'regions': [region for region in params.get('regions', '').split(',') if region] or None,
+            'exponent': float(params['exponent']) if 'exponent' in params else None,
+            'top_n': int(params['top']) if 'top' in params else None,
+            'year': int(params['year']) if 'year' in params else None,
+            'hsx': params.get('hs', 'HS4').upper(),
+            'countries': [code for code in params.get('countries', '').split(',') if code],
+        }
+    except ValueError as e:
+        raise QueryError(str(e))
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers GET /hhi, /netport and /stats with JSON, keeping connections alive."""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Headers and body are written separately; don't wait for the ACK in between
+    service = None
+    quiet = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        status = 200
+        try:
+            q = parse_query(url.query)
+            if url.path == '/hhi':
+                if not q['level']:
+                    raise QueryError('hhi needs a level')
+                body = self.service.hhi(q['level'], q['regions'], q['exponent'], q['top_n'], q['year'])
+            elif url.path == '/netport':
+                body = self.service.netport(q['hsx'], q['countries'], q['year'])
+            elif url.path == '/stats':
+                body = self.service.stats()
+            else:
+                status, body = 404, json.dumps({'error': f"unknown path '{url.path}'"}).encode('utf-8')
+        except QueryError as e:
+            status, body = 400, json.dumps({'error': str(e)}).encode('utf-8')
+        except Exception as e:
+            print(f"Error with {self.path}: {e}")
+            status, body = 500, json.dumps({'error': str(e)}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+# Function to create the HTTP server of a service
+def make_server(service, host=HOST, port=PORT, quiet=True):
+    """Returns a ThreadingHTTPServer answering with `service`; port 0 picks a free port."""
+    handler = type('ServiceHandler', (Handler,), {'service': service, 'quiet': quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m trade_map serve', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=HOST, help=f'Address to listen on (default: {HOST})')
+    parser.add_argument('--port', type=int, default=PORT, help=f'Port to listen on (default: {PORT})')
+    parser.add_argument('--build-dir', help="Directory of a 'build' run whose net trade artifacts are served")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='Directory of the OEC response cache')
+    parser.add_argument('--offline', action='store_true', help='Serve net trade from the response cache only')
+    parser.add_argument('--timeseries-dir', help='Directory of the city time series, for queries with a year')
+    parser.add_argument('--countries', default=COUNTRIES_FILE, help='Countries TSV file')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='Results kept in memory')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    service = TradeService(args.build_dir, args.cache_dir, args.timeseries_dir, args.countries, args.cache_size,
+                           args.offline)
+    server = make_server(service, args.host, args.port, quiet=not args.verbose)
+    print(f"Data loaded in {time.perf_counter() - start:.1f} s, serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,218 @@
+"""
+HS4/HS6 templates and their compiled binary form.
+
+template_HS6.json repeats the "Section", "HS2" and "HS4" names on every row. `compile_template` turns
+a template into a compact columnar file next to it (template_HS6.bin): one int64 array per ID column,
+one float64 array for the trade values, the row order sorted by HS ID, and one uint32 array of string
+table codes per name column, each distinct name being stored once. `open_template` maps that file
+read-only and wraps the arrays without copying them, so opening it takes microseconds and worker
+processes opening the same file share the pages of the OS cache instead of holding a private copy.
+
+File layout (arrays aligned to 8 bytes):
+
+    b'HSTPL\\x00\\x01\\x00'   magic and format version
+    uint32                   length of the JSON header
+    JSON header              hsx, rows, field names, dtype/offset/length of every array, blob offset
+    arrays ...               ID / value / code columns, sort order, string offsets (uint64)
+    string blob              UTF-8 bytes of the distinct names
+
+Array and blob offsets count from the first 8-byte boundary after the header.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from .countries import REPO_DIR
+
+MAGIC = b'HSTPL\x00\x01\x00'
+VALUE_FIELD = 'Trade Value'
+
+
+class _StringTable:
+    """Read-only sequence of the distinct names of a compiled template, decoded from the blob when used."""
+
+    def __init__(self, buffer, offsets):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._decoded = {}
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, code):
+        text = self._decoded.get(code)
+        if text is None:
+            start, end = int(self._offsets[code]), int(self._offsets[code + 1])
+            text = self._decoded[code] = bytes(self._buffer[start:end]).decode('utf-8')
+        return text
+
+
+class Template:
+    """
+    An HS4 or HS6 template with its columns as arrays.
+
+    `fields` lists the column names in the order of the JSON records, `columns` maps each of them to an
+    array (codes into `strings` for the name columns). `ids`, `section_ids` and `values` are the
+    `<HSx> ID`, `Section ID` and `Trade Value` columns; `lookup` maps HS IDs to row positions.
+    A template opened from a compiled file is pickled as its path, so worker processes map the same file.
+    """
+
+    def __init__(self, hsx, fields, columns, strings, order=None, path=None):
+        self.hsx = hsx
+        self.fields = fields
+        self.columns = columns
+        self.strings = strings
+        self.path = path
+        self.ids = columns[f'{hsx} ID']
+        self.section_ids = columns['Section ID']
+        self.values = columns[VALUE_FIELD]
+        # Sorted copy of the IDs for vectorized lookups; a stable sort keeps the first of duplicate IDs first
+        self._order = np.argsort(self.ids, kind='stable') if order is None else order
+        self._sorted_ids = self.ids[self._order]
+
+    # Function to build a template from its JSON records
+    @classmethod
+    def from_records(cls, hsx, records):
+        """Builds the columns and the string table of a list of template records."""
+        fields = list(records[0]) if records else [f'{hsx} ID', 'Section ID', VALUE_FIELD]
+        codes, columns = {}, {}
+        for field in fields:
+            cells = [record[field] for record in records]
+            if field != VALUE_FIELD and cells and all(isinstance(cell, str) for cell in cells):
+                columns[field] = np.array([codes.setdefault(cell, len(codes)) for cell in cells], dtype=np.uint32)
+            elif field == VALUE_FIELD:
+                columns[field] = np.array(cells, dtype=np.float64)
+            else:
+                columns[field] = np.array(cells, dtype=np.int64)
+        return cls(hsx, fields, columns, list(codes))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __reduce__(self):
+        if self.path is not None:
+            return open_template, (self.path,)
+        return self.__class__, (self.hsx, self.fields, self.columns, list(self.strings))
+
+    # Function to map HS IDs to template row positions
+    def lookup(self, hs_ids):
+        """Returns the template position of every ID of `hs_ids`, -1 for IDs not in the template."""
+        hs_ids = np.asarray(hs_ids, dtype=np.int64)
+        if not len(self._sorted_ids):
+            return np.full(len(hs_ids), -1)
+        pos = np.searchsorted(self._sorted_ids, hs_ids)
+        pos = np.minimum(pos, len(self._sorted_ids) - 1)
+        found = self._sorted_ids[pos] == hs_ids
+        return np.where(found, self._order[pos], -1)
+
+    # Function to rebuild one JSON record of the template
+    def record(self, i):
+        """Returns row `i` as the dict of template_<hsx>.json."""
+        record = {}
+        for field in self.fields:
+            column = self.columns[field]
+            if column.dtype == np.uint32:
+                record[field] = self.strings[int(column[i])]
+            else:
+                value = column[i].item()
+                record[field] = int(value) if field == VALUE_FIELD and value.is_integer() else value
+        return record
+
+    @property
+    def records(self):
+        return [self.record(i) for i in range(len(self))]
+
+
+# Function to write a template in the binary format
+def compile_template(hsx, json_path=None, out_path=None):
+    """
+    Compiles template_<hsx>.json (from the repository root unless `json_path` is given) into the
+    binary format, written atomically to `out_path` (default: the same name with a .bin suffix).
+    Returns the path of the compiled file.
+    """
+    json_path = json_path or os.path.join(REPO_DIR, f'template_{hsx}.json')
+    out_path = out_path or os.path.splitext(json_path)[0] + '.bin'
+    with open(json_path, encoding='utf-8') as f:
+        template = Template.from_records(hsx, json.load(f))
+
+    blob = b''.join(text.encode('utf-8') for text in template.strings)
+    string_offsets = np.zeros(len(template.strings) + 1, dtype=np.uint64)
+    string_offsets[1:] = np.cumsum([len(text.encode('utf-8')) for text in template.strings])
+    arrays = [(field, template.columns[field]) for field in template.fields]
+    arrays += [('_order', template._order.astype(np.int64)), ('_strings', string_offsets)]
+
+    # Array offsets are relative to the first 8-byte boundary after the header
+    layout, offset = {}, 0
+    for name, array in arrays:
+        layout[name] = {'dtype': array.dtype.str, 'offset': offset, 'count': len(array)}
+        offset = _align(offset + array.nbytes)
+    header = {'hsx': hsx, 'rows': len(template), 'fields': template.fields, 'arrays': layout,
+              'blob': {'offset': offset, 'size': len(blob)}}
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header_bytes))
+
+    # A temporary file of its own, so that processes compiling at the same time don't write into each other's
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out_path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+            for name, array in arrays:
+                f.write(b'\0' * (data_start + layout[name]['offset'] - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.write(b'\0' * (data_start + offset - f.tell()))
+            f.write(blob)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates the file readable by its owner only
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return out_path
+
+
+# Function to round an offset up to the array alignment
+def _align(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+# Function to map a compiled template without copying it
+def open_template(path):
+    """Opens a file written by compile_template. The arrays are read-only views of the mapped file."""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a compiled HS template")
+    header_size, = struct.unpack_from('<I', buffer, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(bytes(buffer[start:start + header_size]))
+    data_start = _align(start + header_size)
+
+    arrays = {name: np.frombuffer(buffer, dtype=spec['dtype'], count=spec['count'], offset=data_start + spec['offset'])
+              for name, spec in header['arrays'].items()}
+    blob_start = data_start + header['blob']['offset']
+    strings = _StringTable(memoryview(buffer)[blob_start:blob_start + header['blob']['size']],
+                           arrays.pop('_strings'))
+    order = arrays.pop('_order')
+    return Template(header['hsx'], header['fields'], arrays, strings, order=order, path=path)
+
+
+# Function to load an HS template
+def load_template(hsx, path=None):
+    """
+    Loads template_<hsx>.json (from the repository root unless `path` is given) as a Template.
+    The compiled .bin next to the JSON file is used when it is up to date, and (re)built otherwise.
+    """
+    path = path or os.path.join(REPO_DIR, f'template_{hsx}.json')
+    if path.endswith('.bin'):
+        return open_template(path)
+    compiled = os.path.splitext(path)[0] + '.bin'
+    try:
+        if not os.path.exists(compiled) or os.path.getmtime(compiled) < os.path.getmtime(path):
+            compile_template(hsx, path, compiled)
+    except OSError:  # Read-only checkout: parse the JSON file every time
+        with open(path, encoding='utf-8') as f:
+            return Template.from_records(hsx, json.load(f))
+    return open_template(compiled)
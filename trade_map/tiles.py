@@ -0,0 +1,223 @@
+"""
+Tile pyramid of a world trade map, instead of one 30000x10000 PNG: 256 px PNG tiles at every zoom
+level, in the z/x/y layout of web map viewers (Leaflet, OpenLayers), so that a client only loads the
+tiles of its viewport.
+
+Every tile is rasterized on its own from the rectangles of the map (read from an SVG written by
+'layout' or 'build', or from a rectangle table written by 'layout --output .csv'), with box filter
+coverage, so lower zoom levels are exact downsamplings of the full-size map. Blocks of tiles are
+rasterized by a pool of worker processes sharing the rectangles through a memory-mapped file; a
+worker only holds the rectangles of its block and one tile. Tiles without any rectangle are not written.
+
+    python -m trade_map tiles worldtrademap_2020.svg --output tiles/2020
+    python -m trade_map tiles rects_2020.csv --hs HS6 --output tiles/2020 --scale 1
+
+Labels and titles are not drawn.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import struct
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .frames import BACKGROUND, rasterize
+from .render import SECTION_COLORS, WORLD_MAP_SIZE
+from .templates import load_template
+
+TILE_SIZE = 256
+BLOCK = 8  # Tiles per side of the blocks given to the workers
+SCALE = 0.5  # Scale of the most detailed level; 0.5 is the 30000x10000 canvas of canvas-render/canvas.mjs
+
+
+# Function to read a color of an SVG fill attribute
+def parse_color(value):
+    """Returns the (r, g, b) of 'rgb(r, g, b)' or '#RRGGBB', or None for other fills ('none')."""
+    match = re.fullmatch(r'rgb\((\d+),\s*(\d+),\s*(\d+)\)', value.strip())
+    if match:
+        return tuple(int(c) for c in match.groups())
+    if re.fullmatch(r'#[0-9a-fA-F]{6}', value.strip()):
+        return tuple(int(value.strip()[i:i + 2], 16) for i in (1, 3, 5))
+    return None
+
+
+# Function to read the filled rectangles of an SVG
+def read_svg_rects(path):
+    """
+    Returns (rects, colors, (width, height)): the (x0, y0, x1, y1) world coordinates and RGB color of
+    every filled <rect> of the SVG, in drawing order, with the translate() transforms of the groups
+    applied. The background rectangle covering the whole SVG is left out.
+    """
+    rects, colors, offsets = [], [], [(0.0, 0.0)]
+    size = WORLD_MAP_SIZE
+    for event, element in ET.iterparse(path, events=('start', 'end')):
+        tag = element.tag.rsplit('}', 1)[-1]  # Without the namespace
+        if event == 'end':
+            if tag == 'g':
+                offsets.pop()
+            element.clear()
+            continue
+        if tag == 'svg':
+            size = (float(element.get('width', size[0])), float(element.get('height', size[1])))
+        elif tag == 'g':
+            match = re.search(r'translate\(\s*([-\d.e]+)[\s,]+([-\d.e]+)\s*\)', element.get('transform', ''))
+            dx, dy = (float(match.group(1)), float(match.group(2))) if match else (0.0, 0.0)
+            offsets.append((offsets[-1][0] + dx, offsets[-1][1] + dy))
+        elif tag == 'rect':
+            color = parse_color(element.get('fill', 'none'))
+            width, height = float(element.get('width', 0)), float(element.get('height', 0))
+            if color is None or width <= 0 or height <= 0 or (width, height) == size:
+                continue
+            x, y = offsets[-1][0] + float(element.get('x', 0)), offsets[-1][1] + float(element.get('y', 0))
+            rects.append((x, y, x + width, y + height))
+            colors.append(color)
+    return np.array(rects, dtype=np.float64).reshape(-1, 4), np.array(colors, dtype=np.uint8).reshape(-1, 3), size
+
+
+# Function to read a table of leaf rectangles
+def read_csv_rects(path, hsx):
+    """
+    Returns (rects, colors, size) like read_svg_rects for a table written by treemap.write_rects;
+    the colors come from the sections of the `hsx` template. Leaves of 2 px or less are left out,
+    as render_leaves does.
+    """
+    sections = {}
+    for record in load_template(hsx).records:
+        sections.setdefault(str(record['Section ID']), record['Section'])
+    rects, colors = [], []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            x, y, width, height = (float(row[key]) for key in ('x', 'y', 'width', 'height'))
+            if width <= 2 or height <= 2:
+                continue
+            rects.append((x, y, x + width, y + height))
+            colors.append(parse_color(SECTION_COLORS.get(sections.get(row['Section ID']), 'rgb(204, 204, 204)')))
+    return np.array(rects, dtype=np.float64).reshape(-1, 4), np.array(colors, dtype=np.uint8).reshape(-1, 3), \
+        WORLD_MAP_SIZE
+
+
+# Function to encode an RGB image as PNG
+def encode_png(pixels):
+    """Returns the PNG file of the (height, width, 3) uint8 array `pixels`."""
+    height, width, _ = pixels.shape
+    rows = np.c_[np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, width * 3)]  # Filter type 0
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) + chunk(b'IEND', b''))
+
+
+# Function to get the zoom levels of a map
+def pyramid_levels(size, scale=SCALE, tile_size=TILE_SIZE):
+    """
+    Returns a list of (scale, columns, rows) per zoom level, from the level whose one tile holds the
+    whole map to the level at `scale`, each level half the size of the next.
+    """
+    top = max(0, math.ceil(math.log2(max(size) * scale / tile_size)))
+    levels = []
+    for z in range(top + 1):
+        level_scale = scale / 2 ** (top - z)
+        levels.append((level_scale, math.ceil(size[0] * level_scale / tile_size),
+                       math.ceil(size[1] * level_scale / tile_size)))
+    return levels
+
+
+# Function to rasterize a block of tiles of one zoom level
+def render_block(rects_path, colors_path, output_dir, z, level_scale, columns, rows, tile_size=TILE_SIZE):
+    """
+    Writes <output_dir>/<z>/<x>/<y>.png for the tiles (x, y) of `columns` x `rows` that any rectangle
+    overlaps. Returns the number of tiles written.
+    """
+    rects, colors = np.load(rects_path, mmap_mode='r'), np.load(colors_path, mmap_mode='r')
+    size = tile_size / level_scale  # Tile size in world coordinates
+    block = (columns.start * size, rows.start * size, columns.stop * size, rows.stop * size)
+    inside = (rects[:, 0] < block[2]) & (rects[:, 2] > block[0]) & (rects[:, 1] < block[3]) & (rects[:, 3] > block[1])
+    block_rects, block_colors = rects[inside] * level_scale, colors[inside]
+    background = np.array(BACKGROUND, dtype=np.float32)
+
+    written = 0
+    for x in columns:
+        for y in rows:
+            box = (x * tile_size, y * tile_size, (x + 1) * tile_size, (y + 1) * tile_size)
+            clipped = np.c_[np.maximum(block_rects[:, :2], box[:2]), np.minimum(block_rects[:, 2:], box[2:])]
+            keep = (clipped[:, 0] < clipped[:, 2]) & (clipped[:, 1] < clipped[:, 3])
+            if not keep.any():
+                continue
+            tile = rasterize(clipped[keep], block_colors[keep], box)
+            rgb = tile[..., :3] + background * np.maximum(0, 1 - tile[..., 3:]) + np.float32(0.5)
+            png = encode_png(np.clip(rgb, 0, 255.5, out=rgb).astype(np.uint8))  # Rounded, as the conversion truncates
+
+            path = os.path.join(output_dir, str(z), str(x), f'{y}.png')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(png)
+            os.replace(path + '.tmp', path)
+            written += 1
+    return written
+
+
+# Function to write the tile pyramid of a map
+def write_pyramid(rects, colors, size, output_dir, scale=SCALE, workers=None, tile_size=TILE_SIZE):
+    """
+    Writes the tiles of every zoom level of the rectangles `rects` (world coordinates, not
+    overlapping each other) and `colors` (RGB rows), and a tiles.json describing the pyramid.
+    Returns the number of tiles written and the number of empty tiles skipped.
+    """
+    levels = pyramid_levels(size, scale, tile_size)
+    os.makedirs(output_dir, exist_ok=True)
+    written = total = 0
+    with tempfile.TemporaryDirectory(prefix='trade_map_tiles_') as directory:
+        rects_path, colors_path = os.path.join(directory, 'rects.npy'), os.path.join(directory, 'colors.npy')
+        np.save(rects_path, rects)
+        np.save(colors_path, colors)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for z, (level_scale, columns, rows) in enumerate(levels):
+                total += columns * rows
+                for x in range(0, columns, BLOCK):
+                    for y in range(0, rows, BLOCK):
+                        futures.append(pool.submit(render_block, rects_path, colors_path, output_dir, z, level_scale,
+                                                   range(x, min(columns, x + BLOCK)), range(y, min(rows, y + BLOCK)),
+                                                   tile_size))
+            for future in futures:
+                written += future.result()
+
+    metadata = {
+        'tile_size': tile_size,
+        'width': math.ceil(size[0] * scale),
+        'height': math.ceil(size[1] * scale),
+        'background': '#%02X%02X%02X' % BACKGROUND,
+        'levels': [{'scale': level_scale, 'columns': columns, 'rows': rows} for level_scale, columns, rows in levels],
+    }
+    with open(os.path.join(output_dir, 'tiles.json.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=1)
+    os.replace(os.path.join(output_dir, 'tiles.json.tmp'), os.path.join(output_dir, 'tiles.json'))
+    return written, total - written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m trade_map tiles', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help=".svg map or .csv rectangle table written by 'layout'")
+    parser.add_argument('--output', required=True, help='Directory of the z/x/y.png tiles')
+    parser.add_argument('--hs', default='HS4', choices=['HS4', 'HS6'], help='HS granularity of a .csv table')
+    parser.add_argument('--scale', type=float, default=SCALE, help='Scale of the most detailed level')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: number of cores)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    rects, colors, size = read_csv_rects(args.input, args.hs) if args.input.endswith('.csv') else \
+        read_svg_rects(args.input)
+    written, empty = write_pyramid(rects, colors, size, args.output, args.scale, args.workers)
+    print(f"{len(rects)} rectangles, {written} tiles written to '{args.output}' ({empty} empty tiles skipped) "
+          f"in {time.perf_counter() - start:.1f} s.")
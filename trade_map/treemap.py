@@ -0,0 +1,427 @@
+"""
+Squarified treemap layout of the trade maps, the Python counterpart of the rawgraphs treemap drawn by
+drawTreemap in chart.js (d3.treemap with treemapSquarify, padding 1, rounded coordinates).
+
+The leaves (HS4 or HS6 codes) are nested by Section ID and HS2 ID in order of first appearance, like
+d3.rollup. The children of all the nodes of a level, across all the maps of a batch, are tiled
+together: every step places the next row of every node, and a row grows by testing a window of
+candidate children at once with cumulative sums, the window doubling until the aspect ratio gets
+worse. The number of array operations depends on the longest rows, not on the number of nodes or maps.
+That only pays off for batches of several maps (layout_maps, layout_countries, the build): a single
+map, or a map's pair of import and export treemaps, is tiled one node after the other on Python
+floats, which is quicker than the array operations for so few nodes. Both give d3's rectangles;
+python -m trade_map.bench_layout measures both against a line-by-line port of d3.
+
+    python -m trade_map layout netports/HS6/2020 --year 2020 --hs HS6 --output worldtrademap_2020.svg
+    python -m trade_map layout netports/HS6/2020 --year 2020 --hs HS6 --output rects_2020.csv
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+from .countries import COUNTRIES_FILE, read_countries
+from .layout import map_geometry
+
+PHI = (1 + math.sqrt(5)) / 2  # Target aspect ratio of d3.treemapSquarify
+PADDING = 1
+MARGIN = 10  # Margin of the rawgraphs chart around the treemap
+WINDOW = 16  # First number of candidate children tested at once when growing a row
+SCALAR_BATCH = 5  # Batches of fewer treemaps are tiled one node after the other (squarify_scalar)
+
+
+# Function to tile the children of many nodes at once into rows of squarish rectangles
+def squarify(values, first, last, x0, y0, x1, y1, totals, ratio=PHI):
+    """
+    Port of d3's squarifyRatio for a batch of parent nodes: parent p has the children
+    values[first[p]:last[p]], the rectangle (x0[p], y0[p], x1[p], y1[p]) and the value totals[p].
+    Returns the (x0, y0, x1, y1) arrays of the children, aligned with `values`.
+
+    All parents place their next row in the same step, so the number of steps is the largest number
+    of rows of a parent, however many parents (and maps) there are. Floating point operations happen
+    in the same order as in d3, so the rectangles are identical.
+    """
+    n = len(values)
+    rx0, ry0, rx1, ry1 = (np.full(n, np.nan) for _ in range(4))
+    x0, y0, x1, y1, remaining = (np.array(a, dtype=np.float64) for a in (x0, y0, x1, y1, totals))
+    positions = np.arange(n)
+    # First non-empty node at or after every position (n when there is none)
+    next_nonzero = np.minimum.accumulate(np.where(values != 0, positions, n)[::-1])[::-1]
+    i0 = np.array(first, dtype=np.int64)
+    last = np.asarray(last, dtype=np.int64)
+
+    live = np.flatnonzero(i0 < last)
+    while len(live):
+        start, end = i0[live], last[live]
+        dx, dy = x1[live] - x0[live], y1[live] - y0[live]
+
+        # Find the next non-empty node
+        found = next_nonzero[start]
+        i1 = np.where(found < end, found + 1, end)
+        sums = values[i1 - 1]
+        mins, maxs = sums.copy(), sums.copy()
+        alpha = np.maximum(dy / dx, dx / dy) / (remaining[live] * ratio)
+        beta = sums * sums * alpha
+        ratios = np.maximum(maxs / beta, beta / mins)
+
+        # Keep adding nodes while the aspect ratio maintains or improves, a window of nodes at a time
+        growing = np.flatnonzero(i1 < end)
+        window = WINDOW
+        while len(growing):
+            columns = i1[growing, None] + np.arange(window)
+            valid = columns < end[growing, None]
+            candidates = np.where(valid, values[np.minimum(columns, n - 1)], 0)
+            candidate_sums = np.cumsum(np.c_[sums[growing], candidates], axis=1)[:, 1:]
+            candidate_mins = np.minimum(mins[growing, None], np.minimum.accumulate(candidates, axis=1))
+            candidate_maxs = np.maximum(maxs[growing, None], np.maximum.accumulate(candidates, axis=1))
+            betas = candidate_sums * candidate_sums * alpha[growing, None]
+            candidate_ratios = np.maximum(candidate_maxs / betas, betas / candidate_mins)
+            worse = valid & (candidate_ratios > np.c_[ratios[growing], candidate_ratios[:, :-1]])
+
+            stops = worse.any(axis=1)
+            col = np.where(stops, worse.argmax(axis=1), valid.sum(axis=1) - 1)
+            row = np.arange(len(growing))
+            # The row ends before the first node that makes it worse, or goes on with the whole window
+            sums[growing] = np.where(stops, candidate_sums[row, col] - candidates[row, col], candidate_sums[row, col])
+            mins[growing], maxs[growing] = candidate_mins[row, col], candidate_maxs[row, col]
+            ratios[growing] = candidate_ratios[row, col]
+            i1[growing] += np.where(stops, col, col + 1)
+            growing = growing[~stops & (i1[growing] < end[growing])]
+            window *= 2
+
+        # Position the rows: dice (left to right) in tall rectangles, slice (top to bottom) otherwise
+        dice = dx < dy
+        extent = np.where(dice, dy, dx)
+        origin = np.where(dice, y0[live], x0[live])
+        row_end = np.where((extent != 0) & (extent == extent), origin + extent * sums / remaining[live],
+                           np.where(dice, y1[live], x1[live]))
+        span = np.where(dice, x1[live] - x0[live], y1[live] - y0[live])
+        k = np.where(sums != 0, span / sums, 0)
+
+        lengths = i1 - start
+        columns = start[:, None] + np.arange(lengths.max())
+        valid = columns < i1[:, None]
+        steps = np.where(valid, values[np.minimum(columns, n - 1)], 0) * k[:, None]
+        edges = np.cumsum(np.c_[np.where(dice, x0[live], y0[live]), steps], axis=1)
+        rows, cols = np.nonzero(valid)
+        children = columns[rows, cols]
+        low, high = edges[rows, cols], edges[rows, cols + 1]
+        rows_dice = dice[rows]
+        rx0[children] = np.where(rows_dice, low, x0[live][rows])
+        rx1[children] = np.where(rows_dice, high, row_end[rows])
+        ry0[children] = np.where(rows_dice, y0[live][rows], low)
+        ry1[children] = np.where(rows_dice, row_end[rows], high)
+
+        y0[live] = np.where(dice, row_end, y0[live])
+        x0[live] = np.where(dice, x0[live], row_end)
+        remaining[live] -= sums
+        i0[live] = i1
+        live = live[i1 < end]
+    return rx0, ry0, rx1, ry1
+
+
+# Function to divide like JavaScript (no ZeroDivisionError)
+def _div(a, b):
+    if b:
+        return a / b
+    if a != a or a == 0:
+        return math.nan
+    return math.copysign(math.inf, a) * math.copysign(1, b)
+
+
+# Function to take the maximum like np.maximum (NaN wins)
+def _max(a, b):
+    return a if a != a or a > b else b
+
+
+# Function to tile the children of a few nodes into rows, one node after the other
+def squarify_scalar(values, first, last, x0, y0, x1, y1, totals, ratio=PHI):
+    """
+    Same arguments, operations and result as squarify, on Python floats. For the few nodes of a
+    single map, the per-step overhead of the array operations of squarify costs more than the loop.
+    """
+    values = values.tolist()
+    n = len(values)
+    rx0, ry0, rx1, ry1 = ([math.nan] * n for _ in range(4))
+    for p, (i0, end, px0, py0, px1, py1, remaining) in enumerate(zip(
+            np.asarray(first).tolist(), np.asarray(last).tolist(), np.asarray(x0, dtype=np.float64).tolist(),
+            np.asarray(y0, dtype=np.float64).tolist(), np.asarray(x1, dtype=np.float64).tolist(),
+            np.asarray(y1, dtype=np.float64).tolist(), np.asarray(totals, dtype=np.float64).tolist())):
+        while i0 < end:
+            dx, dy = px1 - px0, py1 - py0
+
+            # Find the next non-empty node
+            i1 = i0
+            while True:
+                sum_value = values[i1]
+                i1 += 1
+                if sum_value or i1 >= end:
+                    break
+            min_value = max_value = sum_value
+            alpha = _div(_max(_div(dy, dx), _div(dx, dy)), remaining * ratio)
+            beta = sum_value * sum_value * alpha
+            min_ratio = _max(_div(max_value, beta), _div(beta, min_value))
+
+            # Keep adding nodes while the aspect ratio maintains or improves
+            while i1 < end:
+                node_value = values[i1]
+                sum_value += node_value
+                min_value = min(min_value, node_value)
+                max_value = max(max_value, node_value)
+                beta = sum_value * sum_value * alpha
+                new_ratio = _max(_div(max_value, beta), _div(beta, min_value))
+                if new_ratio > min_ratio:
+                    sum_value -= node_value
+                    break
+                min_ratio = new_ratio
+                i1 += 1
+
+            # Position the row: dice (left to right) in tall rectangles, slice (top to bottom) otherwise
+            dice = dx < dy
+            extent, origin = (dy, py0) if dice else (dx, px0)
+            if extent != 0 and extent == extent:
+                row_end = origin + _div(extent * sum_value, remaining)
+            else:
+                row_end = py1 if dice else px1
+            k = _div(dx if dice else dy, sum_value) if sum_value != 0 else 0
+            edge = px0 if dice else py0
+            for i in range(i0, i1):
+                low, edge = edge, edge + values[i] * k
+                if dice:
+                    rx0[i], rx1[i], ry0[i], ry1[i] = low, edge, py0, row_end
+                else:
+                    rx0[i], rx1[i], ry0[i], ry1[i] = px0, row_end, low, edge
+            if dice:
+                py0 = row_end
+            else:
+                px0 = row_end
+            remaining -= sum_value
+            i0 = i1
+    return np.array(rx0), np.array(ry0), np.array(rx1), np.array(ry1)
+
+
+# Function to add up the values of consecutive segments one element at a time, like d3's node.sum
+def _segment_sums(values, first, last):
+    sums = np.zeros(len(first))
+    lengths = last - first
+    for k in range(lengths.max() if len(lengths) else 0):
+        live = np.flatnonzero(lengths > k)
+        sums[live] += values[first[live] + k]
+    return sums
+
+
+# Function to nest the leaves by their group keys
+def nest(groups):
+    """
+    `groups` is a list of key arrays, outermost level first (e.g. Section ID, HS2 ID). Returns the leaf
+    order of d3.rollup (groups in order of first appearance, leaves in data order within a group) and,
+    for each level, the start of every node in that order.
+    """
+    n = len(groups[0]) if groups else 0
+    keys = []
+    prefix = np.zeros(n, dtype=np.int64)
+    for level in groups:
+        # Position of the first leaf of every (outer groups, this group) prefix
+        _, first, inverse = np.unique(np.stack([prefix, np.asarray(level)]), axis=1,
+                                      return_index=True, return_inverse=True)
+        prefix = first[inverse.ravel()]
+        keys.append(prefix)
+    order = np.lexsort([np.arange(n)] + keys[::-1]) if keys else np.arange(n)
+    starts = [np.flatnonzero(np.r_[True, key[order][1:] != key[order][:-1]]) if n else np.zeros(0, dtype=np.int64)
+              for key in keys]
+    return order, starts
+
+
+# Function to lay out many treemaps of nested leaves at once
+def treemaps(batch, padding=PADDING, ratio=PHI):
+    """
+    `batch` is a list of (values, groups, width, height) treemaps with the same number of group levels.
+    Returns for each one what treemap() returns. The nodes of a level are tiled for all the treemaps
+    together, which is much faster than one treemap at a time for small maps; batches of fewer than
+    SCALAR_BATCH treemaps are tiled by squarify_scalar instead.
+    """
+    # Nodes of every level, with the leaves of all the treemaps one after the other
+    depth = len(batch[0][1]) if batch else 0
+    orders, leaf_values, levels, roots = [], [], [[] for _ in range(depth + 1)], []
+    offset = 0
+    for values, groups, width, height in batch:
+        values = np.asarray(values, dtype=np.float64)
+        order, starts = nest(groups)
+        orders.append(order)
+        leaf_values.append(values[order])
+        if len(values):
+            roots.append((offset, width, height))
+        for level, level_starts in zip(levels, [np.zeros(min(len(values), 1), dtype=np.int64)] + starts):
+            level.append(level_starts + offset)
+        offset += len(values)
+    leaf_values = np.concatenate(leaf_values) if leaf_values else np.zeros(0)
+    levels = [np.concatenate(level) for level in levels] + [np.arange(offset)]
+
+    # Node values bottom up, children summed in order like d3's node.sum
+    node_values = [leaf_values]
+    children = []
+    for parent_starts, child_starts in zip(levels[-2::-1], levels[:0:-1]):
+        first_child = np.searchsorted(child_starts, parent_starts)
+        last_child = np.r_[first_child[1:], len(child_starts)].astype(np.int64)
+        node_values.insert(0, _segment_sums(node_values[0], first_child, last_child))
+        children.insert(0, (first_child, last_child))
+
+    # Node rectangles top down; d3 pads every node by half the inner padding of its parent
+    rect = [np.zeros(len(roots)), np.zeros(len(roots)),
+            np.array([float(width) for _, width, _ in roots]), np.array([float(height) for _, _, height in roots])]
+    with np.errstate(divide='ignore', invalid='ignore'):  # Zero-sized nodes divide by zero, as in d3
+        tile = squarify_scalar if len(batch) < SCALAR_BATCH else squarify
+        rect = _tile_levels(rect, children, node_values, padding, ratio, tile)
+    edges = [np.floor(edge + 0.5) for edge in _pad(*rect, padding / 2)]  # Math.round
+
+    results = []
+    offset = 0
+    for order in orders:
+        results.append((order,) + tuple(edge[offset:offset + len(order)] for edge in edges))
+        offset += len(order)
+    return results
+
+
+# Function to lay out a treemap of nested leaves
+def treemap(values, groups, width, height, padding=PADDING, ratio=PHI):
+    """
+    Returns (order, x0, y0, x1, y1): the leaves in d3 order (positions into `values`) and their
+    rounded rectangles inside a treemap of `width` x `height`, with `padding` between nodes.
+    Like in d3, the leaves of a node whose value is 0 can get NaN coordinates.
+    """
+    return treemaps([(values, groups, width, height)], padding, ratio)[0]
+
+
+# Function to position the nodes of every level and tile their children
+def _tile_levels(rect, children, node_values, padding, ratio, tile=squarify):
+    half = padding / 2
+    for depth, (first_child, last_child) in enumerate(children):
+        x0, y0, x1, y1 = _pad(*rect, 0 if depth == 0 else half)
+        x0, y0, x1, y1 = _pad(x0, y0, x1, y1, padding - half)
+        rect = tile(node_values[depth + 1], first_child, last_child, x0, y0, x1, y1, node_values[depth], ratio)
+    return rect
+
+
+# Function to shrink rectangles by a padding, collapsing those too small to the middle
+def _pad(x0, y0, x1, y1, pad):
+    x0, y0, x1, y1 = x0 + pad, y0 + pad, x1 - pad, y1 - pad
+    x_mid, y_mid = (x0 + x1) / 2, (y0 + y1) / 2
+    x_flat, y_flat = x1 < x0, y1 < y0
+    return (np.where(x_flat, x_mid, x0), np.where(y_flat, y_mid, y0),
+            np.where(x_flat, x_mid, x1), np.where(y_flat, y_mid, y1))
+
+
+# Function to lay out the leaves of one treemap of a map
+def treemap_leaves(records, geometry, padding=PADDING):
+    """
+    Lays out the netImportData or netExportData `records` in the treemap `geometry` (from map_geometry).
+    Returns a list of [record index, x, y, width, height] in drawing order; leaves d3 cannot place
+    (NaN coordinates, in nodes of value 0) are left out.
+    """
+    return _leaves(treemap(*_treemap_args(records, geometry), padding)) if records else []
+
+
+# Function to get the treemap() arguments of the records of a treemap
+def _treemap_args(records, geometry):
+    values = [record['Trade Value'] for record in records]
+    groups = [[record['Section ID'] for record in records], [record['HS2 ID'] for record in records]]
+    return values, groups, geometry['width'] - 2 * MARGIN, geometry['height'] - 2 * MARGIN
+
+
+# Function to turn a treemap() result into leaf lists
+def _leaves(result):
+    order, x0, y0, x1, y1 = result
+    leaves = np.c_[order, x0, y0, x1 - x0, y1 - y0]
+    return leaves[np.isfinite(leaves).all(axis=1)].astype(np.int64).tolist()
+
+
+# Function to lay out maps with their treemap leaves
+def layout_maps(netports, year):
+    """
+    Returns map_geometry(netport, year) of every netport with the 'leaves' of its import and export
+    treemaps. The treemaps of all the maps are laid out in one batch.
+    """
+    layouts = [map_geometry(netport, year) for netport in netports]
+    ports = [(layout['treemaps'][port], netport[key]) for netport, layout in zip(netports, layouts)
+             for port, key in (('import', 'netImportData'), ('export', 'netExportData'))]
+    batch = [_treemap_args(records, geometry) for geometry, records in ports if records]
+    results = iter(treemaps(batch))
+    for geometry, records in ports:
+        geometry['leaves'] = _leaves(next(results)) if records else []
+    return layouts
+
+
+# Function to lay out a map with its treemap leaves
+def layout_map(netport, year):
+    """Returns map_geometry(netport, year) with the 'leaves' of its import and export treemaps."""
+    return layout_maps([netport], year)[0]
+
+
+# Function to lay out the maps of every country of a directory of net import/export JSON files
+def layout_countries(netport_dir, year, countries):
+    """
+    Reads <netport_dir>/<oec code>.json for every country and returns a list of
+    (country, netport, layout, x, y) with the position of the map on the world map.
+    """
+    placed, netports = [], []
+    for country in countries:
+        path = os.path.join(netport_dir, f"{country['oec_code']}.json")
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            netport = json.load(f)
+        if netport is None:
+            continue
+        placed.append(country)
+        netports.append(netport)
+    layouts = layout_maps(netports, year)
+    return [(country, netport, layout, country['continent_x'] + country['x_offset'],
+             country['continent_y'] + country['y_offset'])
+            for country, netport, layout in zip(placed, netports, layouts)]
+
+
+# Function to write the leaf rectangles of laid out maps as a table
+def write_rects(maps, hsx, path):
+    """Writes one CSV row per leaf, with its rectangle in world map coordinates."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['OEC Code', 'Port', f'{hsx} ID', 'Section ID', 'Trade Value', 'x', 'y', 'width', 'height'])
+        for country, netport, layout, x, y in maps:
+            for port, key in (('import', 'netImportData'), ('export', 'netExportData')):
+                geometry = layout['treemaps'][port]
+                left, top = x + MARGIN, y + geometry['offset'] + geometry['leaves_offset']
+                for i, leaf_x, leaf_y, width, height in geometry['leaves']:
+                    record = netport[key][i]
+                    writer.writerow([country['oec_code'], port, record[f'{hsx} ID'], record['Section ID'],
+                                     record['Trade Value'], left + leaf_x, top + leaf_y, width, height])
+
+
+def main(argv=None):
+    from .render import WORLD_MAP_SIZE, render_leaves, render_map, render_svg
+
+    parser = argparse.ArgumentParser(prog='python -m trade_map layout', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('netport_dir', help="Directory of <oec code>.json files written by 'netport'")
+    parser.add_argument('--year', type=int, required=True, help='Year of the data')
+    parser.add_argument('--hs', default='HS4', choices=['HS4', 'HS6'], help='HS granularity')
+    parser.add_argument('--countries', default=COUNTRIES_FILE, help='Countries TSV file')
+    parser.add_argument('--output', required=True, help='.svg for the world map, .csv for the rectangle table')
+    args = parser.parse_args(argv)
+
+    maps = layout_countries(args.netport_dir, args.year, read_countries(args.countries))
+    if args.output.endswith('.csv'):
+        write_rects(maps, args.hs, args.output)
+    else:
+        body = ''
+        for country, netport, layout, x, y in maps:
+            map_id = re.sub(r'\W', '', country['iso2'])
+            leaves = {port: render_leaves(f'{map_id}_nt{port[:2]}', netport[key], args.hs, layout['treemaps'][port])
+                      for port, key in (('import', 'netImportData'), ('export', 'netExportData'))}
+            body += render_map(country['name'], map_id, layout, args.year, x, y, leaves)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(render_svg(*WORLD_MAP_SIZE, body))
+    print(f"{len(maps)} maps laid out to '{args.output}'.")